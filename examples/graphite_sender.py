@@ -7,6 +7,7 @@ import sys
 import logging
 import re
 from fastsnmp import snmp_poller
+from fastsnmp.labels import LabelCache
 from time import time, sleep
 from collections import defaultdict
 import urllib.parse
@@ -19,6 +20,9 @@ import textwrap
 GRAPHITE_SERVER = "localhost"
 GRAPHITE_PORT = 2003
 COMMUNITY = 'public'
+# labels of indexes are walked once per LABELS_TTL or when sysUpTime goes backwards
+LABELS_TTL = 3600
+LABELS_PATH = "/tmp/fastsnmp_labels_%s.json"
 logger = logging.getLogger(__name__)
 
 poller_logger = logging.getLogger('fastsnmp.snmp_poller')
@@ -90,6 +94,8 @@ def start_poller(proc_id, carbon_queue, job_queue):
     proc_title = setproctitle.getproctitle()
     setproctitle.setproctitle("%s - poller#%s" % (proc_title, proc_id))
     logger.debug("start start_poller()")
+    # job name => LabelCache
+    label_caches = {}
 
     while True:
         lauch_time, job = job_queue.get()
@@ -105,31 +111,26 @@ def start_poller(proc_id, carbon_queue, job_queue):
         config = job.config
         hosts = job.hosts
 
-        # get indexes in first poll
-        index_oids = config['indexes'].keys()
-        if index_oids:
-            index_oids_group = [(oid,) for oid in list(index_oids)]
-            snmp_data = snmp_poller.poller(hosts, index_oids_group, COMMUNITY)
-            index_table = defaultdict_rec()
-            for snmp_res in snmp_data:
-                host, base_oid, index_part, value = snmp_res
-                index_name = config['indexes'][base_oid]
-                index_table[host][index_name][index_part] = normalize_ifname(value)
+        # refresh labels of indexes if they are expired or changed
+        label_cache = label_caches.get(job.name)
+        if label_cache is None:
             target_oid_indexes = {}
-            target_oid_metric_pfx = {}
             for target_oid in config['target_oids']:
-                if 'index_name' in target_oid:
-                    target_oid_indexes[target_oid['oid']] = target_oid['index_name']
-                    target_oid_metric_pfx[target_oid['oid']] = target_oid['metric_prefix']
+                if target_oid['index_name']:
+                    target_oid_indexes[target_oid['oid']] = (target_oid['index_name'],)
+            keys = {index_name: oid for oid, index_name in config['indexes'].items()}
+            label_cache = LabelCache(keys, ttl=LABELS_TTL, path=LABELS_PATH % job.name, columns=target_oid_indexes)
+            label_caches[job.name] = label_cache
+        label_cache.refresh(hosts, COMMUNITY)
+        target_oid_metric_pfx = {target_oid['oid']: target_oid['metric_prefix'] for target_oid in config['target_oids']}
 
-        # get other in second poll
         oids_group = [(oid['oid'],) for oid in config['target_oids']]
-        snmp_data = snmp_poller.poller(hosts, oids_group, COMMUNITY)
+        snmp_data = label_cache.attach(snmp_poller.poller(hosts, oids_group, COMMUNITY))
         request_time = int(time())
         for snmp_res in snmp_data:
-            host, base_oid, index_part, value = snmp_res
-            if index_table[host][target_oid_indexes[base_oid]][index_part]:
-                oid_index_name = index_table[host][target_oid_indexes[base_oid]][index_part]
+            host, base_oid, index_part, value = snmp_res.name, snmp_res.main_oid, snmp_res.index_part, snmp_res.value
+            if snmp_res.labels:
+                oid_index_name = normalize_ifname(next(iter(snmp_res.labels.values())))
             else:
                 oid_index_name = '%s' % index_part
             metric_pfx = target_oid_metric_pfx[base_oid]
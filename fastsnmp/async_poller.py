@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  asyncio version of snmp_poller.poller
+import asyncio
+import collections
+import logging
+import random
+import socket
+from time import time, monotonic
+from typing import List, Optional
+
+from fastsnmp import snmp_parser
+from fastsnmp import snmp_poller
+from fastsnmp.snmp_poller import MAX_REQID, Job, Result, Timeout, create_socket, process_response, query_timeout_for
+
+logger = logging.getLogger(__name__)
+
+
+async def aresolve(hosts, to_v6=True):
+    """
+    Resolve hosts using event loop's resolver
+
+    :return: fqdn => ips
+    :rtype: dict
+    """
+    loop = asyncio.get_running_loop()
+
+    async def resolve_host(host):
+        try:
+            addrinfo = await loop.getaddrinfo(host, 0, proto=socket.IPPROTO_TCP)
+        except socket.gaierror:
+            logger.error("unable to resolve %s. skipping this host" % host)
+            return host, []
+        ips = [x[4][0] for x in addrinfo]
+        if to_v6:
+            ips = [ip if ":" in ip else "::ffff:" + ip for ip in ips]
+        return host, ips
+
+    return dict(await asyncio.gather(*(resolve_host(host) for host in hosts)))
+
+
+class PollerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine: 'AsyncPollerEngine'):
+        self.engine = engine
+
+    def connection_made(self, transport):
+        self.engine.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.engine.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        logger.error("socket error %r", exc)
+
+    def connection_lost(self, exc):
+        self.engine.connection_lost(exc)
+
+
+class AsyncPollerEngine:
+    """
+    Request bookkeeping of apoller(). Sends requests, matches responses by reqid and
+    keeps retry timers in the event loop
+    """
+
+    def __init__(self, community: str, timeout: float, backoff: float, retry: int, msg_type: str, start_reqid: int,
+                 reqid_step: int, max_repetitions: int, converters: Optional[dict] = None):
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.community = community
+        self.timeout = timeout
+        self.backoff = backoff
+        self.retry = retry
+        self.msg_type = msg_type
+        self.max_repetitions = max_repetitions
+        self.converters = converters
+        self.reqid = start_reqid
+        self.reqid_step = reqid_step
+
+        self.reqid_to_target = {}
+        # reqid => ResponseColumns with converters of request
+        self.reqid_columns = {}
+        # main oids => ResponseColumns
+        self.columns = {}
+        # reqid => timer of pending query
+        self.pending_query = {}
+        self.retried_req = collections.defaultdict(int)
+        self.results = collections.deque()
+        self.wakeup = asyncio.Event()
+        self.exc = None
+
+    def next_reqid(self) -> int:
+        reqid = self.reqid
+        self.reqid += self.reqid_step
+        if self.reqid > MAX_REQID:
+            self.reqid = 1
+        return reqid
+
+    def add_job(self, job: Job):
+        reqid = self.next_reqid()
+        self.reqid_to_target[reqid] = job
+        if self.converters:
+            columns = self.columns.get(job.main_oids)
+            if columns is None:
+                columns = snmp_parser.ResponseColumns(job.main_oids, self.converters)
+                self.columns[job.main_oids] = columns
+            self.reqid_columns[reqid] = columns
+        self.send(reqid)
+
+    def send(self, reqid: int):
+        job = self.reqid_to_target[reqid]
+        message = snmp_parser.msg_encode(reqid, self.community, job.oids_to_poll, max_repetitions=self.max_repetitions,
+                                         msg_type=self.msg_type)
+        self.transport.sendto(message, (job.ip, snmp_poller.SNMP_PORT))
+        job.sent = monotonic()
+        attempt = self.retried_req.get(reqid, 1)
+        query_timeout = query_timeout_for(attempt, self.timeout, self.backoff)
+        self.pending_query[reqid] = self.loop.call_later(query_timeout, self.query_timeout, reqid)
+        if snmp_poller.DEBUG:
+            logger.debug("sendto %s reqid=%s", job, reqid)
+
+    def datagram_received(self, data: bytes, remotehost):
+        ts = time()
+        try:
+            pdudata_reqid, error_status, error_index, var_bind_list, types = snmp_parser.msg_decode(
+                data, with_types=True, columns=self.reqid_columns)
+        except Exception as e:
+            logger.critical("%r. unable to decode PDU from %s. data=%r", e, remotehost, data)
+            return
+        recv_time = monotonic()
+        recv_job = self.reqid_to_target.get(pdudata_reqid)
+        if recv_job is None:  # received after timeout?
+            return
+        duration = recv_time - recv_job.sent
+        timer = self.pending_query.pop(pdudata_reqid, None)
+        if timer is None:
+            if snmp_poller.DEBUG:
+                logger.debug("received answer after timeout from %s reqid=%s", recv_job, pdudata_reqid)
+            return
+        timer.cancel()
+        self.reqid_columns.pop(pdudata_reqid, None)
+
+        if error_status:
+            logger.error("%s get error_status %s at %s", recv_job, error_status, error_index)
+            self.wake()
+            return
+        if snmp_poller.DEBUG:
+            logger.debug('%s recv reqid=%s' % (recv_job, pdudata_reqid))
+
+        self.reqid_to_target.pop(pdudata_reqid, None)
+        results, next_job = process_response(recv_job, var_bind_list, self.msg_type, ts, duration, types)
+        self.results.extend(results)
+        if next_job:
+            self.add_job(next_job)
+        self.wake()
+
+    def query_timeout(self, reqid: int):
+        del self.pending_query[reqid]
+        if self.retried_req[reqid] < self.retry:
+            if snmp_poller.DEBUG:
+                logger.debug("resend %s", reqid)
+            self.retried_req[reqid] += 1
+            self.send(reqid)
+            return
+        timeouted_job = self.reqid_to_target.pop(reqid)
+        self.reqid_columns.pop(reqid, None)
+        logger.debug("%s query timeout", timeouted_job)
+        duration = monotonic() - timeouted_job.sent
+        self.results.append(Result(name=timeouted_job.name, main_oid=timeouted_job.main_oids, index_part="",
+                                   value=Timeout(), ts=time(), duration=duration))
+        self.wake()
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            self.exc = exc
+        self.wake()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def close(self):
+        for timer in self.pending_query.values():
+            timer.cancel()
+        self.pending_query.clear()
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def apoller(hosts: List[str], oids_groups: List[List[str]], community: str, timeout: int = 3, backoff: int = 2,
+                  retry: int = 2, msg_type="GetBulk", start_reqid: Optional[int] = None, reqid_step: int = 1,
+                  max_repetitions: int = 60, converters: Optional[dict] = None):
+    """
+    An asynchronous generator that yields SNMP data. Same as snmp_poller.poller() but runs in the current event loop
+
+    :param hosts: hosts
+    :param oids_groups: oids_groups
+    :param community: community
+    :param converters: main oid => converter of its values. see snmp_poller.PollerSession
+    :type hosts: list | tuple
+    :type oids_groups: list | tuple
+    :type community: str
+    :return: host, main_oid, index_part, value
+    :rtype: Result
+    """
+    loop = asyncio.get_running_loop()
+    if start_reqid is None:
+        start_reqid = random.randint(1, 30000)
+
+    # fqdn => ips
+    target_info_r = await aresolve(hosts)
+    for fqdn, ips in list(target_info_r.items()):
+        if not ips:
+            logger.error("unable to resolve %s. skipping this host", fqdn)
+            del target_info_r[fqdn]
+
+    engine = AsyncPollerEngine(community=community, timeout=timeout, backoff=backoff, retry=retry, msg_type=msg_type,
+                               start_reqid=start_reqid, reqid_step=reqid_step, max_repetitions=max_repetitions,
+                               converters=converters)
+    await loop.create_datagram_endpoint(lambda: PollerProtocol(engine), sock=create_socket())
+    try:
+        for oids_group in oids_groups:
+            if not isinstance(oids_group, (tuple, list)):
+                raise Exception("unexpected type of %s. expected list or tuple" % oids_group)
+            oids_group = tuple(x.strip(".") for x in oids_group)
+            for fqdn, ips in target_info_r.items():
+                engine.add_job(Job(name=fqdn, ip=ips[0], oids_to_poll=oids_group, main_oids=oids_group))
+
+        while True:
+            while engine.results:
+                yield engine.results.popleft()
+            if engine.exc is not None:
+                raise engine.exc
+            if not engine.pending_query:
+                break
+            engine.wakeup.clear()
+            await engine.wakeup.wait()
+    finally:
+        engine.close()
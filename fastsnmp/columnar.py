@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  columnar output of poller: results are accumulated into Apache Arrow record batches
+import array
+from typing import Iterable, Iterator, Optional
+
+from fastsnmp.snmp_poller import Result
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+INT64_MAX = 0x7fffffffffffffff
+
+FORMAT_IPC = "ipc"
+FORMAT_PARQUET = "parquet"
+
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for columnar output")
+    return pyarrow
+
+
+def results_schema():
+    """
+    Schema of record batches.
+    Integers which do not fit into int64 (Counter64) are in uint_value, scaled values of converters are in float_value,
+    octet strings and ip addresses are in bytes_value, OIDs and other values are in str_value.
+    error is name of exception for timeouted requests, value_type is snmp_parser.TYPE_* code of value
+
+    :rtype: pyarrow.Schema
+    """
+    pa = require_pyarrow()
+    return pa.schema([
+        pa.field("host", pa.dictionary(pa.int32(), pa.string()), nullable=False),
+        pa.field("main_oid", pa.dictionary(pa.int32(), pa.string()), nullable=False),
+        pa.field("index_part", pa.string(), nullable=False),
+        pa.field("int_value", pa.int64()),
+        pa.field("uint_value", pa.uint64()),
+        pa.field("float_value", pa.float64()),
+        pa.field("bytes_value", pa.binary()),
+        pa.field("str_value", pa.string()),
+        pa.field("error", pa.string()),
+        pa.field("value_type", pa.uint8(), nullable=False),
+        pa.field("ts", pa.float64(), nullable=False),
+        pa.field("duration", pa.float64(), nullable=False),
+    ])
+
+
+class ResultsBuilder:
+    """
+    Accumulates poller results column by column. Hosts and main OIDs are dictionary-encoded,
+    dictionaries are kept between batches so codes of host and main OID are stable
+    """
+
+    def __init__(self):
+        # value => code
+        self.hosts = {}
+        self.main_oids = {}
+        self.clear()
+
+    def clear(self):
+        """
+        Drop accumulated rows. Dictionaries are kept
+        """
+        self.host_codes = array.array("i")
+        self.main_oid_codes = array.array("i")
+        self.index_parts = []
+        self.int_values = []
+        self.uint_values = []
+        self.float_values = []
+        self.bytes_values = []
+        self.str_values = []
+        self.errors = []
+        self.value_types = array.array("B")
+        self.ts = array.array("d")
+        self.durations = array.array("d")
+
+    def __len__(self):
+        return len(self.ts)
+
+    @staticmethod
+    def code_for(dictionary: dict, value: str) -> int:
+        code = dictionary.get(value)
+        if code is None:
+            code = len(dictionary)
+            dictionary[value] = code
+        return code
+
+    def add_row(self, name: str, main_oid: str, index_part: str, value, ts: float, duration: float,
+                value_type: int = 0):
+        int_value = uint_value = float_value = bytes_value = str_value = error = None
+        if isinstance(value, bytes):
+            bytes_value = value
+        elif isinstance(value, int):
+            if value > INT64_MAX:
+                uint_value = value
+            else:
+                int_value = value
+        elif isinstance(value, float):
+            float_value = value
+        elif isinstance(value, Exception):
+            error = type(value).__name__
+        elif value is not None:
+            str_value = str(value)
+        self.host_codes.append(self.code_for(self.hosts, name))
+        self.main_oid_codes.append(self.code_for(self.main_oids, main_oid))
+        self.index_parts.append(index_part)
+        self.int_values.append(int_value)
+        self.uint_values.append(uint_value)
+        self.float_values.append(float_value)
+        self.bytes_values.append(bytes_value)
+        self.str_values.append(str_value)
+        self.errors.append(error)
+        self.value_types.append(value_type)
+        self.ts.append(ts)
+        self.durations.append(duration)
+
+    def append(self, res: Result):
+        """
+        Add poller result. Timeout of request adds a row for every main OID of request
+        """
+        if isinstance(res.main_oid, tuple):
+            for main_oid in res.main_oid:
+                self.add_row(res.name, main_oid, res.index_part, res.value, res.ts, res.duration, res.value_type)
+        else:
+            self.add_row(res.name, res.main_oid, res.index_part, res.value, res.ts, res.duration, res.value_type)
+
+    def extend(self, results: Iterable[Result]):
+        for res in results:
+            self.append(res)
+
+    def to_record_batch(self):
+        """
+        Build record batch of accumulated rows
+
+        :rtype: pyarrow.RecordBatch
+        """
+        pa = require_pyarrow()
+        length = len(self)
+        return pa.RecordBatch.from_arrays([
+            pa.DictionaryArray.from_arrays(
+                pa.Array.from_buffers(pa.int32(), length, [None, pa.py_buffer(self.host_codes)]),
+                pa.array(list(self.hosts), pa.string())),
+            pa.DictionaryArray.from_arrays(
+                pa.Array.from_buffers(pa.int32(), length, [None, pa.py_buffer(self.main_oid_codes)]),
+                pa.array(list(self.main_oids), pa.string())),
+            pa.array(self.index_parts, pa.string()),
+            pa.array(self.int_values, pa.int64()),
+            pa.array(self.uint_values, pa.uint64()),
+            pa.array(self.float_values, pa.float64()),
+            pa.array(self.bytes_values, pa.binary()),
+            pa.array(self.str_values, pa.string()),
+            pa.array(self.errors, pa.string()),
+            pa.Array.from_buffers(pa.uint8(), length, [None, pa.py_buffer(self.value_types)]),
+            pa.Array.from_buffers(pa.float64(), length, [None, pa.py_buffer(self.ts)]),
+            pa.Array.from_buffers(pa.float64(), length, [None, pa.py_buffer(self.durations)]),
+        ], schema=results_schema())
+
+
+def record_batches(results: Iterable[Result], batch_size: Optional[int] = None,
+                   builder: Optional[ResultsBuilder] = None) -> Iterator:
+    """
+    Convert poller results into record batches
+
+    :param results: results of poller(), PollerSession.poll() or ParallelPoller.poll()
+    :param batch_size: max count of rows in batch. one batch for all results if None
+    :param builder: builder to keep dictionaries between calls, e.g. between polling cycles
+    :rtype: Iterator[pyarrow.RecordBatch]
+    """
+    require_pyarrow()
+    if builder is None:
+        builder = ResultsBuilder()
+    else:
+        builder.clear()
+    for res in results:
+        builder.append(res)
+        if batch_size and len(builder) >= batch_size:
+            yield builder.to_record_batch()
+            builder.clear()
+    if len(builder):
+        yield builder.to_record_batch()
+        builder.clear()
+
+
+class BatchWriter:
+    """
+    Streaming writer of record batches into Arrow IPC stream or Parquet file
+
+    :param where: path or writable file object
+    :param file_format: FORMAT_IPC or FORMAT_PARQUET
+    """
+
+    def __init__(self, where, file_format: str = FORMAT_IPC):
+        pa = require_pyarrow()
+        schema = results_schema()
+        if file_format == FORMAT_IPC:
+            # dictionaries of ResultsBuilder only grow, so next batches are written as deltas
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_stream(where, schema, options=options)
+        elif file_format == FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(where, schema)
+        else:
+            raise ValueError("unknown format %s" % file_format)
+        self.file_format = file_format
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, batch):
+        if self.file_format == FORMAT_IPC:
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
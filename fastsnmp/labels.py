@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  cache of labels of table indexes, e.g. names of interfaces by ifIndex
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from time import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastsnmp import snmp_poller
+from fastsnmp.snmp_poller import Result, SYS_UPTIME, Timeout
+
+logger = logging.getLogger(__name__)
+
+LABELS_TTL = 3600
+FILE_VERSION = 1
+
+
+@dataclass
+class LabeledResult(Result):
+    # key name => label of index_part
+    labels: dict = field(default_factory=dict)
+
+
+def label_for(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if value is None or isinstance(value, Exception):
+        return None
+    return str(value)
+
+
+class LabelCache:
+    """
+    Maps (host, key, index) to label. Labels of host are walked again when TTL expires,
+    when change indicator of host fires (sysUpTime goes backwards or another indicator changes)
+    or when result with new unknown index is labeled. Index which has no label after walk
+    does not invalidate labels again
+
+    :param keys: key name => OID of column with labels, e.g. {"ifName": "1.3.6.1.2.1.31.1.1.1.1"}
+    :param ttl: max age of labels in seconds
+    :param path: JSON file to persist labels between restarts. loaded if exists
+    :param indicators: OIDs of scalars whose changes invalidate labels of host.
+        sysUpTime is compared for going backwards, others for any change
+    :param columns: main oid => key names to label its results. all keys if None
+    """
+
+    def __init__(self, keys: Dict[str, str], ttl: float = LABELS_TTL, path: Optional[str] = None,
+                 indicators: Tuple[str, ...] = (SYS_UPTIME,), columns: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.keys = {key: oid.strip(".") for key, oid in keys.items()}
+        # key OID => key name
+        self.key_by_oid = {oid: key for key, oid in self.keys.items()}
+        self.ttl = ttl
+        self.path = path
+        self.indicators = tuple(oid.strip(".") for oid in indicators)
+        self.columns = columns
+        # host => key => index_part => label
+        self.labels = {}
+        # host => time of the last walk
+        self.refreshed = {}
+        # host => indicator OID => value
+        self.indicator_values = {}
+        # hosts whose labels are invalidated
+        self.invalid = set()
+        # host => index parts of results which are seen without labels
+        self.unlabeled = {}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def label(self, host: str, key: str, index_part: str) -> Optional[str]:
+        return self.labels.get(host, {}).get(key, {}).get(index_part)
+
+    def invalidate(self, host: str):
+        """
+        Walk labels of host on the next refresh
+        """
+        self.invalid.add(host)
+
+    def stale_hosts(self, hosts: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """
+        Hosts which labels are missing, expired or invalidated
+        """
+        if now is None:
+            now = time()
+        return [host for host in hosts
+                if host in self.invalid or now - self.refreshed.get(host, -self.ttl) >= self.ttl]
+
+    def update_indicators(self, host: str, values: Dict[str, int]) -> bool:
+        """
+        Store values of change indicators of host. Labels of host are invalidated if indicators have changed
+
+        :param values: indicator OID => value
+        :return: True if labels are invalidated
+        """
+        prev_values = self.indicator_values.setdefault(host, {})
+        changed = False
+        for oid, value in values.items():
+            prev_value = prev_values.get(oid)
+            if prev_value is not None:
+                if oid == SYS_UPTIME:
+                    changed = changed or value < prev_value
+                else:
+                    changed = changed or value != prev_value
+            prev_values[oid] = value
+        if changed:
+            logger.debug("indicators of %s are changed", host)
+            self.invalidate(host)
+        return changed
+
+    def update(self, results: Iterable[Result], hosts: Iterable[str], now: Optional[float] = None):
+        """
+        Replace labels of hosts by results of walk of key OIDs. Labels of timeouted hosts are kept
+
+        :param results: results of poller() for oids groups of key OIDs
+        :param hosts: polled hosts
+        """
+        if now is None:
+            now = time()
+        walked = {host: {key: {} for key in self.keys} for host in hosts}
+        for res in results:
+            host_labels = walked.get(res.name)
+            if host_labels is None:
+                continue
+            if isinstance(res.value, Timeout):
+                logger.debug("labels of %s are not refreshed. timeout", res.name)
+                del walked[res.name]
+                continue
+            key = self.key_by_oid.get(res.main_oid)
+            label = label_for(res.value)
+            if key is not None and label is not None:
+                host_labels[key][res.index_part] = label
+        for host, host_labels in walked.items():
+            self.labels[host] = host_labels
+            self.refreshed[host] = now
+            self.invalid.discard(host)
+            unlabeled = self.unlabeled.get(host)
+            if unlabeled:
+                self.unlabeled[host] = {index_part for index_part in unlabeled
+                                        if not any(index_part in key_labels for key_labels in host_labels.values())}
+
+    def refresh(self, hosts: List[str], community: str, now: Optional[float] = None,
+                **poller_kwargs) -> List[str]:
+        """
+        Poll change indicators of hosts and walk key OIDs of stale hosts.
+        Labels are saved into path if any host is walked
+
+        :param poller_kwargs: arguments of snmp_poller.poller()
+        :return: walked hosts
+        """
+        if self.indicators:
+            values = {}
+            get_kwargs = dict(poller_kwargs, msg_type="Get")
+            for res in snmp_poller.poller(hosts, [self.indicators], community, **get_kwargs):
+                if isinstance(res.value, int):
+                    values.setdefault(res.name, {})[res.main_oid] = res.value
+            for host, host_values in values.items():
+                self.update_indicators(host, host_values)
+        stale = self.stale_hosts(hosts, now)
+        if stale:
+            oids_groups = [(oid,) for oid in self.keys.values()]
+            self.update(snmp_poller.poller(stale, oids_groups, community, **poller_kwargs), stale, now)
+            if self.path is not None:
+                self.save()
+        return stale
+
+    def attach(self, results: Iterable[Result]) -> Iterator[LabeledResult]:
+        """
+        Add labels of index to results. Result with unknown index invalidates labels of its host
+        """
+        for res in results:
+            labels = {}
+            host_labels = self.labels.get(res.name)
+            if host_labels is not None and res.index_part:
+                keys = self.keys if self.columns is None else self.columns.get(res.main_oid, ())
+                for key in keys:
+                    label = host_labels.get(key, {}).get(res.index_part)
+                    if label is not None:
+                        labels[key] = label
+                if keys and not labels:
+                    unlabeled = self.unlabeled.setdefault(res.name, set())
+                    if res.index_part not in unlabeled:
+                        # new row of table or row without labels
+                        unlabeled.add(res.index_part)
+                        self.invalid.add(res.name)
+            yield LabeledResult(name=res.name, main_oid=res.main_oid, index_part=res.index_part, value=res.value,
+                                ts=res.ts, duration=res.duration, value_type=res.value_type, labels=labels)
+
+    def save(self):
+        """
+        Write labels into path. File is replaced atomically
+        """
+        data = {
+            "version": FILE_VERSION,
+            "hosts": {host: {"refreshed": self.refreshed.get(host, 0), "labels": host_labels,
+                             "indicators": self.indicator_values.get(host, {})}
+                      for host, host_labels in self.labels.items()},
+        }
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """
+        Read labels from path. Invalid file is ignored
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("unable to load labels from %s: %r", self.path, e)
+            return
+        if data.get("version") != FILE_VERSION:
+            logger.error("unknown version of labels file %s", self.path)
+            return
+        for host, host_data in data["hosts"].items():
+            self.labels[host] = host_data["labels"]
+            self.refreshed[host] = host_data["refreshed"]
+            self.indicator_values[host] = host_data["indicators"]
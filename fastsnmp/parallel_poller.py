@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  multiprocess poller: hosts are partitioned across worker processes
+import logging
+import multiprocessing
+import os
+import queue
+from time import monotonic
+from typing import Iterator, List, Optional
+
+from fastsnmp import snmp_poller
+from fastsnmp.snmp_poller import Result, shard_for
+
+logger = logging.getLogger(__name__)
+
+# message kinds from workers
+MSG_BATCH = 0
+MSG_DONE = 1
+MSG_ERROR = 2
+
+
+class WorkerError(Exception):
+    pass
+
+
+def partition_hosts(hosts: List[str], count: int) -> List[List[str]]:
+    """
+    Split hosts into count partitions. Host always gets the same partition
+    """
+    partitions = [[] for _ in range(count)]
+    for host in hosts:
+        partitions[shard_for(host, count)].append(host)
+    return partitions
+
+
+def poll_worker(results_queue, proc_id: int, hosts: List[str], oids_groups: List[List[str]], community: str,
+                poller_kwargs: dict, batch_size: int, flush_interval: float):
+    """
+    Worker process. Runs poller() and sends results by batches of tuples.
+    Messages are (proc_id, kind, payload), error is sent as repr() because exception may not pickle
+    """
+    try:
+        batch = []
+        batch_started = monotonic()
+        for res in snmp_poller.poller(hosts, oids_groups, community, **poller_kwargs):
+            if not batch:
+                batch_started = monotonic()
+            batch.append((res.name, res.main_oid, res.index_part, res.value, res.ts, res.duration, res.value_type))
+            if len(batch) >= batch_size or monotonic() - batch_started > flush_interval:
+                results_queue.put((proc_id, MSG_BATCH, batch))
+                batch = []
+        if batch:
+            results_queue.put((proc_id, MSG_BATCH, batch))
+        results_queue.put((proc_id, MSG_DONE, None))
+    except Exception as e:
+        logger.exception("poller failed")
+        results_queue.put((proc_id, MSG_ERROR, repr(e)))
+
+
+class ParallelPoller:
+    """
+    Poller which scales with cores. Hosts are partitioned across worker processes,
+    each worker runs snmp_poller.poller() with its own sockets and results are merged into one iterator
+
+    :param workers: count of worker processes. count of CPUs by default
+    :param batch_size: max count of results in one message from worker
+    :param flush_interval: max time in seconds before not full batch is sent
+    :param mp_context: multiprocessing context or start method name
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 1000, flush_interval: float = 0.1,
+                 mp_context=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        if mp_context is None or isinstance(mp_context, str):
+            mp_context = multiprocessing.get_context(mp_context)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mp_context = mp_context
+
+    def poll(self, hosts: List[str], oids_groups: List[List[str]], community: str, **poller_kwargs) -> Iterator[Result]:
+        """
+        A generator that yields SNMP data. Takes the same arguments as snmp_poller.poller()
+
+        :return: host, main_oid, index_part, value
+        :rtype: Result
+        """
+        results_queue = self.mp_context.Queue(maxsize=self.workers * 4)
+        # proc_id => (process, hosts)
+        procs = {}
+        for proc_id, part in enumerate(partition_hosts(hosts, self.workers)):
+            if not part:
+                continue
+            proc = self.mp_context.Process(target=poll_worker, name="fastsnmp poller#%s" % proc_id, daemon=True,
+                                           args=(results_queue, proc_id, part, oids_groups, community,
+                                                 poller_kwargs, self.batch_size, self.flush_interval))
+            proc.start()
+            procs[proc_id] = (proc, part)
+
+        try:
+            finished = set()
+            while len(finished) < len(procs):
+                try:
+                    proc_id, kind, payload = results_queue.get(timeout=1)
+                except queue.Empty:
+                    # worker may exit without DONE even with code 0, e.g. if its message is lost
+                    for proc_id, (proc, part) in procs.items():
+                        if proc_id not in finished and not proc.is_alive():
+                            raise WorkerError("%s exited with code %s without results of %s" % (
+                                proc.name, proc.exitcode, ", ".join(part)))
+                    continue
+                if kind == MSG_BATCH:
+                    for row in payload:
+                        yield Result(*row)
+                elif kind == MSG_DONE:
+                    finished.add(proc_id)
+                else:
+                    raise WorkerError("poller failed in %s: %s" % (procs[proc_id][0].name, payload))
+        finally:
+            for proc, _ in procs.values():
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
+            results_queue.close()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  planner of requests: packs flat list of OIDs into request groups of poller
+from typing import Dict, Iterable, List, Union
+
+from fastsnmp import snmp_parser
+from fastsnmp.snmp_poller import LENGTHS_GROWTH, MAX_PDU_SIZE, MAX_REQID, RequestGroup
+
+# max repetitions and non repeaters of GetBulk are not longer
+MAX_HEADER_INTEGER = 0x7fffffff
+
+
+def is_scalar(oid: str) -> bool:
+    return oid.endswith(".0")
+
+
+def header_size(community: str) -> int:
+    """
+    Max size of request without varbinds
+    """
+    return len(snmp_parser.msg_encode(MAX_REQID, community, [], msg_type="GetBulk",
+                                      max_repetitions=MAX_HEADER_INTEGER,
+                                      non_repeaters=MAX_HEADER_INTEGER)) + LENGTHS_GROWTH
+
+
+def varbind_size(oid: str) -> int:
+    return len(snmp_parser.encode_varbind(oid))
+
+
+def unique_oids(oids: Iterable[Union[str, Iterable[str]]]) -> List[str]:
+    """
+    Flatten oids groups and drop duplicates. The first occurrence keeps its position
+    """
+    res = {}
+    for item in oids:
+        if isinstance(item, str):
+            res[item.strip(".")] = None
+        else:
+            for oid in item:
+                res[oid.strip(".")] = None
+    return list(res)
+
+
+def pack(oids: List[str], max_size: int) -> List[List[str]]:
+    """
+    Split oids into chunks which varbinds take no more than max_size
+    """
+    chunks = []
+    size = 0
+    for oid in oids:
+        oid_size = varbind_size(oid)
+        if not chunks or size + oid_size > max_size:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(oid)
+        size += oid_size
+    return chunks
+
+
+def plan_requests(oids: Iterable[Union[str, Iterable[str]]], community: str = "public",
+                  max_pdu_size: int = MAX_PDU_SIZE, combine: bool = True) -> List[RequestGroup]:
+    """
+    Build request groups of poller from flat list of OIDs. OIDs which end with .0 are scalars, others are columns.
+    Columns of the same table (with the same parent OID) are walked by one GetBulk,
+    scalars are packed into Get requests or added to GetBulk of table as non-repeaters
+
+    :param oids: OIDs or oids groups. duplicates are polled once
+    :param community: community to estimate size of requests
+    :param max_pdu_size: max size of request in bytes
+    :param combine: add scalars to GetBulk of tables as non-repeaters
+    :rtype: list
+    """
+    max_size = max_pdu_size - header_size(community)
+    scalars = []
+    # parent OID => columns
+    tables = {}
+    for oid in unique_oids(oids):
+        if is_scalar(oid):
+            scalars.append(oid)
+        else:
+            tables.setdefault(oid.rsplit(".", 1)[0], []).append(oid)
+
+    tables_groups = []
+    for columns in tables.values():
+        for chunk in pack(columns, max_size):
+            tables_groups.append(RequestGroup(columns=tuple(chunk)))
+    scalars_chunks = pack(scalars, max_size)
+
+    if combine:
+        for pos, table_group in enumerate(tables_groups):
+            if not scalars_chunks:
+                break
+            free_size = max_size - sum(varbind_size(oid) for oid in table_group.columns)
+            # scalar is requested without .0 as non-repeater
+            chunk = scalars_chunks[0]
+            if sum(varbind_size(oid[:-2]) for oid in chunk) <= free_size:
+                scalars_chunks.pop(0)
+                tables_groups[pos] = RequestGroup(scalars=tuple(chunk), columns=table_group.columns)
+    return tables_groups + [RequestGroup(scalars=tuple(chunk)) for chunk in scalars_chunks]
+
+
+def plan_hosts(host_oids: Dict[str, Iterable[Union[str, Iterable[str]]]], **kwargs) -> Dict[str, List[RequestGroup]]:
+    """
+    Request groups of every host for PollerSession.poll(). Hosts with the same OIDs share the plan
+
+    :param host_oids: host => OIDs or oids groups
+    :param kwargs: arguments of plan_requests()
+    :return: host => request groups
+    :rtype: dict
+    """
+    plans = {}
+    res = {}
+    for host, oids in host_oids.items():
+        oids = tuple(unique_oids(oids))
+        plan = plans.get(oids)
+        if plan is None:
+            plan = plans[oids] = plan_requests(oids, **kwargs)
+        res[host] = plan
+    return res
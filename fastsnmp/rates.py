@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#  per-second rates of SNMP counters. previous samples are kept in numpy arrays
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from fastsnmp import snmp_parser
+from fastsnmp.snmp_poller import Result
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# flags of samples
+FLAG_FIRST = 0x01  # no previous sample
+FLAG_WRAP = 0x02  # Counter32 wrapped, rate is computed over the wrap
+FLAG_RESTART = 0x04  # sysUpTime went backwards, agent was restarted
+FLAG_RESET = 0x08  # counter decreased and it is not a Counter32 wrap
+FLAG_TIME = 0x10  # timestamp is not later than previous one
+# rate of sample is NaN if one of these flags is set
+DISCONTINUITY = FLAG_FIRST | FLAG_RESTART | FLAG_RESET | FLAG_TIME
+
+MASK32 = 0xffffffff
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("numpy is required for RateEngine")
+    return numpy
+
+
+class RateEngine:
+    """
+    Computes per-second rates of counters. Every counter (host, main_oid, index_part) has a slot
+    in preallocated arrays of previous values, timestamps and sysUpTime, so update of whole polling cycle
+    is done by vectorised operations
+
+    :param capacity: initial count of slots. arrays grow twice when full
+    """
+
+    def __init__(self, capacity: int = 1024):
+        np = require_numpy()
+        capacity = max(capacity, 1)
+        # (host, main_oid, index_part) => slot
+        self.slots = {}
+        self.prev_values = np.zeros(capacity, dtype=np.uint64)
+        self.prev_ts = np.zeros(capacity, dtype=np.float64)
+        self.prev_uptimes = np.zeros(capacity, dtype=np.uint64)
+        self.has_prev = np.zeros(capacity, dtype=bool)
+        # keys of the previous update_results() and their slots, hosts and main oids
+        self.layout_keys = None
+        self.layout = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def grow(self, size: int):
+        np = numpy
+        capacity = len(self.prev_values)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ("prev_values", "prev_ts", "prev_uptimes", "has_prev"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def slots_for(self, keys: Iterable[Tuple[str, str, str]]):
+        """
+        Slots of counters. New counters get new slots. Result can be cached by caller
+        while set of polled counters is the same
+
+        :param keys: (host, main_oid, index_part) of counters
+        :rtype: numpy.ndarray
+        """
+        slots = self.slots
+        setdefault = slots.setdefault
+        res = numpy.fromiter((setdefault(key, len(slots)) for key in keys), dtype=numpy.intp)
+        self.grow(len(slots))
+        return res
+
+    def layout_for(self, keys: List[Tuple[str, str, str]]):
+        """
+        Slots of counters, hosts and main oids with their codes per counter.
+        Cached while keys are the same as in the previous call
+
+        :returns: slots, hosts, host codes, main oids, main oid codes
+        :rtype: tuple
+        """
+        if keys != self.layout_keys:
+            np = numpy
+            hosts = {}
+            main_oids = {}
+            host_codes = np.fromiter((hosts.setdefault(key[0], len(hosts)) for key in keys), dtype=np.intp,
+                                     count=len(keys))
+            oid_codes = np.fromiter((main_oids.setdefault(key[1], len(main_oids)) for key in keys), dtype=np.intp,
+                                    count=len(keys))
+            self.layout = (self.slots_for(keys), list(hosts), host_codes, list(main_oids), oid_codes)
+            self.layout_keys = keys
+        return self.layout
+
+    def forget(self, keys: Iterable[Tuple[str, str, str]]):
+        """
+        Drop previous samples of counters. Slots are kept, the next sample is the first one
+        """
+        slots = [self.slots[key] for key in keys if key in self.slots]
+        self.has_prev[slots] = False
+
+    def update(self, slots, values, ts, bits=64, uptimes=None, known_uptimes=None):
+        """
+        Store new samples and compute rates
+
+        :param slots: slots of counters from slots_for()
+        :param values: counter values
+        :param ts: timestamps of samples in seconds. array or one value for all samples
+        :param bits: width of counters, 32 or 64. array or one value for all samples
+        :param uptimes: sysUpTime of agents in timeticks. array or one value for all samples. not checked if None
+        :param known_uptimes: mask of samples with known uptime. restart is not checked for others
+        :returns: rates per second (NaN on discontinuity) and flags
+        :rtype: tuple
+        """
+        np = numpy
+        slots = np.asarray(slots, dtype=np.intp)
+        values = np.asarray(values, dtype=np.uint64)
+        ts = np.broadcast_to(np.asarray(ts, dtype=np.float64), slots.shape)
+        bits = np.broadcast_to(np.asarray(bits, dtype=np.uint8), slots.shape)
+
+        prev_values = self.prev_values[slots]
+        has_prev = self.has_prev[slots]
+        # unsigned subtraction is modulo 2**64
+        deltas = values - prev_values
+        is32 = bits == 32
+        deltas[is32] &= np.uint64(MASK32)
+        decreased = values < prev_values
+        dt = ts - self.prev_ts[slots]
+
+        flags = np.zeros(slots.shape, dtype=np.uint8)
+        flags[~has_prev] |= FLAG_FIRST
+        flags[has_prev & decreased & is32] |= FLAG_WRAP
+        flags[has_prev & decreased & ~is32] |= FLAG_RESET
+        flags[has_prev & (dt <= 0)] |= FLAG_TIME
+        if uptimes is not None:
+            uptimes = np.broadcast_to(np.asarray(uptimes, dtype=np.uint64), slots.shape)
+            restarted = has_prev & (uptimes < self.prev_uptimes[slots])
+            if known_uptimes is None:
+                self.prev_uptimes[slots] = uptimes
+            else:
+                restarted &= known_uptimes
+                self.prev_uptimes[slots[known_uptimes]] = uptimes[known_uptimes]
+            flags[restarted] |= FLAG_RESTART
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = deltas.astype(np.float64) / dt
+        rates[(flags & DISCONTINUITY) != 0] = np.nan
+
+        self.prev_values[slots] = values
+        self.prev_ts[slots] = ts
+        self.has_prev[slots] = True
+        return rates, flags
+
+    def update_results(self, results: Iterable[Result], bits: Union[None, int, Dict[str, int]] = None,
+                       uptimes: Optional[Dict[str, int]] = None) -> Tuple[List[Tuple[str, str, str]], object, object]:
+        """
+        Compute rates of counters from poller results.
+        Results without non-negative integer value (timeouts) are skipped
+
+        :param results: results of poller
+        :param bits: width of counters, 32 or 64, or main_oid => width. by type of value if None
+        :param uptimes: host => sysUpTime in timeticks polled in the same cycle.
+            restart is not checked for hosts without uptime
+        :returns: keys (host, main_oid, index_part), rates and flags
+        :rtype: tuple
+        """
+        keys = []
+        values = []
+        ts = []
+        types = []
+        for res in results:
+            if isinstance(res.value, int) and res.value >= 0:
+                keys.append((res.name, res.main_oid, res.index_part))
+                values.append(res.value)
+                ts.append(res.ts)
+                types.append(res.value_type)
+        np = numpy
+        slots, hosts, host_codes, main_oids, oid_codes = self.layout_for(keys)
+        if bits is None:
+            bits = np.where(np.asarray(types, dtype=np.uint8) == snmp_parser.TYPE_COUNTER32, 32, 64)
+        elif isinstance(bits, dict):
+            bits = np.array([bits.get(main_oid, 64) for main_oid in main_oids], dtype=np.uint8)[oid_codes]
+        known_uptimes = None
+        if uptimes is not None:
+            # -1 is unknown uptime
+            host_uptimes = np.array([uptimes.get(host, -1) for host in hosts], dtype=np.int64)[host_codes]
+            known_uptimes = host_uptimes >= 0
+            uptimes = np.where(known_uptimes, host_uptimes, 0)
+        rates, flags = self.update(slots, values, ts, bits=bits, uptimes=uptimes, known_uptimes=known_uptimes)
+        return keys, rates, flags
@@ -1,4 +1,4 @@
-# cython: nonecheck=False, boundscheck=False, wraparound=False, language_level=3
+# cython: nonecheck=False, boundscheck=False, wraparound=False, language_level=3, freethreading_compatible=True
 # cython: c_string_type=str, c_string_encoding=ascii
 # based on https://pypi.python.org/pypi/libsnmp/
 
@@ -9,15 +9,26 @@ import cython
 from cpython.tuple cimport PyTuple_New, PyTuple_SET_ITEM
 from cpython.long cimport PyLong_FromLong
 from cpython.ref cimport Py_INCREF
-from cpython.exc cimport PyErr_SetString
-from cpython.unicode cimport PyUnicode_DecodeASCII
+from cpython.object cimport Py_LT, Py_LE, Py_EQ, Py_NE, Py_GT, Py_GE
+from cpython.exc cimport PyErr_SetString, PyErr_SetFromErrno
+from cpython.unicode cimport PyUnicode_DecodeASCII, PyUnicode_DecodeUTF8, PyUnicode_AsUTF8AndSize
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_GET_SIZE, PyBytes_FromStringAndSize
+from cpython.bytearray cimport PyByteArray_AS_STRING, PyByteArray_GET_SIZE, PyByteArray_FromStringAndSize
 from libc.stdio cimport sprintf
-from libc.string cimport memcpy
+from libc.string cimport memcpy, memset, memcmp, strlen
+from libc.stdlib cimport calloc, malloc, realloc, free
+from libc.errno cimport errno, EAGAIN, EINTR
 from itertools import cycle
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from libc.stdint cimport uint64_t, uint32_t, uint8_t, int64_t, INT64_MAX
+from cpython cimport array
+import array
 import struct
 DEF MAX_OID_LEN_STR=500
 DEF MAX_INT_LEN=30
+DEF MAX_OID_LEN=128
+DEF INET6_ADDRSTRLEN=46
 
 
 class SNMPException(Exception):
@@ -142,6 +153,41 @@ ASN_SNMP_MSG_TYPES = {
     'GetBulk': ASN_SNMP_GETBULK_BYTE,
 }
 
+# type codes of typed decoding. code is the first octet of value's tag, 0 if type is unknown
+TYPE_UNKNOWN = 0
+TYPE_INTEGER = ASN_U_INTEGER
+TYPE_OCTETSTRING = ASN_U_OCTETSTRING
+TYPE_NULL = ASN_U_NULL
+TYPE_OBJECTID = ASN_U_OBJECTID
+TYPE_IPADDRESS = ASN_A_IPADDRESS
+TYPE_COUNTER32 = ASN_A_COUNTER32
+TYPE_GAUGE32 = ASN_A_GAUGE32
+TYPE_UNSIGNED32 = ASN_A_UNSIGNED32
+TYPE_TIMETICKS = ASN_A_TIMETICKS
+TYPE_OPAQUE = ASN_A_OPAQUE
+TYPE_COUNTER64 = ASN_A_COUNTER64
+TYPE_NO_SUCH_OBJECT = ASN_U_NO_SUCH_OBJECT
+TYPE_NO_SUCH_INSTANCE = ASN_U_NO_SUCH_INSTANCE
+TYPE_END_OF_MIB_VIEW = ASN_U_END_OF_MIB_VIEW
+
+TYPE_CODE_TO_NAME = {
+    TYPE_INTEGER: 'Integer',
+    TYPE_OCTETSTRING: 'OctetString',
+    TYPE_NULL: 'Null',
+    TYPE_OBJECTID: 'ObjectID',
+    TYPE_IPADDRESS: 'IpAddress',
+    TYPE_COUNTER32: 'Counter32',
+    TYPE_GAUGE32: 'Gauge32',
+    TYPE_TIMETICKS: 'TimeTicks',
+    TYPE_OPAQUE: 'Opaque',
+    TYPE_COUNTER64: 'Counter64',
+    TYPE_NO_SUCH_OBJECT: 'NoSuchObject',
+    TYPE_NO_SUCH_INSTANCE: 'NoSuchInstance',
+    TYPE_END_OF_MIB_VIEW: 'EndOfMibView',
+}
+
+cdef array.array type_codes_template = array.array('B')
+
 # caches
 length_cache = {}
 length_cache[0] = b'\x00'
@@ -174,7 +220,7 @@ cdef char **INT_TO_STRING = [
     b'90', b'91', b'92', b'93', b'94', b'95', b'96', b'97', b'98', b'99',
 ]
 
-cdef inline int primitive_decode(char *stream, size_t stream_len, uint64_t *result, size_t *result_len):
+cdef inline int primitive_decode(char *stream, size_t stream_len, uint64_t *result, size_t *result_len) noexcept nogil:
     cdef size_t i
     cdef uint8_t sid
     cdef int retval = 0
@@ -192,10 +238,11 @@ cdef inline int primitive_decode(char *stream, size_t stream_len, uint64_t *resu
     return retval
 
 
-cdef int objectid_decode_str(const unsigned char *stream, size_t stream_len, char *out, size_t *out_length):
+cdef int objectid_decode_str(const unsigned char *stream, size_t stream_len, char *out,
+                             size_t *out_length) noexcept nogil:
     cdef uint64_t result[122]
     cdef uint64_t oid_part
-    cdef size_t n, tmp_n, cpy_len, ret_len, sid12_enc_len, result_len=0
+    cdef size_t n, tmp_n, cpy_len, ret_len, sid12_enc_len, result_len=0, i
     cdef SID12_t tmp_sid
     cdef char *oid_part_char
 
@@ -203,6 +250,12 @@ cdef int objectid_decode_str(const unsigned char *stream, size_t stream_len, cha
         return -1
     if <size_t>stream[0] > 127:
         return -2
+    for i in range(1, stream_len):
+        if stream[i] & 0x80 == 0:
+            result_len += 1
+    if result_len > 120:
+        return -3  # too long for result
+    result_len = 0
 
     tmp_sid = sid12s[<size_t>stream[0]]
 
@@ -216,6 +269,9 @@ cdef int objectid_decode_str(const unsigned char *stream, size_t stream_len, cha
 
     for i in range(result_len):
         oid_part = result[i]
+        # dot, digits and NUL of sprintf
+        if out_length[0] + (3 if oid_part < 100 else 22) > MAX_OID_LEN_STR:
+            return -3  # too long for out
         out[0] = b'.'
         n = 1
         if oid_part < 100:
@@ -426,6 +482,19 @@ cdef inline void primitive_encode(uint64_t *value, uint8_t size, char *result_pt
         result_ptr[8] = value[0] & 0xFF
 
 
+cdef int sid12_check(uint64_t sid1, uint64_t sid2) except -1:
+    """
+    Check first two sub-identifiers. Shared by all OID encoders
+    """
+    if sid1 == 2 and sid2 > 39:
+        raise SNMPException("long SID1 is not supported")
+    if sid1 > 2:
+        raise SNMPException("wrong SID1")
+    if sid2 > 39:
+        raise SNMPException("wrong SID2")
+    return 0
+
+
 cdef inline int objectid_encode_array(uint64_t *subids, uint32_t subids_len,
                                       char *result, size_t *object_len):
     cdef uint32_t clen
@@ -435,15 +504,7 @@ cdef inline int objectid_encode_array(uint64_t *subids, uint32_t subids_len,
     cdef size_t sid_len = 0
     cdef char *result_ptr
 
-    if subids[0] == 2 and subids[1] > 39:
-        return -3  # long SID1 is not supported
-
-    if subids[0] > 2:
-        return -1  # wrong SID1
-
-    if subids[1] > 39:
-        return -2  # wrong SID2
-
+    # first two sub-identifiers are checked by sid12_check()
     result[0] = subids[0]*40 + subids[1]
     object_len[0] = 1
     result_ptr = result+1
@@ -460,10 +521,12 @@ def objectid_encode(oid):
     encode an ObjectID into stream
     X.690, chapter 8.19
     :param oid: OID
-    :type oid: str
+    :type oid: str | Oid
     :returns: stream
     :rtype: bytearray
     """
+    if isinstance(oid, Oid):
+        return (<Oid> oid).encoded
     cdef unsigned int number
     cdef uint64_t idlist[128]
     cdef list subidlist
@@ -474,17 +537,259 @@ def objectid_encode(oid):
     for subid in oid.strip('.').split('.'):
         idlist[pos] = int(subid)
         pos += 1
-    ret = objectid_encode_array(idlist, pos, result, &object_len)
+    sid12_check(idlist[0], idlist[1])
+    objectid_encode_array(idlist, pos, result, &object_len)
+    return <bytes>result[:object_len]
 
-    if ret != 0:
-        if ret == -1:
-            raise SNMPException("wrong SID1")
-        elif ret == -2:
-            raise SNMPException("wrong SID2")
-        elif ret == -3:
-            raise SNMPException("long SID1 is not supported")
+cdef Oid oid_new(const uint32_t *subids, Py_ssize_t length):
+    cdef Oid res = Oid.__new__(Oid)
+    res.subids = <uint32_t *> malloc((length or 1) * sizeof(uint32_t))
+    if res.subids == NULL:
+        raise MemoryError()
+    if length:
+        memcpy(res.subids, subids, length * sizeof(uint32_t))
+    res.length = length
+    return res
+
+
+cdef Oid oid_from_ber(const unsigned char *stream, size_t stream_len):
+    """
+    Decode encoded ObjectID into Oid. X.690, chapter 8.19
+    """
+    cdef uint32_t subids[MAX_OID_LEN]
+    cdef Py_ssize_t count = 0
+    cdef uint64_t subid = 0
+    cdef size_t i
+    cdef bint first = True
+    if stream_len == 0:
+        raise SNMPException("empty stream")
+    for i in range(stream_len):
+        subid = subid << 7 | (stream[i] & 0x7f)
+        if subid > 0xffffffff + 80:
+            raise SNMPException("invalid oid: too long sub-identifier")
+        if stream[i] & 0x80:
+            continue
+        if count + 2 > MAX_OID_LEN:
+            raise SNMPException("too long oid")
+        if first:
+            first = False
+            if subid < 40:
+                subids[0] = 0
+            elif subid < 80:
+                subids[0] = 1
+            else:
+                subids[0] = 2
+            subid -= subids[0] * 40
+            if subid > 0xffffffff:
+                raise SNMPException("invalid oid: too long sub-identifier")
+            subids[1] = <uint32_t> subid
+            count = 2
+        else:
+            if subid > 0xffffffff:
+                raise SNMPException("invalid oid: too long sub-identifier")
+            subids[count] = <uint32_t> subid
+            count += 1
+        subid = 0
+    if stream[stream_len - 1] & 0x80:
+        raise SNMPException("invalid oid: truncated sub-identifier")
+    return oid_new(subids, count)
+
+
+@cython.final
+cdef class Oid:
+    """
+    Immutable ObjectID. Array of uint32 sub-identifiers with cached hash and encoding
+
+    :param value: dotted string, another Oid or sequence of ints
+    """
+    cdef uint32_t *subids
+    cdef Py_ssize_t length
+    cdef Py_hash_t hash_value
+    cdef bytes encoded_value
+
+    def __cinit__(self):
+        self.subids = NULL
+        self.length = 0
+        self.hash_value = -1
+        self.encoded_value = None
+
+    def __init__(self, value):
+        cdef uint64_t subids[MAX_OID_LEN]
+        cdef uint32_t subids_len = 0, i
+        cdef const char *value_ptr
+        cdef Py_ssize_t value_len
+        cdef int ret = -1
+        cdef Oid other
+        if self.subids != NULL:
+            raise TypeError("Oid is immutable")
+        if isinstance(value, Oid):
+            other = value
+            self.subids = <uint32_t *> malloc((other.length or 1) * sizeof(uint32_t))
+            if self.subids == NULL:
+                raise MemoryError()
+            memcpy(self.subids, other.subids, other.length * sizeof(uint32_t))
+            self.length = other.length
+            self.hash_value = other.hash_value
+            self.encoded_value = other.encoded_value
+            return
+        if isinstance(value, str):
+            value_ptr = PyUnicode_AsUTF8AndSize(value, &value_len)
+            ret = oid_parse_c(value_ptr, value_len, subids, &subids_len)
+            if ret == -2:
+                raise SNMPException("OID %r is too long" % value)
+            elif ret == -3:
+                raise OverflowError("sub-identifier is out of uint32")
+            elif ret == -1:
+                # wrong OID or OID with one sub-identifier
+                value = [int(subid) for subid in value.strip(".").split(".")]
+        if ret != 0:
+            value = tuple(value)
+            if len(value) > MAX_OID_LEN:
+                raise SNMPException("OID is too long")
+            for i in range(len(value)):
+                if value[i] < 0:
+                    raise OverflowError("sub-identifier is out of uint32")
+                subids[i] = value[i]
+            subids_len = len(value)
+        for i in range(subids_len):
+            if subids[i] > 0xffffffff:
+                raise OverflowError("sub-identifier is out of uint32")
+        self.subids = <uint32_t *> malloc((subids_len or 1) * sizeof(uint32_t))
+        if self.subids == NULL:
+            raise MemoryError()
+        for i in range(subids_len):
+            self.subids[i] = <uint32_t> subids[i]
+        self.length = subids_len
+
+    def __dealloc__(self):
+        free(self.subids)
+
+    def __reduce__(self):
+        return Oid, (tuple(self),)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        cdef Py_ssize_t start, stop, step
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step == 1:
+                return oid_new(self.subids + start, stop - start if stop > start else 0)
+            return Oid(tuple(self)[key])
+        start = key
+        if start < 0:
+            start += self.length
+        if start < 0 or start >= self.length:
+            raise IndexError("Oid index out of range")
+        return self.subids[start]
+
+    def __iter__(self):
+        cdef Py_ssize_t i
+        for i in range(self.length):
+            yield self.subids[i]
+
+    def __str__(self):
+        cdef char out[MAX_OID_LEN * 11]
+        cdef size_t out_len = 0
+        cdef Py_ssize_t i
+        for i in range(self.length):
+            if i:
+                out[out_len] = c'.'
+                out_len += 1
+            out_len += uint_to_str(self.subids[i], out + out_len)
+        return PyUnicode_DecodeASCII(out, out_len, NULL)
+
+    def __repr__(self):
+        return "Oid(%r)" % str(self)
+
+    def __hash__(self):
+        cdef Py_ssize_t i
+        cdef uint64_t value
+        if self.hash_value == -1:
+            # FNV-1a over sub-identifiers
+            value = 14695981039346656037ULL
+            for i in range(self.length):
+                value = (value ^ self.subids[i]) * 1099511628211ULL
+            self.hash_value = <Py_hash_t> value
+            if self.hash_value == -1:
+                self.hash_value = -2
+        return self.hash_value
+
+    cdef int compare(self, Oid other) noexcept:
+        cdef Py_ssize_t i
+        cdef Py_ssize_t length = self.length if self.length < other.length else other.length
+        for i in range(length):
+            if self.subids[i] != other.subids[i]:
+                return -1 if self.subids[i] < other.subids[i] else 1
+        if self.length == other.length:
+            return 0
+        return -1 if self.length < other.length else 1
+
+    def __richcmp__(self, other, int op):
+        cdef int res
+        if not isinstance(other, Oid):
+            return NotImplemented
+        if op == Py_EQ or op == Py_NE:
+            if (<Oid> self).length != (<Oid> other).length or \
+                    (self.hash_value != -1 and (<Oid> other).hash_value != -1 and
+                     self.hash_value != (<Oid> other).hash_value):
+                return op == Py_NE
+        res = self.compare(other)
+        if op == Py_LT:
+            return res < 0
+        elif op == Py_LE:
+            return res <= 0
+        elif op == Py_EQ:
+            return res == 0
+        elif op == Py_NE:
+            return res != 0
+        elif op == Py_GT:
+            return res > 0
+        return res >= 0
+
+    cdef bint prefix_of(self, Oid other) noexcept:
+        if self.length > other.length:
+            return False
+        return memcmp(self.subids, other.subids, self.length * sizeof(uint32_t)) == 0
+
+    def is_prefix_of(self, Oid other not None):
+        """
+        Check that other is equal to this OID or lies under it
+        """
+        return self.prefix_of(other)
+
+    def suffix(self, Oid prefix not None):
+        """
+        Sub-identifiers after prefix. For instance, index part of table column
+
+        :raises ValueError: if prefix is not prefix of this OID
+        """
+        if not prefix.prefix_of(self):
+            raise ValueError("%s is not prefix of %s" % (prefix, self))
+        return oid_new(self.subids + prefix.length, self.length - prefix.length)
+
+    @property
+    def encoded(self):
+        """
+        Encoded ObjectID without tag and length. Same as objectid_encode()
+        """
+        cdef char result[MAX_OID_LEN * 5 + 5]
+        cdef uint64_t subid
+        cdef size_t result_len
+        cdef Py_ssize_t i
+        if self.encoded_value is None:
+            if self.length < 2:
+                raise SNMPException("wrong OID %s" % self)
+            sid12_check(self.subids[0], self.subids[1])
+            subid = <uint64_t> self.subids[0] * 40 + self.subids[1]
+            result_len = primitive_encode7(&subid, result)
+            for i in range(2, self.length):
+                subid = self.subids[i]
+                result_len += primitive_encode7(&subid, result + result_len)
+            self.encoded_value = <bytes> result[:result_len]
+        return self.encoded_value
 
-    return <bytes>result[:object_len]
 
 cdef inline bytes c_octetstring_decode(const unsigned char *data, size_t data_len):
     return <bytes> data[:data_len]
@@ -558,7 +863,7 @@ def integer_decode(bytes stream not None):
     cdef const unsigned char *stream_char = stream
     return integer_decode_c(stream_char, &stream_len)
 
-cdef inline int64_t integer_decode_c(const unsigned char *stream, size_t *stream_len):
+cdef inline int64_t integer_decode_c(const unsigned char *stream, size_t *stream_len) noexcept nogil:
     cdef int64_t value = 0
     cdef size_t i
 
@@ -569,7 +874,7 @@ cdef inline int64_t integer_decode_c(const unsigned char *stream, size_t *stream
         value |= stream[i]
     return value
 
-cdef inline uint64_t uinteger_decode_c(const unsigned char *stream, size_t *stream_len):
+cdef inline uint64_t uinteger_decode_c(const unsigned char *stream, size_t *stream_len) noexcept nogil:
     cdef uint64_t value = 0
     cdef uint8_t i
     for i in range(stream_len[0]):
@@ -586,12 +891,13 @@ def sequence_decode(bytes stream not None) -> list:
         raise ex
     return ret
 
-cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_len):
+cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_len, bint as_oid=False):
     """
     Decode input stream into as sequence
 
     :param stream: sequence
     :type stream: bytes
+    :param as_oid: decode ObjectID into Oid instead of str
     :returns: decoded sequence
     :rtype: list
     """
@@ -614,14 +920,23 @@ cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_le
         tag_decode_c(stream_char, &tag, &encode_length)
         stream_char += encode_length
         current_stream_pos += encode_length
+        if current_stream_pos >= stream_len:
+            return objects, SNMPException("out of len. no length for tag=%s" % tag)
 
         length_decode_c(stream_char, &length, &encode_length)
         stream_char += encode_length
         current_stream_pos += encode_length
+        if current_stream_pos > stream_len:
+            return objects, SNMPException("out of len. truncated length for tag=%s" % tag)
 
         if (current_stream_pos + length) > stream_len:
-            return objects, SNMPException("out of len. current_stream_pos=%s length=%s stream_len=%s tag=%s" %
-                            (current_stream_pos, length, stream_len, tag))
+            ex = SNMPException("out of len. current_stream_pos=%s length=%s stream_len=%s tag=%s" %
+                               (current_stream_pos, length, stream_len, tag))
+            if tag == ASN_U_SEQUENCE or tag == ASN_SNMP_RESPONSE or tag == ASN_SNMP_GETBULK:
+                # truncated message. decode available part
+                tmp_list_val, _ = sequence_decode_c(stream_char, stream_len - current_stream_pos, as_oid)
+                objects.append(tmp_list_val)
+            return objects, ex
 
         if tag == ASN_U_INTEGER:
             tmp_int_val = integer_decode_c(stream_char, &length)
@@ -630,6 +945,11 @@ cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_le
                 or tag == ASN_A_GAUGE32 or tag == ASN_A_COUNTER64 or tag == ASN_A_TIMETICKS:
             tmp_uint_val = uinteger_decode_c(stream_char, &length)
             objects.append(tmp_uint_val)
+        elif tag == ASN_U_OBJECTID and as_oid:
+            try:
+                objects.append(oid_from_ber(stream_char, length))
+            except SNMPException as e:
+                return objects, e
         elif tag == ASN_U_OBJECTID:
             ret = objectid_decode_str(stream_char, length, ret_str, &ret_length)
             if ret != 0:
@@ -641,7 +961,7 @@ cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_le
         elif tag == ASN_U_NULL:
             objects.append(None)
         elif tag == ASN_U_SEQUENCE or tag == ASN_SNMP_RESPONSE or tag == ASN_SNMP_GETBULK:
-            tmp_list_val, ex = sequence_decode_c(stream_char, length)
+            tmp_list_val, ex = sequence_decode_c(stream_char, length, as_oid)
             if tmp_list_val is not None:
                 objects.append(tmp_list_val)
             if ex:
@@ -650,7 +970,7 @@ cdef tuple sequence_decode_c(const unsigned char *stream, const size_t stream_le
             bytes_val = <bytes> stream_char[:length]
             objects.append(bytes_val)
         elif tag == ASN_A_OPAQUE:
-            opaque_obj, ex = sequence_decode_c(stream_char, length)
+            opaque_obj, ex = sequence_decode_c(stream_char, length, as_oid)
             if opaque_obj and len(opaque_obj) != 1:
                 return objects, SNMPException("opaque len %s != 1" % len(opaque_obj))
             objects.append(opaque_obj[0])
@@ -788,45 +1108,442 @@ def value_encode(value=None, value_type='Null'):
         raise NotImplementedError('not implement coder for %s' % type(value))
 
 
-def encode_varbind(oid, value_type='Null', value=None):
+# single buffer encoder. sizes are computed in the first pass, message is written in the second one
+
+cdef struct varbind_enc:
+    const char *oid
+    Py_ssize_t oid_str_len
+    # encoded Oid
+    const char *oid_encoded
+    size_t oid_len
+    uint8_t value_type
+    const char *value
+    size_t value_len
+    size_t content_len
+    char value_buf[MAX_INT_LEN]
+
+
+cdef inline size_t length_size(size_t length) noexcept:
+    cdef size_t octets = 1
+    if length <= 127:
+        return 1
+    while length > 0:
+        length >>= 8
+        octets += 1
+    return octets
+
+
+cdef inline size_t tlv_size(size_t length) noexcept:
+    return 1 + length_size(length) + length
+
+
+cdef inline unsigned char *tl_write(unsigned char *out, unsigned char tag, size_t length) noexcept:
+    out[0] = tag
+    return out + 1 + length_encode_c(length, out + 1)
+
+
+cdef inline size_t primitive7_size(uint64_t value) noexcept:
+    cdef size_t size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+cdef int oid_parse_c(const char *oid, Py_ssize_t oid_len, uint64_t *subids, uint32_t *subids_len) noexcept:
+    """
+    Parse dotted OID to sub-identifiers. Leading and trailing dots are ignored
+    """
+    cdef Py_ssize_t pos = 0
+    cdef uint32_t count = 0
+    cdef uint64_t subid
+    cdef bint digits
+    while oid_len > 0 and oid[oid_len - 1] == c'.':
+        oid_len -= 1
+    while pos < oid_len and oid[pos] == c'.':
+        pos += 1
+    while pos < oid_len:
+        if count == MAX_OID_LEN:
+            return -2  # too long OID
+        subid = 0
+        digits = False
+        while pos < oid_len and oid[pos] != c'.':
+            if oid[pos] < c'0' or oid[pos] > c'9':
+                return -1  # wrong OID
+            if subid > (<uint64_t>INT64_MAX - 9) // 10:
+                return -3  # too long sub-identifier
+            subid = subid * 10 + (oid[pos] - c'0')
+            digits = True
+            pos += 1
+        if not digits:
+            return -1
+        subids[count] = subid
+        count += 1
+        pos += 1
+    if count < 2:
+        return -1
+    subids_len[0] = count
+    return 0
+
+
+cdef int value_prepare(varbind_enc *vb, value_type, value, list keep) except -1:
+    cdef uint64_t uvalue
+    cdef int64_t ivalue
+    cdef uint64_t value_len = 0
     if value is None:
-        value_type = 'Null'
-    obj_id_value = objectid_encode(oid)
-    obj_id_type = ASN_U_OBJECTID_BYTE
-    obj_id_len = length_encode(len(obj_id_value))
+        vb.value_type = ASN_U_NULL
+        vb.value = NULL
+        vb.value_len = 0
+    elif value_type == "Null":
+        raise SNMPException('value must be None for Null type!')
+    elif value_type == "Integer":
+        ivalue = value
+        integer_encode_c(ivalue, vb.value_buf, &value_len)
+        vb.value_type = ASN_U_INTEGER
+        vb.value = vb.value_buf
+        vb.value_len = value_len
+    elif value_type == "Counter64":
+        uvalue = value
+        vb.value_len = primitive_size(uvalue)
+        primitive_encode(&uvalue, vb.value_len, vb.value_buf)
+        vb.value_type = ASN_A_COUNTER64
+        vb.value = vb.value_buf
+    elif value_type == "OctetString":
+        encoded = value.encode()
+        keep.append(encoded)
+        vb.value_type = ASN_U_OCTETSTRING
+        vb.value = PyBytes_AS_STRING(encoded)
+        vb.value_len = PyBytes_GET_SIZE(encoded)
+    else:
+        raise NotImplementedError('not implement coder for %s' % type(value))
+    return 0
+
+
+cdef int varbind_prepare(varbind_enc *vb, varbind, list keep) except -1:
+    """
+    Validate varbind and compute its size. Encoded values which are not fit in varbind_enc are kept in keep
+    """
+    cdef uint64_t subids[MAX_OID_LEN]
+    cdef uint32_t subids_len = 0, i
+    cdef int ret
+
+    value = None
+    value_type = "Null"
+    if isinstance(varbind, (str, Oid)):
+        oid = varbind
+    elif len(varbind) == 3:
+        oid, value_type, value = varbind
+    elif len(varbind) == 2:
+        oid, value_type = varbind
+    else:
+        raise SNMPException("unexpected varbind %r" % (varbind,))
+
+    if isinstance(oid, Oid):
+        encoded = (<Oid> oid).encoded
+        keep.append(encoded)
+        vb.oid_encoded = PyBytes_AS_STRING(encoded)
+        vb.oid_len = PyBytes_GET_SIZE(encoded)
+    elif isinstance(oid, str):
+        vb.oid_encoded = NULL
+        vb.oid = PyUnicode_AsUTF8AndSize(oid, &vb.oid_str_len)
+        ret = oid_parse_c(vb.oid, vb.oid_str_len, subids, &subids_len)
+        if ret == -1:
+            # slow path keeps errors of int() for malformed sub-identifiers
+            oid = ".".join([str(int(subid)) for subid in oid.strip(".").split(".")])
+            vb.oid = PyUnicode_AsUTF8AndSize(oid, &vb.oid_str_len)
+            ret = oid_parse_c(vb.oid, vb.oid_str_len, subids, &subids_len)
+            if ret == -1:
+                raise ValueError("wrong OID %r" % oid)
+        keep.append(oid)
+        if ret == -2:
+            raise SNMPException("OID %r is too long" % oid)
+        elif ret == -3:
+            raise OverflowError("value too long")
+        sid12_check(subids[0], subids[1])
+    else:
+        raise TypeError("expected oid in str or Oid. got %r" % (oid,))
 
-    obj_value_value = value_encode(value, value_type)
-    obj_value_type = TYPE_NAME_TO_TYPE[value_type]
-    obj_value_len = length_encode(len(obj_value_value))
+    value_prepare(vb, value_type, value, keep)
+
+    if vb.oid_encoded == NULL:
+        vb.oid_len = 1
+        for i in range(2, subids_len):
+            vb.oid_len += primitive7_size(subids[i])
+    vb.content_len = tlv_size(vb.oid_len) + tlv_size(vb.value_len)
+    return 0
 
-    varbinds_obj = obj_id_type + obj_id_len + obj_id_value + obj_value_type + obj_value_len + obj_value_value
 
-    seq_tag = ASN_U_SEQUENCE_BYTE
-    varbind_enc = seq_tag + length_encode(len(varbinds_obj)) + varbinds_obj
-    return varbind_enc
+cdef unsigned char *varbind_write(varbind_enc *vb, unsigned char *out) noexcept:
+    cdef uint64_t subids[MAX_OID_LEN]
+    cdef uint32_t subids_len = 0
+    cdef size_t oid_len = 0
+    out = tl_write(out, ASN_U_SEQUENCE, vb.content_len)
+    out = tl_write(out, ASN_U_OBJECTID, vb.oid_len)
+    if vb.oid_encoded != NULL:
+        memcpy(out, vb.oid_encoded, vb.oid_len)
+    else:
+        # OID is validated by varbind_prepare()
+        oid_parse_c(vb.oid, vb.oid_str_len, subids, &subids_len)
+        objectid_encode_array(subids, subids_len, <char *> out, &oid_len)
+    out += vb.oid_len
+    out = tl_write(out, vb.value_type, vb.value_len)
+    if vb.value_len:
+        memcpy(out, vb.value, vb.value_len)
+    return out + vb.value_len
+
+
+cdef class VarBindsEncoder:
+    """
+    Prepared varbinds of one message
+    """
+    cdef varbind_enc *vbs
+    cdef size_t count
+    # sum of varbind TLVs
+    cdef size_t data_len
+    # referenced strings and encoded values
+    cdef list keep
+
+    def __cinit__(self, varbinds):
+        cdef size_t i
+        varbinds = tuple(varbinds)
+        self.count = len(varbinds)
+        self.vbs = <varbind_enc *> calloc(self.count or 1, sizeof(varbind_enc))
+        if self.vbs == NULL:
+            raise MemoryError()
+        self.keep = []
+        self.data_len = 0
+        for i in range(self.count):
+            varbind_prepare(&self.vbs[i], varbinds[i], self.keep)
+            self.data_len += tlv_size(self.vbs[i].content_len)
+
+    def __dealloc__(self):
+        free(self.vbs)
+
+    cdef unsigned char *write(self, unsigned char *out) noexcept:
+        cdef size_t i
+        for i in range(self.count):
+            out = varbind_write(&self.vbs[i], out)
+        return out
+
+
+cdef class MessageEncoder:
+    """
+    Prepared SNMP-message
+    """
+    cdef VarBindsEncoder varbinds
+    cdef const unsigned char[::1] varbinds_tlv
+    cdef bytes community
+    cdef unsigned char pdu_type
+    cdef char req_id_value[MAX_INT_LEN]
+    cdef uint64_t req_id_len
+    cdef char non_repeaters_value[MAX_INT_LEN]
+    cdef uint64_t non_repeaters_len
+    cdef char max_repetitions_value[MAX_INT_LEN]
+    cdef uint64_t max_repetitions_len
+    cdef size_t varbinds_data_len, pdu_len, msg_len
+    cdef readonly size_t size
+
+    def __cinit__(self, int64_t req_id, community, varbinds, msg_type, int64_t max_repetitions, int64_t non_repeaters):
+        cdef size_t varbinds_len
+        if isinstance(varbinds, (list, tuple)):
+            self.varbinds = VarBindsEncoder(varbinds)
+            self.varbinds_data_len = self.varbinds.data_len
+            varbinds_len = tlv_size(self.varbinds_data_len)
+        else:
+            self.varbinds_tlv = varbinds
+            varbinds_len = self.varbinds_tlv.shape[0]
+        integer_encode_c(req_id, self.req_id_value, &self.req_id_len)
+        if msg_type == "GetBulk":
+            if max_repetitions < 1:
+                raise SNMPException("max_repetitions must be higher than %s" % max_repetitions)
+            integer_encode_c(non_repeaters, self.non_repeaters_value, &self.non_repeaters_len)
+            integer_encode_c(max_repetitions, self.max_repetitions_value, &self.max_repetitions_len)
+            self.pdu_type = ASN_SNMP_GETBULK
+        else:
+            # error_status and error_index are 0
+            self.non_repeaters_value[0] = 0
+            self.non_repeaters_len = 1
+            self.max_repetitions_value[0] = 0
+            self.max_repetitions_len = 1
+            self.pdu_type = (<bytes> ASN_SNMP_MSG_TYPES[msg_type])[0]
+        self.community = octetstring_encode(community)
+
+        self.pdu_len = tlv_size(self.req_id_len) + tlv_size(self.non_repeaters_len) + \
+                       tlv_size(self.max_repetitions_len) + varbinds_len
+        self.msg_len = 3 + tlv_size(PyBytes_GET_SIZE(self.community)) + tlv_size(self.pdu_len)
+        self.size = tlv_size(self.msg_len)
+
+    cdef void write(self, unsigned char *out) noexcept:
+        cdef size_t community_len = PyBytes_GET_SIZE(self.community)
+        out = tl_write(out, ASN_U_SEQUENCE, self.msg_len)
+        # version v2c
+        out = tl_write(out, ASN_U_INTEGER, 1)
+        out[0] = 1
+        out += 1
+        out = tl_write(out, ASN_U_OCTETSTRING, community_len)
+        memcpy(out, PyBytes_AS_STRING(self.community), community_len)
+        out += community_len
+        out = tl_write(out, self.pdu_type, self.pdu_len)
+        out = tl_write(out, ASN_U_INTEGER, self.req_id_len)
+        memcpy(out, self.req_id_value, self.req_id_len)
+        out += self.req_id_len
+        out = tl_write(out, ASN_U_INTEGER, self.non_repeaters_len)
+        memcpy(out, self.non_repeaters_value, self.non_repeaters_len)
+        out += self.non_repeaters_len
+        out = tl_write(out, ASN_U_INTEGER, self.max_repetitions_len)
+        memcpy(out, self.max_repetitions_value, self.max_repetitions_len)
+        out += self.max_repetitions_len
+        if self.varbinds is not None:
+            out = tl_write(out, ASN_U_SEQUENCE, self.varbinds_data_len)
+            self.varbinds.write(out)
+        else:
+            memcpy(out, &self.varbinds_tlv[0], self.varbinds_tlv.shape[0])
+
+
+def encode_varbind(oid, value_type='Null', value=None):
+    cdef VarBindsEncoder encoder = VarBindsEncoder(((oid, value_type, value),))
+    cdef bytes res = PyBytes_FromStringAndSize(NULL, encoder.data_len)
+    encoder.write(<unsigned char *> PyBytes_AS_STRING(res))
+    return res
 
 
 def varbinds_encode(varbinds):
-    res = bytearray()
-    for varbind in varbinds:
-        if isinstance(varbind, str):
-            oid = varbind
-            value = None
-            value_type = "Null"
-        elif len(varbind) == 3:
-            oid, value_type, value = varbind
-        elif len(varbind) == 2:
-            oid, value_type = varbind
-            value = None
-        res += encode_varbind(oid, value_type, value)
+    cdef VarBindsEncoder encoder = VarBindsEncoder(varbinds)
+    cdef bytearray res = PyByteArray_FromStringAndSize(NULL, encoder.data_len)
+    encoder.write(<unsigned char *> PyByteArray_AS_STRING(res))
     return res
 
 
 def varbinds_encode_tlv(varbinds):
-    varbinds_data = varbinds_encode(varbinds)
-    varbinds_type = ASN_U_SEQUENCE_BYTE
-    varbinds_len = length_encode(len(varbinds_data))
-    return varbinds_type + varbinds_len + varbinds_data
+    cdef VarBindsEncoder encoder = VarBindsEncoder(varbinds)
+    cdef bytes res = PyBytes_FromStringAndSize(NULL, tlv_size(encoder.data_len))
+    cdef unsigned char *res_ptr = <unsigned char *> PyBytes_AS_STRING(res)
+    encoder.write(tl_write(res_ptr, ASN_U_SEQUENCE, encoder.data_len))
+    return res
+
+
+cdef inline size_t length_encode_c(size_t length, unsigned char *data):
+    # same as length_encode()
+    cdef size_t octets = 0, tmp_length = length, i
+    if length <= 127:
+        data[0] = <unsigned char> length
+        return 1
+    while tmp_length > 0:
+        tmp_length >>= 8
+        octets += 1
+    data[0] = <unsigned char> (0x80 | octets)
+    for i in range(octets):
+        data[octets - i] = <unsigned char> (length & 0xff)
+        length >>= 8
+    return octets + 1
+
+
+cdef class RequestTemplate:
+    """
+    SNMP-message compiled once. encode() builds message for new request identifier
+    by patching only request identifier and lengths around it
+
+    :param community: snmp community
+    :type community: string
+    :param varbinds: list of oid to encode or bytes if encoded
+    :type varbinds: tuple
+    :param msg_type: index of ASN_SNMP_MSG_TYPES
+    :type msg_type: str
+    :param max_repetitions: max repetitions
+    :type max_repetitions: int
+    :param non_repeaters: non repeaters
+    :type non_repeaters: int
+    """
+    # version and community
+    cdef readonly bytes head
+    # PDU after request identifier
+    cdef readonly bytes tail
+    cdef unsigned char pdu_type
+
+    def __init__(self, community, varbinds, msg_type="GetBulk", max_repetitions=10, non_repeaters=0):
+        if isinstance(varbinds, (list, tuple)):
+            varbinds_tlv = varbinds_encode_tlv(varbinds)
+        else:
+            varbinds_tlv = varbinds
+
+        if msg_type == "GetBulk":
+            if max_repetitions < 1:
+                raise SNMPException("max_repetitions must be higher than %s" % max_repetitions)
+            non_repeaters_value = integer_encode(non_repeaters)
+            max_repetitions_value = integer_encode(max_repetitions)
+            self.tail = ASN_U_INTEGER_BYTE + length_encode(len(non_repeaters_value)) + non_repeaters_value + \
+                        ASN_U_INTEGER_BYTE + length_encode(len(max_repetitions_value)) + max_repetitions_value + \
+                        varbinds_tlv
+            pdu_type = ASN_SNMP_GETBULK_BYTE
+        else:
+            # error_status and error_index are 0
+            self.tail = ASN_U_INTEGER_BYTE + INT_1 + INT_0 + \
+                        ASN_U_INTEGER_BYTE + INT_1 + INT_0 + \
+                        varbinds_tlv
+            pdu_type = ASN_SNMP_MSG_TYPES[msg_type]
+        self.pdu_type = pdu_type[0]
+
+        community_value = octetstring_encode(community)
+        self.head = ASN_U_INTEGER_BYTE + INT_1 + INT_1 + \
+                    ASN_U_OCTETSTRING_BYTE + length_encode(len(community_value)) + community_value
+
+    cdef size_t message_size(self, size_t req_id_len) noexcept:
+        return tlv_size(PyBytes_GET_SIZE(self.head) + tlv_size(tlv_size(req_id_len) + PyBytes_GET_SIZE(self.tail)))
+
+    cdef void write(self, unsigned char *out, const char *req_id_value, size_t req_id_len) noexcept:
+        cdef size_t head_len = PyBytes_GET_SIZE(self.head)
+        cdef size_t tail_len = PyBytes_GET_SIZE(self.tail)
+        cdef size_t pdu_len = tlv_size(req_id_len) + tail_len
+        out = tl_write(out, ASN_U_SEQUENCE, head_len + tlv_size(pdu_len))
+        memcpy(out, PyBytes_AS_STRING(self.head), head_len)
+        out += head_len
+        out = tl_write(out, self.pdu_type, pdu_len)
+        out = tl_write(out, ASN_U_INTEGER, req_id_len)
+        memcpy(out, req_id_value, req_id_len)
+        out += req_id_len
+        memcpy(out, PyBytes_AS_STRING(self.tail), tail_len)
+
+    def encode(self, const int64_t req_id):
+        """
+        Build SNMP-message
+
+        :param req_id: request identifier
+        :type req_id: int
+        :returns: encoded message
+        :rtype: bytes
+        """
+        cdef char[MAX_INT_LEN] req_id_value
+        cdef uint64_t req_id_len = 0
+        cdef bytes res
+
+        integer_encode_c(req_id, req_id_value, &req_id_len)
+        res = PyBytes_FromStringAndSize(NULL, self.message_size(req_id_len))
+        self.write(<unsigned char *> PyBytes_AS_STRING(res), req_id_value, req_id_len)
+        return res
+
+    def encode_into(self, buffer, size_t offset, const int64_t req_id):
+        """
+        Build SNMP-message into writable buffer
+
+        :param buffer: any writable object with buffer protocol: bytearray, memoryview
+        :param offset: position of message in buffer
+        :type offset: int
+        :param req_id: request identifier
+        :type req_id: int
+        :returns: length of message
+        :rtype: int
+        """
+        cdef unsigned char[::1] buffer_view = buffer
+        cdef char[MAX_INT_LEN] req_id_value
+        cdef uint64_t req_id_len = 0
+        cdef size_t size
+
+        integer_encode_c(req_id, req_id_value, &req_id_len)
+        size = self.message_size(req_id_len)
+        if offset > <size_t> buffer_view.shape[0] or size > buffer_view.shape[0] - offset:
+            raise ValueError("buffer is too small for message of %s bytes" % size)
+        self.write(&buffer_view[0] + offset, req_id_value, req_id_len)
+        return size
 
 
 def msg_encode(req_id, community, varbinds, msg_type="GetBulk", max_repetitions=10, non_repeaters=0):
@@ -848,87 +1565,534 @@ def msg_encode(req_id, community, varbinds, msg_type="GetBulk", max_repetitions=
     :returns: encoded message
     :rtype: bytes
     """
-    if isinstance(varbinds, (list, tuple)):
-        varbinds_tlv = varbinds_encode_tlv(varbinds)
-    else:
-        varbinds_tlv = varbinds
-    request_id_type = ASN_U_INTEGER_BYTE
-    request_id_value = integer_encode(req_id)
-    request_id_len = length_encode(len(request_id_value))
-
-    if msg_type == "GetBulk":
-        if max_repetitions < 1:
-            raise SNMPException("max_repetitions must be higher than %s" % max_repetitions)
-        non_repeaters_value = integer_encode(non_repeaters)
-        non_repeaters_type = ASN_U_INTEGER_BYTE
-        non_repeaters_len = length_encode(len(non_repeaters_value))
-        max_repetitions_value = integer_encode(max_repetitions)
-        max_repetitions_type = ASN_U_INTEGER_BYTE
-        max_repetitions_len = length_encode(len(max_repetitions_value))
-        pdu = request_id_type + request_id_len + request_id_value + \
-              non_repeaters_type + non_repeaters_len + non_repeaters_value + \
-              max_repetitions_type + max_repetitions_len + max_repetitions_value + \
-              varbinds_tlv
-        pdu_type = ASN_SNMP_GETBULK_BYTE
-    else:
-        error_status_value = INT_0  # integer_encode(0)
-        error_status_type = ASN_U_INTEGER_BYTE
-        error_status_len = length_encode(len(error_status_value))
-        error_index_value = INT_0  # integer_encode(0)
-        error_index_type = ASN_U_INTEGER_BYTE
-        error_index_len = length_encode(len(error_index_value))
-        pdu = request_id_type + request_id_len + request_id_value + \
-              error_status_type + error_status_len + error_status_value + \
-              error_index_type + error_index_len + error_index_value + \
-              varbinds_tlv
-        pdu_type = ASN_SNMP_MSG_TYPES[msg_type]
-
-    pdu_len = length_encode(len(pdu))
-
-    community_value = octetstring_encode(community)
-    community_type = ASN_U_OCTETSTRING_BYTE
-    community_len = length_encode(len(community_value))
-
-    version_value = INT_1  # v2c
-    version_type = ASN_U_INTEGER_BYTE
-    version_len = INT_1  # length_encode(len(version_value))
-
-    snmp_message_type = ASN_U_SEQUENCE_BYTE
-    snmp_message_value = version_type + version_len + version_value + \
-                         community_type + community_len + community_value + \
-                         pdu_type + pdu_len + pdu
-    snmp_message_len = length_encode(len(snmp_message_value))
-    return snmp_message_type + snmp_message_len + snmp_message_value
-
-
-def msg_decode(stream):
+    cdef MessageEncoder encoder = MessageEncoder(req_id, community, varbinds, msg_type, max_repetitions, non_repeaters)
+    cdef bytes res = PyBytes_FromStringAndSize(NULL, encoder.size)
+    encoder.write(<unsigned char *> PyBytes_AS_STRING(res))
+    return res
+
+
+def msg_encode_into(buffer, size_t offset, req_id, community, varbinds, msg_type="GetBulk", max_repetitions=10,
+                    non_repeaters=0):
+    """
+    Build SNMP-message into writable buffer. Same as msg_encode()
+
+    :param buffer: any writable object with buffer protocol: bytearray, memoryview
+    :param offset: position of message in buffer
+    :type offset: int
+    :returns: length of message
+    :rtype: int
+    """
+    cdef unsigned char[::1] buffer_view = buffer
+    cdef MessageEncoder encoder = MessageEncoder(req_id, community, varbinds, msg_type, max_repetitions, non_repeaters)
+    if offset > <size_t> buffer_view.shape[0] or encoder.size > buffer_view.shape[0] - offset:
+        raise ValueError("buffer is too small for message of %s bytes" % encoder.size)
+    encoder.write(&buffer_view[0] + offset)
+    return encoder.size
+
+
+# two phase decoder. msg_scan() parses message into flat array without GIL,
+# msg_materialize() builds python objects from it
+
+DEF SCAN_OK = 0
+# message is not in common form. it is decoded by sequence_decode_c()
+DEF SCAN_GENERIC = -1
+DEF SCAN_NO_MEMORY = -2
+DEF SCAN_INITIAL_CAPACITY = 64
+
+# value is decoded by sequence_decode_c()
+DEF VALUE_GENERIC = 0xffffffff
+
+
+cdef struct scan_varbind:
+    const unsigned char *oid
+    size_t oid_len
+    uint64_t tag
+    # value TLV
+    const unsigned char *tlv
+    size_t tlv_len
+    # value without tag and length
+    const unsigned char *value
+    size_t value_len
+    int64_t int_value
+    uint64_t uint_value
+
+
+cdef struct scan_msg:
+    int status
+    int64_t req_id
+    int64_t error_status
+    int64_t error_index
+    size_t count
+    size_t capacity
+    scan_varbind *varbinds
+
+
+cdef inline const unsigned char *scan_tl(const unsigned char *stream, const unsigned char *end, uint64_t *tag,
+                                         size_t *length) noexcept nogil:
+    """
+    Read tag in low-tag-number form and length. Returns position of value or NULL
+    """
+    cdef size_t octets, i
+    if end - stream < 2:
+        return NULL
+    tag[0] = stream[0]
+    if tag[0] & 0x1F == 0x1F:
+        return NULL
+    length[0] = stream[1]
+    stream += 2
+    if length[0] & 0x80:
+        octets = length[0] & 0x7f
+        if octets > 8 or <size_t>(end - stream) < octets:
+            return NULL
+        length[0] = 0
+        for i in range(octets):
+            length[0] = length[0] << 8 | stream[i]
+        stream += octets
+    if <size_t>(end - stream) < length[0]:
+        return NULL
+    return stream
+
+
+cdef inline const unsigned char *scan_integer(const unsigned char *stream, const unsigned char *end,
+                                              int64_t *value) noexcept nogil:
+    cdef uint64_t tag
+    cdef size_t length
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL or tag != ASN_U_INTEGER or length == 0:
+        return NULL
+    value[0] = integer_decode_c(stream, &length)
+    return stream + length
+
+
+cdef int msg_scan(const unsigned char *stream, size_t stream_len, scan_msg *msg) noexcept nogil:
+    """
+    Parse SNMP-message into msg. Sets msg.status
+    """
+    cdef const unsigned char *end = stream + stream_len
+    cdef const unsigned char *pdu_end
+    cdef const unsigned char *varbind_end
+    cdef const unsigned char *value_end
+    cdef scan_varbind *varbind
+    cdef scan_varbind *new_varbinds
+    cdef uint64_t tag
+    cdef size_t length
+    cdef int64_t version
+
+    msg.status = SCAN_GENERIC
+    msg.count = 0
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL or tag != ASN_U_SEQUENCE:
+        return msg.status
+    # bytes after message are ignored
+    end = stream + length
+    stream = scan_integer(stream, end, &version)
+    if stream == NULL:
+        return msg.status
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL or tag != ASN_U_OCTETSTRING:
+        return msg.status
+    stream += length
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL or (tag != ASN_SNMP_RESPONSE and tag != ASN_SNMP_GETBULK) or stream + length != end:
+        return msg.status
+    stream = scan_integer(stream, end, &msg.req_id)
+    if stream == NULL:
+        return msg.status
+    stream = scan_integer(stream, end, &msg.error_status)
+    if stream == NULL:
+        return msg.status
+    stream = scan_integer(stream, end, &msg.error_index)
+    if stream == NULL:
+        return msg.status
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL or tag != ASN_U_SEQUENCE or stream + length != end:
+        return msg.status
+
+    while stream < end:
+        if msg.count == msg.capacity:
+            msg.capacity = msg.capacity * 2 if msg.capacity else SCAN_INITIAL_CAPACITY
+            new_varbinds = <scan_varbind *> realloc(msg.varbinds, msg.capacity * sizeof(scan_varbind))
+            if new_varbinds == NULL:
+                msg.status = SCAN_NO_MEMORY
+                return msg.status
+            msg.varbinds = new_varbinds
+        varbind = &msg.varbinds[msg.count]
+
+        stream = scan_tl(stream, end, &tag, &length)
+        if stream == NULL or tag != ASN_U_SEQUENCE:
+            return msg.status
+        varbind_end = stream + length
+        stream = scan_tl(stream, varbind_end, &tag, &length)
+        if stream == NULL or tag != ASN_U_OBJECTID:
+            return msg.status
+        varbind.oid = stream
+        varbind.oid_len = length
+        stream += length
+
+        varbind.tlv = stream
+        value_end = scan_tl(stream, varbind_end, &tag, &length)
+        if value_end == NULL:
+            # high tag number form
+            varbind.tag = VALUE_GENERIC
+            varbind.tlv_len = varbind_end - stream
+            varbind.value = stream
+            varbind.value_len = varbind.tlv_len
+            stream = varbind_end
+        else:
+            varbind.tag = tag
+            varbind.value = value_end
+            varbind.value_len = length
+            stream = value_end + length
+            varbind.tlv_len = stream - varbind.tlv
+            if stream != varbind_end:
+                return msg.status
+            if tag == ASN_U_INTEGER:
+                if length == 0:
+                    return msg.status
+                varbind.int_value = integer_decode_c(varbind.value, &length)
+            elif tag == ASN_A_COUNTER32 or tag == ASN_A_UNSIGNED32 \
+                    or tag == ASN_A_GAUGE32 or tag == ASN_A_COUNTER64 or tag == ASN_A_TIMETICKS:
+                varbind.uint_value = uinteger_decode_c(varbind.value, &length)
+            elif tag != ASN_U_OBJECTID and tag != ASN_U_NULL and tag != ASN_U_OCTETSTRING \
+                    and tag != ASN_A_IPADDRESS and tag != ASN_U_NO_SUCH_OBJECT \
+                    and tag != ASN_U_NO_SUCH_INSTANCE and tag != ASN_U_END_OF_MIB_VIEW:
+                varbind.tag = VALUE_GENERIC
+        msg.count += 1
+
+    msg.status = SCAN_OK
+    return msg.status
+
+
+cdef object msg_materialize(scan_msg *msg, bint as_oid, ResponseColumns columns=None):
+    """
+    Build result of msg_decode() from scanned message. Returns None if message should be decoded by
+    sequence_decode_c() to get the same result or exception
+    """
+    cdef char ret_str[MAX_OID_LEN_STR]
+    cdef size_t ret_length, i
+    cdef int ret
+    cdef scan_varbind *varbind
+    cdef value_converter *conv
+    cdef list varbinds = []
+    for i in range(msg.count):
+        varbind = &msg.varbinds[i]
+        conv = column_converter(columns, i)
+        if as_oid:
+            try:
+                oid = oid_from_ber(varbind.oid, varbind.oid_len)
+            except SNMPException:
+                return None
+        else:
+            ret = objectid_decode_str(varbind.oid, varbind.oid_len, ret_str, &ret_length)
+            if ret != 0 or ret_length > MAX_OID_LEN_STR:
+                return None
+            oid = PyUnicode_DecodeASCII(ret_str, ret_length, 'ignore')
+
+        if conv != NULL and converter_applies(conv, varbind.tag):
+            value = value_convert_c(conv, varbind.tag, varbind.value, varbind.value_len)
+        elif varbind.tag == ASN_U_INTEGER:
+            value = varbind.int_value
+        elif varbind.tag == ASN_A_COUNTER32 or varbind.tag == ASN_A_UNSIGNED32 \
+                or varbind.tag == ASN_A_GAUGE32 or varbind.tag == ASN_A_COUNTER64 or varbind.tag == ASN_A_TIMETICKS:
+            value = varbind.uint_value
+        elif varbind.tag == ASN_U_OCTETSTRING or varbind.tag == ASN_A_IPADDRESS:
+            value = <bytes> varbind.value[:varbind.value_len]
+        elif varbind.tag == ASN_U_END_OF_MIB_VIEW:
+            value = end_of_mib_view
+        elif varbind.tag == ASN_U_NULL or varbind.tag == ASN_U_NO_SUCH_OBJECT \
+                or varbind.tag == ASN_U_NO_SUCH_INSTANCE:
+            value = None
+        else:
+            objects, ex = sequence_decode_c(varbind.tlv, varbind.tlv_len, as_oid)
+            if ex or len(objects) != 1:
+                return None
+            value = objects[0]
+        varbinds.append([oid, value])
+    return msg.req_id, msg.error_status, msg.error_index, varbinds
+
+
+cdef tuple msg_decode_generic(const unsigned char *stream_ptr, size_t stream_len, bint as_oid):
     cdef uint64_t tag=0
-    cdef size_t encode_length, length
-    cdef const unsigned char *stream_char = stream
-    cdef const unsigned char *stream_ptr = stream_char
-    cdef size_t stream_len = len(stream)
+    cdef size_t encode_length, length_c
     cdef list data
 
+    if stream_len < 2:
+        raise SNMPException("message is too short")
+
     tag_decode_c(stream_ptr, &tag, &encode_length)
     stream_ptr += encode_length
-    length_decode_c(stream_ptr, &length, &encode_length)
+    stream_len -= encode_length
+    length_decode_c(stream_ptr, &length_c, &encode_length)
     stream_ptr += encode_length
-    ret, ex = sequence_decode_c(stream_ptr, length)
+    if encode_length > stream_len:
+        raise SNMPException("message is too short")
+    stream_len -= encode_length
+    truncated = length_c > stream_len
+    if truncated:
+        length_c = stream_len
+    ret, ex = sequence_decode_c(stream_ptr, length_c, as_oid)
     try:
         snmp_ver, community, data = ret
         req_id, error_status, error_index, varbinds = data
     except:
         if ex:
             raise ex
+        if truncated:
+            raise SNMPException("message is truncated")
         raise
     else:
         if ex:
             raise DecodeException(data) from ex
+        if truncated:
+            # cut at element boundary. decoded part is in exception
+            raise DecodeException(data) from SNMPException("message is truncated")
 
     return req_id, error_status, error_index, varbinds
 
-def check_is_growing(str oid_start not None, str oid_finish not None):
+
+cdef array.array scan_types(scan_msg *msg):
+    """
+    Type codes of scanned varbinds
+    """
+    cdef array.array types = array.clone(type_codes_template, msg.count, zero=False)
+    cdef size_t i
+    for i in range(msg.count):
+        types.data.as_uchars[i] = msg.varbinds[i].tlv[0]
+    return types
+
+
+cdef array.array generic_types(const unsigned char *stream, size_t stream_len, size_t count):
+    """
+    Type codes of varbinds of message in any form accepted by sequence_decode_c().
+    Types which are not reachable by tag and length are unknown
+    """
+    cdef array.array types = array.clone(type_codes_template, count, zero=True)
+    cdef const unsigned char *end = stream + stream_len
+    cdef const unsigned char *varbind_end
+    cdef uint64_t tag
+    cdef size_t length, i
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL:
+        return types
+    end = stream + length
+    # version and community
+    for i in range(2):
+        stream = scan_tl(stream, end, &tag, &length)
+        if stream == NULL:
+            return types
+        stream += length
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL:
+        return types
+    end = stream + length
+    # req_id, error_status and error_index
+    for i in range(3):
+        stream = scan_tl(stream, end, &tag, &length)
+        if stream == NULL:
+            return types
+        stream += length
+    stream = scan_tl(stream, end, &tag, &length)
+    if stream == NULL:
+        return types
+    end = stream + length
+    for i in range(count):
+        stream = scan_tl(stream, end, &tag, &length)
+        if stream == NULL:
+            return types
+        varbind_end = stream + length
+        stream = scan_tl(stream, varbind_end, &tag, &length)
+        if stream == NULL or stream + length >= varbind_end:
+            return types
+        types.data.as_uchars[i] = stream[length]
+        stream = varbind_end
+    return types
+
+
+cdef tuple msg_decode_scanned(scan_msg *msg, const unsigned char *stream_ptr, size_t stream_len, bint as_oid,
+                              bint with_types=False, dict columns=None):
+    cdef object res
+    cdef tuple generic_res
+    cdef value_converter *conv
+    cdef Py_ssize_t i
+    if msg.status == SCAN_OK:
+        res = msg_materialize(msg, as_oid, columns.get(msg.req_id) if columns else None)
+        if res is not None:
+            if with_types:
+                return res + (scan_types(msg),)
+            return res
+    elif msg.status == SCAN_NO_MEMORY:
+        raise MemoryError()
+    generic_res = msg_decode_generic(stream_ptr, stream_len, as_oid)
+    if columns:
+        req_columns = columns.get(generic_res[0])
+        for i, varbind in enumerate(generic_res[3]):
+            conv = column_converter(req_columns, i)
+            if conv != NULL:
+                varbind[1] = value_convert_obj(conv, varbind[1])
+    if with_types:
+        return generic_res + (generic_types(stream_ptr, stream_len, len(generic_res[3])),)
+    return generic_res
+
+
+def msg_decode(stream, size_t offset=0, length=None, bint as_oid=False, bint with_types=False, dict columns=None):
+    """
+    Decode SNMP-message
+
+    :param stream: encoded message. any object with buffer protocol: bytes, bytearray, memoryview
+    :param offset: position of message in stream
+    :type offset: int
+    :param length: length of message. rest of stream if None
+    :type length: int
+    :param as_oid: return OIDs as Oid instead of str
+    :type as_oid: bool
+    :param with_types: return type codes (TYPE_*) of values as array.array('B') after varbinds
+    :type with_types: bool
+    :param columns: request identifier => ResponseColumns. its converters are applied to values
+        in round-robin order of main OIDs
+    :type columns: dict
+    :returns: req_id, error_status, error_index, varbinds[, types]
+    :rtype: tuple
+    """
+    cdef const unsigned char[::1] stream_view = stream
+    cdef size_t stream_len
+    cdef const unsigned char *stream_ptr
+    cdef scan_msg msg
+
+    if offset > <size_t>stream_view.shape[0]:
+        raise ValueError("offset %s is out of stream" % offset)
+    if length is None:
+        stream_len = stream_view.shape[0] - offset
+    else:
+        stream_len = length
+        if offset + stream_len > <size_t>stream_view.shape[0]:
+            raise ValueError("length %s is out of stream" % length)
+    if stream_len < 2:
+        raise SNMPException("message is too short")
+    stream_ptr = &stream_view[offset]
+
+    memset(&msg, 0, sizeof(msg))
+    try:
+        with nogil:
+            msg_scan(stream_ptr, stream_len, &msg)
+        return msg_decode_scanned(&msg, stream_ptr, stream_len, as_oid, with_types, columns)
+    finally:
+        free(msg.varbinds)
+
+
+cdef class DecodeBatch:
+    """
+    Messages of msg_decode_many()
+    """
+    cdef scan_msg *msgs
+    cdef const unsigned char **streams
+    cdef size_t *lengths
+    cdef readonly size_t count
+    # keeps buffers exported
+    cdef list views
+
+    def __cinit__(self, buffers):
+        cdef const unsigned char[::1] view
+        cdef size_t i
+        buffers = list(buffers)
+        self.count = len(buffers)
+        self.msgs = <scan_msg *> calloc(self.count or 1, sizeof(scan_msg))
+        self.streams = <const unsigned char **> calloc(self.count or 1, sizeof(unsigned char *))
+        self.lengths = <size_t *> calloc(self.count or 1, sizeof(size_t))
+        if self.msgs == NULL or self.streams == NULL or self.lengths == NULL:
+            raise MemoryError()
+        self.views = []
+        for i in range(self.count):
+            view = buffers[i]
+            self.views.append(view)
+            self.lengths[i] = view.shape[0]
+            if self.lengths[i]:
+                self.streams[i] = &view[0]
+
+    def __dealloc__(self):
+        cdef size_t i
+        if self.msgs != NULL:
+            for i in range(self.count):
+                free(self.msgs[i].varbinds)
+        free(self.msgs)
+        free(self.streams)
+        free(self.lengths)
+
+    def scan(self, size_t start, size_t stop):
+        """
+        Parse messages from start to stop without GIL
+        """
+        cdef size_t i
+        if stop > self.count:
+            stop = self.count
+        with nogil:
+            for i in range(start, stop):
+                msg_scan(self.streams[i], self.lengths[i], &self.msgs[i])
+
+    def decode(self, size_t pos, bint as_oid=False, bint with_types=False):
+        """
+        Result of msg_decode() for scanned message
+        """
+        if pos >= self.count:
+            raise IndexError("message index out of range")
+        if self.lengths[pos] < 2:
+            raise SNMPException("message is too short")
+        return msg_decode_scanned(&self.msgs[pos], self.streams[pos], self.lengths[pos], as_oid, with_types)
+
+
+decode_pools = {}
+decode_pools_lock = threading.Lock()
+
+
+def decode_pool(size_t workers):
+    """
+    Shared thread pool of msg_decode_many()
+    """
+    with decode_pools_lock:
+        pool = decode_pools.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fastsnmp-decode")
+            decode_pools[workers] = pool
+    return pool
+
+
+def msg_decode_many(buffers, size_t workers=1, bint as_oid=False, bint with_types=False):
+    """
+    Decode batch of SNMP-messages. Messages are parsed without GIL on thread pool,
+    python objects are built in the calling thread
+
+    :param buffers: encoded messages. objects with buffer protocol: bytes, bytearray, memoryview
+    :type buffers: list
+    :param workers: count of threads to parse messages
+    :type workers: int
+    :param as_oid: return OIDs as Oid instead of str
+    :type as_oid: bool
+    :param with_types: return type codes of values as in msg_decode()
+    :type with_types: bool
+    :returns: msg_decode() result for every message or exception if message can not be decoded
+    :rtype: list
+    """
+    cdef DecodeBatch batch = DecodeBatch(buffers)
+    cdef size_t i, chunk
+    cdef list results = []
+    if workers > 1 and batch.count > 1:
+        chunk = (batch.count + workers - 1) // workers
+        futures = [decode_pool(workers).submit(batch.scan, i, i + chunk) for i in range(0, batch.count, chunk)]
+        for future in futures:
+            future.result()
+    else:
+        batch.scan(0, batch.count)
+    for i in range(batch.count):
+        try:
+            results.append(batch.decode(i, as_oid, with_types))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def check_is_growing(oid_start not None, oid_finish not None):
     cdef bint is_growing = True
+    if isinstance(oid_start, Oid) and isinstance(oid_finish, Oid):
+        return not (<Oid> oid_finish).compare(<Oid> oid_start) < 0
     if "." in oid_start:
         if [int(x) for x in oid_finish.split(".")] < [int(x) for x in oid_start.split(".")]:
             is_growing = False
@@ -1009,3 +2173,883 @@ def parse_varbind(list var_bind_list not None, tuple orig_main_oids not None, tu
                 "%s.%s" % (orig_main_oids[p], last_seen_index[p]) for p in rest_oids_positions]
     return result, tuple(next_oids)
 
+
+
+# GetBulk response decoder. varbinds are matched with main OIDs by encoded OID prefix
+
+cdef inline const unsigned char *tlv_read(const unsigned char *stream, const unsigned char *end, uint64_t *tag,
+                                          size_t *length) except NULL:
+    """
+    Read tag and length. Returns position of value
+    """
+    cdef size_t octets, i
+    if end - stream < 2:
+        raise SNMPException("out of len. no tag or length")
+    tag[0] = stream[0]
+    if tag[0] & 0x1F == 0x1F:
+        raise NotImplementedError("unknown tag=%s" % tag[0])
+    length[0] = stream[1]
+    stream += 2
+    if length[0] & 0x80:  # 8.1.3.5
+        octets = length[0] & 0x7f
+        if octets > 8 or <size_t>(end - stream) < octets:
+            raise SNMPException("out of len. truncated length for tag=%s" % tag[0])
+        length[0] = 0
+        for i in range(octets):
+            length[0] = length[0] << 8 | stream[i]
+        stream += octets
+    if <size_t>(end - stream) < length[0]:
+        raise SNMPException("out of len. length=%s tag=%s" % (length[0], tag[0]))
+    return stream
+
+
+cdef inline const unsigned char *tlv_expect(const unsigned char *stream, const unsigned char *end, uint64_t tag,
+                                            size_t *length) except NULL:
+    cdef uint64_t real_tag
+    stream = tlv_read(stream, end, &real_tag, length)
+    if real_tag != tag:
+        raise SNMPException("unexpected tag=%s. expected %s" % (real_tag, tag))
+    return stream
+
+
+cdef inline size_t uint_to_str(uint64_t value, char *out) noexcept:
+    cdef char digits[20]
+    cdef size_t n = 0, i
+    while True:
+        digits[n] = c'0' + value % 10
+        value //= 10
+        n += 1
+        if value == 0:
+            break
+    for i in range(n):
+        out[i] = digits[n - i - 1]
+    return n
+
+
+cdef str oid_suffix_decode(const unsigned char *stream, size_t stream_len):
+    """
+    Decode sub-identifiers after OID prefix into dotted string
+    """
+    cdef char out[MAX_OID_LEN_STR]
+    cdef size_t out_len = 0, i
+    cdef uint64_t subid = 0
+    cdef size_t subid_len = 0
+    for i in range(stream_len):
+        subid = subid << 7 | (stream[i] & 0x7f)
+        subid_len += 1
+        if stream[i] & 0x80:
+            if subid_len == 9:
+                raise SNMPException("invalid oid: too long sub-identifier")
+            continue
+        if out_len + 21 > MAX_OID_LEN_STR:
+            raise SNMPException("too long oid")
+        if out_len:
+            out[out_len] = c'.'
+            out_len += 1
+        out_len += uint_to_str(subid, out + out_len)
+        subid = 0
+        subid_len = 0
+    if subid_len:
+        raise SNMPException("invalid oid: truncated sub-identifier")
+    return PyUnicode_DecodeASCII(out, out_len, NULL)
+
+
+cdef object value_decode_c(uint64_t tag, const unsigned char *stream, size_t length):
+    """
+    Decode value of varbind. Same as sequence_decode_c() for one value
+    """
+    cdef char ret_str[MAX_OID_LEN_STR]
+    cdef size_t ret_length
+    cdef int ret
+    if tag == ASN_U_INTEGER:
+        if length == 0:
+            return 0
+        return integer_decode_c(stream, &length)
+    elif tag == ASN_A_COUNTER32 or tag == ASN_A_UNSIGNED32 \
+            or tag == ASN_A_GAUGE32 or tag == ASN_A_COUNTER64 or tag == ASN_A_TIMETICKS:
+        return uinteger_decode_c(stream, &length)
+    elif tag == ASN_U_OCTETSTRING or tag == ASN_A_IPADDRESS:
+        return <bytes> stream[:length]
+    elif tag == ASN_U_OBJECTID:
+        ret = objectid_decode_str(stream, length, ret_str, &ret_length)
+        if ret != 0:
+            raise SNMPException("invalid oid: objectid_decode_str err == %s" % (ret,))
+        return PyUnicode_DecodeASCII(ret_str, ret_length, 'ignore')
+    elif tag == ASN_U_NULL or tag == ASN_U_NO_SUCH_OBJECT or tag == ASN_U_NO_SUCH_INSTANCE:
+        return None
+    elif tag == ASN_U_END_OF_MIB_VIEW:
+        return end_of_mib_view
+    elif tag == ASN_A_OPAQUE:
+        opaque_obj, ex = sequence_decode_c(stream, length)
+        if ex:
+            raise ex
+        if len(opaque_obj) != 1:
+            raise SNMPException("opaque len %s != 1" % len(opaque_obj))
+        return opaque_obj[0]
+    raise NotImplementedError("unknown tag=%s" % tag)
+
+
+# converters of values
+
+DEF CONVERT_NONE = 0
+DEF CONVERT_DISPLAY_STRING = 1
+DEF CONVERT_IP_ADDRESS = 2
+DEF CONVERT_MAC_ADDRESS = 3
+DEF CONVERT_HEX = 4
+DEF CONVERT_SCALE = 5
+
+# converter name => code. number as converter is a scale of numeric value
+CONVERTERS = {
+    'DisplayString': CONVERT_DISPLAY_STRING,  # bytes => str, trailing NULs are stripped
+    'IpAddress': CONVERT_IP_ADDRESS,  # 4 or 16 bytes => dotted or IPv6 string
+    'MacAddress': CONVERT_MAC_ADDRESS,  # bytes => aa:bb:cc:dd:ee:ff
+    'Hex': CONVERT_HEX,  # bytes => hex string
+}
+
+
+cdef struct value_converter:
+    int kind
+    double scale
+
+
+cdef int converter_parse(value_converter *conv, spec) except -1:
+    conv.kind = CONVERT_NONE
+    conv.scale = 1
+    if spec is None:
+        return 0
+    if isinstance(spec, str):
+        try:
+            conv.kind = CONVERTERS[spec]
+        except KeyError:
+            raise ValueError("unknown converter %s" % spec) from None
+    elif isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        conv.kind = CONVERT_SCALE
+        conv.scale = spec
+    else:
+        raise ValueError("unknown converter %r" % (spec,))
+    return 0
+
+
+cdef str hex_format(const unsigned char *stream, size_t length, char sep):
+    cdef const char *digits = b"0123456789abcdef"
+    cdef size_t out_len, i, pos = 0
+    cdef char *out
+    if length == 0:
+        return ""
+    out_len = length * 3 - 1 if sep else length * 2
+    out = <char *> malloc(out_len)
+    if out == NULL:
+        raise MemoryError()
+    try:
+        for i in range(length):
+            if sep and i:
+                out[pos] = sep
+                pos += 1
+            out[pos] = digits[stream[i] >> 4]
+            out[pos + 1] = digits[stream[i] & 0xf]
+            pos += 2
+        return PyUnicode_DecodeASCII(out, out_len, NULL)
+    finally:
+        free(out)
+
+
+cdef object ip_format(const unsigned char *stream, size_t length):
+    cdef char out[INET6_ADDRSTRLEN]
+    cdef size_t pos = 0, i
+    if length == 4:
+        for i in range(4):
+            if i:
+                out[pos] = c'.'
+                pos += 1
+            pos += uint_to_str(stream[i], out + pos)
+        return PyUnicode_DecodeASCII(out, pos, NULL)
+    if length == 16 and inet_ntop(AF_INET6, stream, out, INET6_ADDRSTRLEN) != NULL:
+        return PyUnicode_DecodeASCII(out, strlen(out), NULL)
+    return <bytes> stream[:length]
+
+
+cdef object value_convert_c(value_converter *conv, uint64_t tag, const unsigned char *stream, size_t length):
+    """
+    Decode value of varbind and convert it. Values of other types than converter expects are not converted
+    """
+    if tag == ASN_U_OCTETSTRING or tag == ASN_A_IPADDRESS:
+        if conv.kind == CONVERT_DISPLAY_STRING:
+            while length and stream[length - 1] == 0:
+                length -= 1
+            return PyUnicode_DecodeUTF8(<const char *> stream, length, "replace")
+        elif conv.kind == CONVERT_IP_ADDRESS:
+            return ip_format(stream, length)
+        elif conv.kind == CONVERT_MAC_ADDRESS:
+            return hex_format(stream, length, c':')
+        elif conv.kind == CONVERT_HEX:
+            return hex_format(stream, length, 0)
+    elif conv.kind == CONVERT_SCALE:
+        if tag == ASN_U_INTEGER:
+            if length == 0:
+                return 0.0
+            return <double> integer_decode_c(stream, &length) * conv.scale
+        elif tag == ASN_A_COUNTER32 or tag == ASN_A_UNSIGNED32 \
+                or tag == ASN_A_GAUGE32 or tag == ASN_A_COUNTER64 or tag == ASN_A_TIMETICKS:
+            return <double> uinteger_decode_c(stream, &length) * conv.scale
+    return value_decode_c(tag, stream, length)
+
+
+cdef inline bint converter_applies(value_converter *conv, uint64_t tag) noexcept:
+    """
+    True if value_convert_c() converts values with tag
+    """
+    if tag == ASN_U_OCTETSTRING or tag == ASN_A_IPADDRESS:
+        return conv.kind != CONVERT_SCALE
+    return conv.kind == CONVERT_SCALE and (tag == ASN_U_INTEGER or tag == ASN_A_COUNTER32
+                                           or tag == ASN_A_UNSIGNED32 or tag == ASN_A_GAUGE32
+                                           or tag == ASN_A_COUNTER64 or tag == ASN_A_TIMETICKS)
+
+
+cdef object value_convert_obj(value_converter *conv, value):
+    """
+    Convert decoded value
+    """
+    cdef const unsigned char *stream
+    if isinstance(value, bytes):
+        stream = <const unsigned char *> PyBytes_AS_STRING(value)
+        return value_convert_c(conv, ASN_U_OCTETSTRING, stream, PyBytes_GET_SIZE(value))
+    if conv.kind == CONVERT_SCALE and isinstance(value, int) and not isinstance(value, bool):
+        return value * conv.scale
+    return value
+
+
+def convert_value(value, converter):
+    """
+    Convert decoded value same as decoder does with converter
+
+    :param value: value from msg_decode()
+    :param converter: name from CONVERTERS or scale
+    :type converter: str | float
+    """
+    cdef value_converter conv
+    converter_parse(&conv, converter)
+    if conv.kind == CONVERT_NONE:
+        return value
+    return value_convert_obj(&conv, value)
+
+
+cdef class ResponseColumns:
+    """
+    Main OIDs of GetBulk request in encoded form
+
+    :param main_oids: main OIDs. varbinds of response are in round-robin order of them
+    :type main_oids: tuple
+    :param converters: main OID => converter of its values. name from CONVERTERS or scale
+    :type converters: dict
+    :param non_repeaters: count of the first main OIDs which are answered once
+    :type non_repeaters: int
+    """
+    cdef readonly tuple main_oids
+    cdef readonly Py_ssize_t non_repeaters
+    cdef tuple prefixes
+    # NULL if there are no converters
+    cdef value_converter *converters
+
+    def __init__(self, main_oids, dict converters=None, Py_ssize_t non_repeaters=0):
+        cdef Py_ssize_t i
+        self.main_oids = tuple(main_oids)
+        if not self.main_oids:
+            raise ValueError("main_oids is empty")
+        if non_repeaters < 0 or non_repeaters > len(self.main_oids):
+            raise ValueError("non_repeaters %s is out of main_oids" % non_repeaters)
+        self.non_repeaters = non_repeaters
+        self.prefixes = tuple(objectid_encode(main_oid) for main_oid in self.main_oids)
+        if converters and any(main_oid in converters for main_oid in self.main_oids):
+            self.converters = <value_converter *> calloc(len(self.main_oids), sizeof(value_converter))
+            if self.converters == NULL:
+                raise MemoryError()
+            for i in range(len(self.main_oids)):
+                converter_parse(&self.converters[i], converters.get(self.main_oids[i]))
+
+    def __dealloc__(self):
+        free(self.converters)
+
+
+cdef inline value_converter *column_converter(ResponseColumns columns, size_t pos) noexcept:
+    """
+    Converter of varbind at pos. NULL if value is not converted
+    """
+    cdef value_converter *conv
+    if columns is None or columns.converters == NULL:
+        return NULL
+    conv = &columns.converters[pos % len(columns.main_oids)]
+    return conv if conv.kind != CONVERT_NONE else NULL
+
+
+def bulk_response_decode(stream, dict columns not None, size_t offset=0, length=None, bint with_types=False):
+    """
+    Decode GetBulk response and split its varbinds by main OIDs of request in one pass
+
+    :param stream: encoded message. any object with buffer protocol: bytes, bytearray, memoryview
+    :param columns: request identifier => ResponseColumns of pending request
+    :type columns: dict
+    :param offset: position of message in stream
+    :type offset: int
+    :param length: length of message. rest of stream if None
+    :type length: int
+    :param with_types: return type codes of values of rows as array.array('B') after next_oids
+    :type with_types: bool
+    :returns: req_id, error_status, error_index, rows, ended, next_oids[, types].
+        rows is list of (column position, index part, value), ended is tuple of flags of finished columns,
+        next_oids is tuple of OIDs to continue walk or None for finished columns.
+        non-repeaters are always finished, their varbinds are in rows if they are in subtree of main OID.
+        rows, ended, next_oids and types are None if req_id is not in columns
+    :rtype: tuple
+    """
+    cdef const unsigned char[::1] stream_view = stream
+    cdef const unsigned char *stream_ptr
+    cdef const unsigned char *end
+    cdef const unsigned char *varbinds_end
+    cdef const unsigned char *varbind_end
+    cdef const unsigned char *oid_ptr
+    cdef const unsigned char *prefix_ptr
+    cdef uint64_t tag
+    cdef size_t stream_len, tlv_length, oid_len, prefix_len
+    cdef size_t columns_count, column_pos = 0, ended_count = 0, i, non_repeaters
+    cdef int64_t req_id, error_status, error_index
+    cdef ResponseColumns req_columns
+    cdef list rows, last_index
+    cdef str index_part
+    cdef bytes prefix
+    cdef uint8_t *ended
+    cdef array.array types = None
+    cdef char type_code
+
+    if offset > <size_t>stream_view.shape[0]:
+        raise ValueError("offset %s is out of stream" % offset)
+    if length is None:
+        stream_len = stream_view.shape[0] - offset
+    else:
+        stream_len = length
+        if offset + stream_len > <size_t>stream_view.shape[0]:
+            raise ValueError("length %s is out of stream" % length)
+    if stream_len < 2:
+        raise SNMPException("message is too short")
+    stream_ptr = &stream_view[offset]
+    end = stream_ptr + stream_len
+
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_SEQUENCE, &tlv_length)
+    end = stream_ptr + tlv_length
+    # version
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_INTEGER, &tlv_length)
+    stream_ptr += tlv_length
+    # community
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_OCTETSTRING, &tlv_length)
+    stream_ptr += tlv_length
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_SNMP_RESPONSE, &tlv_length)
+    end = stream_ptr + tlv_length
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_INTEGER, &tlv_length)
+    req_id = integer_decode_c(stream_ptr, &tlv_length) if tlv_length else 0
+    stream_ptr += tlv_length
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_INTEGER, &tlv_length)
+    error_status = integer_decode_c(stream_ptr, &tlv_length) if tlv_length else 0
+    stream_ptr += tlv_length
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_INTEGER, &tlv_length)
+    error_index = integer_decode_c(stream_ptr, &tlv_length) if tlv_length else 0
+    stream_ptr += tlv_length
+
+    req_columns = columns.get(req_id)
+    if req_columns is None:
+        if with_types:
+            return req_id, error_status, error_index, None, None, None, None
+        return req_id, error_status, error_index, None, None, None
+    if with_types:
+        types = array.clone(type_codes_template, 0, zero=False)
+
+    stream_ptr = tlv_expect(stream_ptr, end, ASN_U_SEQUENCE, &tlv_length)
+    varbinds_end = stream_ptr + tlv_length
+    columns_count = len(req_columns.main_oids)
+    non_repeaters = req_columns.non_repeaters
+    rows = []
+    last_index = [None] * columns_count
+    ended = <uint8_t *> calloc(columns_count, sizeof(uint8_t))
+    if ended == NULL:
+        raise MemoryError()
+    try:
+        while stream_ptr < varbinds_end and ended_count < columns_count:
+            stream_ptr = tlv_expect(stream_ptr, varbinds_end, ASN_U_SEQUENCE, &tlv_length)
+            varbind_end = stream_ptr + tlv_length
+            oid_ptr = tlv_expect(stream_ptr, varbind_end, ASN_U_OBJECTID, &oid_len)
+            stream_ptr = tlv_read(oid_ptr + oid_len, varbind_end, &tag, &tlv_length)
+            # oids in received var_bind_list in round-robin order respectively query
+            if not ended[column_pos]:
+                prefix = <bytes> req_columns.prefixes[column_pos]
+                prefix_ptr = <const unsigned char *> PyBytes_AS_STRING(prefix)
+                prefix_len = PyBytes_GET_SIZE(prefix)
+                if tag == ASN_U_NULL or tag == ASN_U_NO_SUCH_OBJECT or tag == ASN_U_NO_SUCH_INSTANCE \
+                        or tag == ASN_U_END_OF_MIB_VIEW:
+                    ended[column_pos] = 1
+                    ended_count += 1
+                elif oid_len > prefix_len and memcmp(oid_ptr, prefix_ptr, prefix_len) == 0:
+                    index_part = oid_suffix_decode(oid_ptr + prefix_len, oid_len - prefix_len)
+                    last_index[column_pos] = index_part
+                    if req_columns.converters != NULL and req_columns.converters[column_pos].kind != CONVERT_NONE:
+                        value = value_convert_c(&req_columns.converters[column_pos], tag, stream_ptr, tlv_length)
+                    else:
+                        value = value_decode_c(tag, stream_ptr, tlv_length)
+                    rows.append((column_pos, index_part, value))
+                    if with_types:
+                        type_code = <char> tag
+                        array.extend_buffer(types, &type_code, 1)
+                else:
+                    ended[column_pos] = 1
+                    ended_count += 1
+                if column_pos < non_repeaters and not ended[column_pos]:
+                    ended[column_pos] = 1
+                    ended_count += 1
+            stream_ptr = varbind_end
+            column_pos += 1
+            if column_pos == columns_count:
+                # non-repeaters are answered in the first varbinds only
+                column_pos = non_repeaters
+                if non_repeaters == columns_count:
+                    break
+
+        next_oids = []
+        ended_flags = []
+        for i in range(columns_count):
+            # column without varbinds is finished too
+            if ended[i] or last_index[i] is None or i < non_repeaters:
+                next_oids.append(None)
+                ended_flags.append(True)
+            else:
+                next_oids.append("%s.%s" % (req_columns.main_oids[i], last_index[i]))
+                ended_flags.append(False)
+    finally:
+        free(ended)
+    if with_types:
+        return req_id, error_status, error_index, rows, tuple(ended_flags), tuple(next_oids), types
+    return req_id, error_status, error_index, rows, tuple(ended_flags), tuple(next_oids)
+
+
+
+# lazy decoding. ResponseView keeps scanned message and builds python objects on access
+
+cdef class ResponseView:
+    """
+    SNMP-message decoded on demand. Varbinds are indexed once, OIDs and values are decoded on access.
+    stream is referenced, not copied. It must not be changed while the view or its varbinds are used
+
+    :param stream: encoded message. any object with buffer protocol: bytes, bytearray, memoryview
+    :param offset: position of message in stream
+    :type offset: int
+    :param length: length of message. rest of stream if None
+    :type length: int
+    """
+    cdef const unsigned char[::1] stream_view
+    cdef const unsigned char *stream
+    cdef size_t stream_len
+    cdef scan_msg msg
+    cdef readonly int64_t req_id
+    cdef readonly int64_t error_status
+    cdef readonly int64_t error_index
+
+    def __init__(self, stream, size_t offset=0, length=None):
+        cdef const unsigned char *stream_ptr
+        cdef size_t stream_len
+        if self.stream != NULL:
+            raise TypeError("ResponseView is already initialized")
+        self.stream_view = stream
+        if offset > <size_t>self.stream_view.shape[0]:
+            raise ValueError("offset %s is out of stream" % offset)
+        if length is None:
+            stream_len = self.stream_view.shape[0] - offset
+        else:
+            stream_len = length
+            if offset + stream_len > <size_t>self.stream_view.shape[0]:
+                raise ValueError("length %s is out of stream" % length)
+        if stream_len < 2:
+            raise SNMPException("message is too short")
+        stream_ptr = &self.stream_view[offset]
+        with nogil:
+            msg_scan(stream_ptr, stream_len, &self.msg)
+        if self.msg.status == SCAN_NO_MEMORY:
+            raise MemoryError()
+        if self.msg.status != SCAN_OK:
+            # same exception as msg_decode() for broken message
+            msg_decode_generic(stream_ptr, stream_len, False)
+            raise SNMPException("message is not in common form. use msg_decode()")
+        self.stream = stream_ptr
+        self.stream_len = stream_len
+        self.req_id = self.msg.req_id
+        self.error_status = self.msg.error_status
+        self.error_index = self.msg.error_index
+
+    def __dealloc__(self):
+        free(self.msg.varbinds)
+
+    def __len__(self):
+        return self.msg.count
+
+    def __getitem__(self, Py_ssize_t pos):
+        if pos < 0:
+            pos += self.msg.count
+        if pos < 0 or <size_t>pos >= self.msg.count:
+            raise IndexError("varbind index out of range")
+        return varbind_view_new(self, pos)
+
+    def __iter__(self):
+        cdef size_t i
+        for i in range(self.msg.count):
+            yield varbind_view_new(self, i)
+
+    def __repr__(self):
+        return "ResponseView(req_id=%s, error_status=%s, error_index=%s, varbinds=%s)" % (
+            self.req_id, self.error_status, self.error_index, self.msg.count)
+
+    def iter_prefix(self, prefix not None, bint skip_missing=False):
+        """
+        Iterate over varbinds with OID under prefix. Other varbinds are skipped without decoding
+
+        :param prefix: OID prefix with at least two sub-identifiers. the prefix itself matches too
+        :type prefix: str | Oid
+        :param skip_missing: skip noSuchObject, noSuchInstance and endOfMibView values
+        :type skip_missing: bool
+        :rtype: Iterator[VarBindView]
+        """
+        cdef bytes prefix_enc = oid_prefix_encode(prefix)
+        cdef const unsigned char *prefix_ptr = <const unsigned char *> PyBytes_AS_STRING(prefix_enc)
+        cdef size_t prefix_len = PyBytes_GET_SIZE(prefix_enc)
+        cdef scan_varbind *varbind
+        cdef size_t i
+        for i in range(self.msg.count):
+            varbind = &self.msg.varbinds[i]
+            if varbind.oid_len < prefix_len or memcmp(varbind.oid, prefix_ptr, prefix_len) != 0:
+                continue
+            if skip_missing and value_is_missing(varbind.tag):
+                continue
+            yield varbind_view_new(self, i)
+
+    def decode(self, bint as_oid=False, bint with_types=False):
+        """
+        Decode all varbinds
+
+        :param as_oid: return OIDs as Oid instead of str
+        :type as_oid: bool
+        :param with_types: return type codes of values
+        :type with_types: bool
+        :returns: req_id, error_status, error_index, varbinds[, types]. same as msg_decode()
+        :rtype: tuple
+        """
+        return msg_decode_scanned(&self.msg, self.stream, self.stream_len, as_oid, with_types)
+
+
+cdef inline bint value_is_missing(uint64_t tag) noexcept:
+    return tag == ASN_U_NO_SUCH_OBJECT or tag == ASN_U_NO_SUCH_INSTANCE or tag == ASN_U_END_OF_MIB_VIEW
+
+
+cdef bytes oid_prefix_encode(prefix):
+    """
+    Content octets of OID prefix. Sub-identifiers are self-delimiting, so encoded prefix is prefix of encoded OID
+    """
+    if isinstance(prefix, Oid):
+        if len(prefix) < 2:
+            raise ValueError("prefix %s is too short" % prefix)
+        return (<Oid> prefix).encoded
+    prefix = prefix.strip(".")
+    if prefix.count(".") < 1:
+        raise ValueError("prefix %s is too short" % prefix)
+    return objectid_encode(prefix)
+
+
+cdef VarBindView varbind_view_new(ResponseView response, size_t pos):
+    cdef VarBindView view = VarBindView.__new__(VarBindView)
+    view.response = response
+    view.varbind = &response.msg.varbinds[pos]
+    return view
+
+
+@cython.final
+cdef class VarBindView:
+    """
+    Varbind of ResponseView. OID and value are decoded on every access
+    """
+    cdef ResponseView response
+    cdef scan_varbind *varbind
+
+    def __init__(self):
+        raise TypeError("VarBindView is created by ResponseView")
+
+    @property
+    def oid(self):
+        """
+        OID as dotted string
+        """
+        cdef char ret_str[MAX_OID_LEN_STR]
+        cdef size_t ret_length
+        cdef int ret = objectid_decode_str(self.varbind.oid, self.varbind.oid_len, ret_str, &ret_length)
+        if ret != 0:
+            raise SNMPException("invalid oid: objectid_decode_str err == %s" % (ret,))
+        return PyUnicode_DecodeASCII(ret_str, ret_length, 'ignore')
+
+    def to_oid(self):
+        """
+        OID as Oid
+        """
+        return oid_from_ber(self.varbind.oid, self.varbind.oid_len)
+
+    def suffix(self, prefix not None):
+        """
+        Sub-identifiers after prefix as dotted string. Same as index part of poller results
+
+        :param prefix: OID prefix
+        :type prefix: str | Oid
+        :rtype: str
+        """
+        cdef bytes prefix_enc = oid_prefix_encode(prefix)
+        cdef size_t prefix_len = PyBytes_GET_SIZE(prefix_enc)
+        if self.varbind.oid_len < prefix_len or \
+                memcmp(self.varbind.oid, PyBytes_AS_STRING(prefix_enc), prefix_len) != 0:
+            raise ValueError("%s is not prefix of %s" % (prefix, self.oid))
+        return oid_suffix_decode(self.varbind.oid + prefix_len, self.varbind.oid_len - prefix_len)
+
+    @property
+    def value(self):
+        """
+        Value converted as in msg_decode()
+        """
+        cdef scan_varbind *varbind = self.varbind
+        if varbind.tag == ASN_U_INTEGER:
+            return varbind.int_value
+        elif varbind.tag == ASN_A_COUNTER32 or varbind.tag == ASN_A_UNSIGNED32 \
+                or varbind.tag == ASN_A_GAUGE32 or varbind.tag == ASN_A_COUNTER64 or varbind.tag == ASN_A_TIMETICKS:
+            return varbind.uint_value
+        elif varbind.tag == ASN_U_OCTETSTRING or varbind.tag == ASN_A_IPADDRESS:
+            return <bytes> varbind.value[:varbind.value_len]
+        elif varbind.tag == ASN_U_END_OF_MIB_VIEW:
+            return end_of_mib_view
+        elif varbind.tag == ASN_U_NULL or varbind.tag == ASN_U_NO_SUCH_OBJECT \
+                or varbind.tag == ASN_U_NO_SUCH_INSTANCE:
+            return None
+        objects, ex = sequence_decode_c(varbind.tlv, varbind.tlv_len)
+        if ex:
+            raise ex
+        if len(objects) != 1:
+            raise SNMPException("varbind has %s values" % len(objects))
+        return objects[0]
+
+    @property
+    def raw_bytes(self):
+        """
+        Content octets of value without tag and length
+        """
+        return <bytes> self.varbind.value[:self.varbind.value_len]
+
+    @property
+    def tag(self):
+        """
+        Type code of value (TYPE_*)
+        """
+        return self.varbind.tlv[0]
+
+    @property
+    def missing(self):
+        """
+        Value is noSuchObject, noSuchInstance or endOfMibView
+        """
+        return value_is_missing(self.varbind.tag)
+
+    def __iter__(self):
+        yield self.oid
+        yield self.value
+
+    def __repr__(self):
+        return "VarBindView(%r, %r)" % (self.oid, self.value)
+
+
+# batched datagram I/O
+
+cdef extern from *:
+    """
+    #include <errno.h>
+    #include <string.h>
+    #include <sys/types.h>
+    #include <sys/socket.h>
+    #include <sys/uio.h>
+    #include <netinet/in.h>
+    #include <arpa/inet.h>
+    #if defined(__linux__)
+    #define FASTSNMP_HAVE_MMSG 1
+    #else
+    #define FASTSNMP_HAVE_MMSG 0
+    struct mmsghdr {
+        struct msghdr msg_hdr;
+        unsigned int msg_len;
+    };
+    static int sendmmsg(int fd, struct mmsghdr *msgvec, unsigned int vlen, int flags) {
+        errno = ENOSYS;
+        return -1;
+    }
+    static int recvmmsg(int fd, struct mmsghdr *msgvec, unsigned int vlen, int flags, void *timeout) {
+        errno = ENOSYS;
+        return -1;
+    }
+    #endif
+    """
+    int FASTSNMP_HAVE_MMSG
+    int AF_INET
+    int AF_INET6
+    int MSG_DONTWAIT
+    int EWOULDBLOCK
+    ctypedef unsigned int socklen_t
+
+    struct iovec:
+        void *iov_base
+        size_t iov_len
+
+    struct msghdr:
+        void *msg_name
+        socklen_t msg_namelen
+        iovec *msg_iov
+        size_t msg_iovlen
+        void *msg_control
+        size_t msg_controllen
+        int msg_flags
+
+    struct mmsghdr:
+        msghdr msg_hdr
+        unsigned int msg_len
+
+    struct in6_addr:
+        unsigned char s6_addr[16]
+
+    struct sockaddr_in6:
+        unsigned short sin6_family
+        unsigned short sin6_port
+        uint32_t sin6_flowinfo
+        in6_addr sin6_addr
+        uint32_t sin6_scope_id
+
+    int sendmmsg(int fd, mmsghdr *msgvec, unsigned int vlen, int flags) nogil
+    int recvmmsg(int fd, mmsghdr *msgvec, unsigned int vlen, int flags, void *timeout) nogil
+    int inet_pton(int af, const char *src, void *dst)
+    const char *inet_ntop(int af, const void *src, char *dst, socklen_t size)
+    unsigned short htons(unsigned short value)
+    unsigned short ntohs(unsigned short value)
+
+HAVE_MMSG = bool(FASTSNMP_HAVE_MMSG)
+
+
+cdef int sockaddr_in6_fill(sockaddr_in6 *addr, str ip, unsigned short port) except -1:
+    cdef bytes ip_b = ip.encode("ascii")
+    memset(addr, 0, sizeof(sockaddr_in6))
+    addr.sin6_family = AF_INET6
+    addr.sin6_port = htons(port)
+    if inet_pton(AF_INET6, ip_b, &addr.sin6_addr) == 1:
+        return 0
+    # ipv4 address on dual-stack socket
+    addr.sin6_addr.s6_addr[10] = 0xff
+    addr.sin6_addr.s6_addr[11] = 0xff
+    if inet_pton(AF_INET, ip_b, &addr.sin6_addr.s6_addr[12]) == 1:
+        return 0
+    raise ValueError("wrong ip address %r" % ip)
+
+
+cdef class DatagramBatch:
+    """
+    Preallocated message headers and iovecs for sendmmsg()/recvmmsg() on AF_INET6 socket
+
+    :param size: max count of datagrams per syscall
+    :type size: int
+    """
+    cdef mmsghdr *msgs
+    cdef iovec *iovecs
+    cdef sockaddr_in6 *addrs
+    cdef readonly unsigned int size
+
+    def __cinit__(self, unsigned int size=64):
+        if size == 0:
+            raise ValueError("size must be positive")
+        self.size = size
+        self.msgs = <mmsghdr *> calloc(size, sizeof(mmsghdr))
+        self.iovecs = <iovec *> calloc(size, sizeof(iovec))
+        self.addrs = <sockaddr_in6 *> calloc(size, sizeof(sockaddr_in6))
+        if self.msgs == NULL or self.iovecs == NULL or self.addrs == NULL:
+            raise MemoryError()
+        for i in range(size):
+            self.msgs[i].msg_hdr.msg_name = &self.addrs[i]
+            self.msgs[i].msg_hdr.msg_iov = &self.iovecs[i]
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+    def __dealloc__(self):
+        free(self.msgs)
+        free(self.iovecs)
+        free(self.addrs)
+
+    def send(self, int fd, list messages not None, list addresses not None, size_t start=0):
+        """
+        Send messages[start:start + size] with one syscall
+
+        :param fd: socket file descriptor
+        :param messages: list of encoded messages
+        :type messages: list[bytes]
+        :param addresses: list of (ip, port)
+        :type addresses: list[tuple]
+        :param start: position of first message to send
+        :returns: count of sent messages. 0 if socket buffer is full
+        :rtype: int
+        """
+        cdef size_t count = min(<size_t>len(messages), <size_t>len(addresses))
+        cdef unsigned int vlen, i
+        cdef bytes message
+        cdef int ret
+        if start >= count:
+            return 0
+        vlen = min(count - start, self.size)
+        for i in range(vlen):
+            message = messages[start + i]
+            ip, port = addresses[start + i]
+            sockaddr_in6_fill(&self.addrs[i], ip, port)
+            self.msgs[i].msg_hdr.msg_namelen = sizeof(sockaddr_in6)
+            self.iovecs[i].iov_base = PyBytes_AS_STRING(message)
+            self.iovecs[i].iov_len = PyBytes_GET_SIZE(message)
+        while True:
+            with nogil:
+                ret = sendmmsg(fd, self.msgs, vlen, 0)
+            if ret >= 0:
+                return ret
+            if errno == EINTR:
+                continue
+            if errno == EAGAIN or errno == EWOULDBLOCK:
+                return 0
+            PyErr_SetFromErrno(OSError)
+
+    def recv_into(self, int fd, list buffers not None):
+        """
+        Receive datagrams into buffers with one syscall. i-th datagram is stored in i-th buffer
+
+        :param fd: socket file descriptor
+        :param buffers: list of bytearray
+        :returns: list of (nbytes, (ip, port)). empty if there is no data
+        :rtype: list
+        """
+        cdef unsigned int vlen = min(<size_t>len(buffers), self.size)
+        cdef unsigned int i
+        cdef int ret
+        cdef bytearray buf
+        cdef char ip[INET6_ADDRSTRLEN]
+        cdef list res = []
+        for i in range(vlen):
+            buf = buffers[i]
+            self.iovecs[i].iov_base = PyByteArray_AS_STRING(buf)
+            self.iovecs[i].iov_len = PyByteArray_GET_SIZE(buf)
+            self.msgs[i].msg_hdr.msg_namelen = sizeof(sockaddr_in6)
+        while True:
+            with nogil:
+                ret = recvmmsg(fd, self.msgs, vlen, MSG_DONTWAIT, NULL)
+            if ret >= 0:
+                break
+            if errno == EINTR:
+                continue
+            if errno == EAGAIN or errno == EWOULDBLOCK:
+                return res
+            PyErr_SetFromErrno(OSError)
+        for i in range(<unsigned int>ret):
+            inet_ntop(AF_INET6, &self.addrs[i].sin6_addr, ip, INET6_ADDRSTRLEN)
+            res.append((self.msgs[i].msg_len, (<str>ip, ntohs(self.addrs[i].sin6_port))))
+        return res
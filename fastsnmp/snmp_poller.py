@@ -7,25 +7,29 @@ if hasattr(select, 'epoll'):
     from select import epoll as poll
     from select import EPOLLIN as POLLIN
     from select import EPOLLERR as POLLERR
+    POLL_TIMEOUT_SCALE = 1  # seconds
 elif hasattr(select, 'poll'):
     from select import poll
     from select import POLLIN
     from select import POLLERR
+    POLL_TIMEOUT_SCALE = 1000  # milliseconds
 else:
     print("The current platform does not support epoll", file=sys.stderr)
     sys.exit(1)
 
+import errno
+import heapq
 import logging
 import socket
-import queue
 import collections
 from fastsnmp import snmp_parser
 from time import time, monotonic
 from typing import List, Optional, Tuple, Union
 import random
+import zlib
 from itertools import cycle
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 try:
     import mass_resolver
@@ -36,6 +40,46 @@ DEBUG = False
 logger = logging.getLogger(__name__)
 MAX_SOCKETS_COUNT = 100
 SNMP_PORT = 161
+MAX_REQID = 0x7fffffff
+# enough for any UDP datagram
+RECV_BUFFER_SIZE = 0x10000
+# use sendmmsg()/recvmmsg() if available
+USE_MMSG = True
+# max datagrams per sendmmsg()/recvmmsg() call
+MMSG_BATCH_SIZE = 64
+# wait before next send attempt if socket buffer is full
+SEND_BLOCKED_DELAY = 0.001
+# max requests sent per turn of main loop
+SEND_BATCH_SIZE = 1000
+# rebuild heap of deadlines if it has more stale entries
+DEADLINES_COMPACT_THRESHOLD = 1000
+# max count of not finished rows per host and oids group in table mode
+MAX_PENDING_ROWS = 10000
+# error_status of response which does not fit into message
+ERROR_TOO_BIG = 1
+# adaptive max_repetitions. grow while response is fast and small, shrink on slow or large responses and timeouts
+ADAPTIVE_MAX_REPETITIONS = 250
+ADAPTIVE_GROW_FACTOR = 1.25
+ADAPTIVE_SHRINK_FACTOR = 0.5
+# fractions of timeout
+ADAPTIVE_FAST_RTT = 0.25
+ADAPTIVE_SLOW_RTT = 0.5
+# response size in bytes
+ADAPTIVE_SMALL_RESPONSE = 4096
+ADAPTIVE_LARGE_RESPONSE = 16384
+# segmented walks. table is not split if it has less rows per segment
+MIN_SEGMENT_ROWS = 2
+# change indicators of incremental mode
+SYS_UPTIME = "1.3.6.1.2.1.1.3.0"
+IF_TABLE_LAST_CHANGE = "1.3.6.1.2.1.31.1.5.0"
+# types of values of requested but not existing instances
+MISSING_TYPES = (snmp_parser.TYPE_NO_SUCH_OBJECT, snmp_parser.TYPE_NO_SUCH_INSTANCE, snmp_parser.TYPE_END_OF_MIB_VIEW)
+# seconds before unsupported OID of host is requested again
+REPROBE_INTERVAL = 6 * 3600
+# size of request which is sent without IP fragmentation
+MAX_PDU_SIZE = 1400
+# lengths of message, PDU and varbinds grow up to 3 octets each
+LENGTHS_GROWTH = 6
 
 
 class Timeout(Exception):
@@ -49,9 +93,44 @@ class Job:
     oids_to_poll: Tuple[str, ...]
     main_oids: Tuple[str, ...]
     sent: int = 0
+    # position of socket in sharded mode
+    sock: int = 0
+    # encoded request. retries send it again
+    message: Optional[bytes] = field(default=None, repr=False)
+    # oids group which is polled by job and its continuations
+    group: Tuple[str, ...] = ()
+    # max_repetitions of GetBulk request. session's value if 0
+    max_repetitions: int = 0
+    # position of segment in segmented walk and index key of its last row. not bounded if empty
+    segment: int = 0
+    stop: Tuple[int, ...] = ()
+    # (main oid, index part) of instances requested by Get in incremental mode. None for walk
+    instances: Optional[Tuple[Tuple[str, str], ...]] = None
+    # change indicators requested before instances
+    indicators: Tuple[str, ...] = ()
+    # Get jobs of the next instances. sent if indicators have not changed
+    followers: list = field(default_factory=list, repr=False)
+    # count of the first main oids which are scalars requested as non-repeaters of GetBulk
+    non_repeaters: int = 0
 
-    def new(self, oids_to_poll, ) -> 'Job':
-        return Job(name=self.name, ip=self.ip, main_oids=self.main_oids, oids_to_poll=oids_to_poll)
+    def new(self, oids_to_poll, main_oids=None) -> 'Job':
+        if main_oids is None:
+            main_oids = self.main_oids
+        return Job(name=self.name, ip=self.ip, main_oids=main_oids, oids_to_poll=oids_to_poll, sock=self.sock,
+                   group=self.group, max_repetitions=self.max_repetitions, segment=self.segment, stop=self.stop)
+
+
+@dataclass
+class RequestGroup:
+    """
+    Oids group which is polled by one request. Scalars are requested as non-repeaters of GetBulk
+    with columns or by Get if there are no columns. In segmented and incremental modes scalars
+    are requested by separate Get and columns are polled as oids group of their own
+    """
+    # OIDs of scalars. must end with .0
+    scalars: Tuple[str, ...] = ()
+    # columns with same indexes
+    columns: Tuple[str, ...] = ()
 
 
 @dataclass
@@ -62,6 +141,17 @@ class Result:
     value: Union[bytes, Exception]
     ts: float
     duration: float
+    # snmp_parser.TYPE_* code of value
+    value_type: int = snmp_parser.TYPE_UNKNOWN
+
+
+@dataclass
+class TableRow:
+    name: str
+    index_part: str
+    # main_oid => value
+    values: dict
+    ts: float
 
 
 def resolve(hosts, to_v6=True):
@@ -88,214 +178,1502 @@ def resolve(hosts, to_v6=True):
     return res
 
 
-def poller(hosts: List[str], oids_groups: List[List[str]], community: str, timeout: int = 3, backoff: int = 2, retry: int = 2,
-           msg_type="GetBulk", start_reqid: Optional[int] = None, reqid_step: int = 1, max_repetitions: int = 60):
+class RecvBuffers:
     """
-    A generator that yields SNMP data
-
-    :param hosts: hosts
-    :param oids_groups: oids_groups
-    :param community: community
-    :type hosts: list | tuple
-    :type oids_groups: list | tuple
-    :type community: str
-    :return: host, main_oid, index_part, value
-    :rtype: tuple
+    Pool of preallocated buffers. Datagrams are received into them with recvfrom_into()
+    and decoded in place, so there is no allocation per datagram
     """
-    job_queue = queue.Queue()
-    socksize = 0x2000000
-    retried_req = collections.defaultdict(int)
 
-    # message cache
-    pending_query = {}
-    # ip => fqdn
-    target_info = {}
+    def __init__(self, count: int = 1, size: int = RECV_BUFFER_SIZE):
+        self.size = size
+        self.buffers = [bytearray(size) for _ in range(count)]
 
-    # fqdn => ips
-    target_info_r = resolve(hosts)
-    reqid_to_target = {}
+    def __len__(self):
+        return len(self.buffers)
 
-    for fqdn, ips in list(target_info_r.items()):
-        if ips:
-            ip = ips[0]
-            target_info[ip] = fqdn
-        else:
-            logger.error("unable to resolve %s. skipping this host", fqdn)
-            del target_info_r[fqdn]
-
-    # preparation of targets
-    if start_reqid is None:
-        start_reqid = random.randint(1, 30000)
-
-    for oids_group in oids_groups:
-        if not isinstance(oids_group, (tuple, list)):
-            raise Exception("unexpected type of %s. expected list or tuple" % oids_group)
-        if isinstance(oids_group, list):
-            oids_group = tuple(oids_group)
-        for fqdn, ips in target_info_r.items():
-            oids_group = [x.strip(".") for x in oids_group]
-            reqid_to_target[start_reqid] = Job(name=fqdn, ip=ips[0], oids_to_poll=oids_group, main_oids=oids_group)
-            job_queue.put(start_reqid)
-            start_reqid += reqid_step
-
-    # preparation of sockets
-    epoll = poll()
+    def __getitem__(self, pos: int) -> bytearray:
+        return self.buffers[pos]
+
+
+def create_socket(rcvbuf: int = 16 * 1024 * 1024, port: int = 0, reuse_port: bool = False) -> socket.socket:
+    """
+    Create non-blocking dual-stack UDP socket for polling
+
+    :param rcvbuf: size of receive buffer
+    :param port: source port. random if 0
+    :param reuse_port: set SO_REUSEPORT
+    """
     new_sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
     new_sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, False)
-    new_sock.bind(("::", 0))
+    if reuse_port:
+        new_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    new_sock.bind(("::", port))
     new_sock.setblocking(False)
-    new_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
-    epoll.register(new_sock, POLLIN)
-
-    # main loop
-    while True:
-        qsize = job_queue.qsize()
-        for _ in range(min(qsize, 1000)):
-            pdudata_reqid = job_queue.get()
-            try:
-                job = reqid_to_target[pdudata_reqid]
-            except KeyError:
-                logger.debug("%s is not found", pdudata_reqid)
-                continue
-            message = snmp_parser.msg_encode(pdudata_reqid, community, job.oids_to_poll, max_repetitions=max_repetitions, msg_type=msg_type)
-            new_sock.sendto(message, (job.ip, SNMP_PORT))
-            job.sent = monotonic()
+    new_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    return new_sock
 
-            pending_query[pdudata_reqid] = int(time())
 
-            if DEBUG:
-                logger.debug("sendto %s reqid=%s", job, pdudata_reqid)
-            job_queue.task_done()
-
-        events = epoll.poll(0.01)
-        for fileno, event in events:
-            if event & POLLERR:
-                raise Exception("epoll error")
-            while True:
+def create_sockets(count: int, reuse_port: bool = False) -> List[socket.socket]:
+    """
+    Create sockets for sharded mode. Sockets have distinct source ports or
+    share one port with SO_REUSEPORT
+
+    :param count: count of sockets
+    :param reuse_port: bind all sockets to the same port with SO_REUSEPORT
+    """
+    if not 0 < count <= MAX_SOCKETS_COUNT:
+        raise ValueError("sockets count must be in 1..%s" % MAX_SOCKETS_COUNT)
+    socks = [create_socket(reuse_port=reuse_port)]
+    port = socks[0].getsockname()[1] if reuse_port else 0
+    for _ in range(count - 1):
+        socks.append(create_socket(port=port, reuse_port=reuse_port))
+    return socks
+
+
+def shard_for(name: str, count: int) -> int:
+    """
+    Stable position of host's socket
+    """
+    return zlib.crc32(name.encode()) % count
+
+
+def send_batch(batch_io, sock: socket.socket, messages: List[bytes], addresses: List[Tuple[str, int]]) -> int:
+    """
+    Send messages by chunks of batch_io.size datagrams per syscall
+
+    :return: count of sent messages. less than len(messages) if socket buffer is full
+    """
+    sent_count = 0
+    while sent_count < len(messages):
+        try:
+            sent = batch_io.send(sock.fileno(), messages, addresses, sent_count)
+        except OSError as e:
+            if e.errno != errno.ENOSYS:
+                raise
+            # no sendmmsg() in kernel
+            for message, address in zip(messages[sent_count:], addresses[sent_count:]):
                 try:
-                    data, remotehost = new_sock.recvfrom(socksize)
+                    sock.sendto(message, address)
                 except BlockingIOError:
                     break
-                ts = time()
-                try:
-                    pdudata_reqid, error_status, error_index, var_bind_list = snmp_parser.msg_decode(data)
-                except Exception as e:
-                    logger.critical("%r. unable to decode PDU from %s. data=%r", e, remotehost, data)
-                    continue
-                recv_time = monotonic()
-                if pdudata_reqid not in reqid_to_target:  # received after timeout?
-                    continue
-                recv_job = reqid_to_target[pdudata_reqid]
-                duration = recv_time - recv_job.sent
-                if pending_query.pop(pdudata_reqid, None) is None:
-                    if DEBUG:
-                        logger.debug("received answer after timeout from %s reqid=%s", recv_job, pdudata_reqid)
-                    continue
+                sent_count += 1
+            break
+        if not sent:
+            break
+        sent_count += sent
+    return sent_count
 
-                if error_status:
-                    logger.error("%s get error_status %s at %s", recv_job, error_status, error_index)
-                    continue
+
+def recv_batch(batch_io, sock: socket.socket, recv_buffers: RecvBuffers) -> list:
+    """
+    Receive datagrams in recv_buffers
+
+    :return: list of (nbytes, remotehost). i-th datagram is in recv_buffers[i]. empty if there is no data
+    """
+    if batch_io is not None:
+        try:
+            return batch_io.recv_into(sock.fileno(), recv_buffers.buffers)
+        except OSError as e:
+            if e.errno != errno.ENOSYS:
+                raise
+    try:
+        return [sock.recvfrom_into(recv_buffers[0])]
+    except BlockingIOError:
+        return []
+
+
+def query_timeout_for(attempt: int, timeout: float, backoff: float) -> float:
+    """
+    Time to wait for an answer on given attempt of a query
+
+    :param attempt: attempt number, starting from 1
+    :param timeout: base timeout
+    :param backoff: backoff multiplier for repeated attempts
+    :return: timeout in seconds
+    """
+    if attempt == 1:
+        return attempt * timeout
+    return attempt * backoff * timeout
+
+
+def process_response(job: Job, var_bind_list: list, msg_type: str, ts: float, duration: float, types=None):
+    """
+    Split received var_bind_list by job's main oids
+
+    :param job: job which request is answered
+    :param var_bind_list: decoded varbinds. values are converted by decoder
+    :param msg_type: type of sent request
+    :param ts: receive time
+    :param duration: request duration
+    :param types: type codes of varbinds
+    :return: list of Result and continuation job or None if walk is finished
+    :rtype: tuple
+    """
+    results = []
+    main_oids_len = len(job.main_oids)
+    main_oids_positions = cycle(range(main_oids_len))
+    var_bind_list_len = len(var_bind_list)
+
+    skip_column = {}
+    # if some oid in requested oids is not supported, column with it is index will
+    # be filled with another oid. need to skip
+    last_seen_index = {}
+
+    for var_bind_pos in range(var_bind_list_len):
+        oid, value = var_bind_list[var_bind_pos]
+        value_type = types[var_bind_pos] if types is not None else snmp_parser.TYPE_UNKNOWN
+        # oids in received var_bind_list in round-robin order respectively query
+        main_oids_pos = next(main_oids_positions)
+        if value is None or value is snmp_parser.end_of_mib_view:
+            if DEBUG:
+                logger.debug('found none value %s %s %s' % (job, oid, value))
+            skip_column[main_oids_pos] = True
+        if main_oids_pos in skip_column:
+            continue
+        main_oid = job.main_oids[main_oids_pos]
+        if msg_type == "GetBulk":
+            if oid.startswith(main_oid + "."):
+                index_part = oid[len(main_oid) + 1:]
+                last_seen_index[main_oids_pos] = index_part
+                results.append(Result(name=job.name, main_oid=main_oid, index_part=index_part, value=value, ts=ts,
+                                      duration=duration, value_type=value_type))
+            else:
                 if DEBUG:
-                    logger.debug('%s recv reqid=%s' % (recv_job, pdudata_reqid))
+                    logger.debug("host_ip=%s column_pos=%s skip oid %s=%s. Not found in %s" % (job, main_oids_pos, oid,
+                                                                                                value, job.main_oids))
+                    logger.debug("vp=%s oid=%s main_oid=%s main_oids_pos=%s main_oids=%s", var_bind_pos,
+                                 oid, main_oid, main_oids_pos, job.main_oids)
+                skip_column[main_oids_pos] = True
+                if len(skip_column) == var_bind_list_len:
+                    break
+        else:
+            results.append(Result(name=job.name, main_oid=main_oid, index_part="", value=value, ts=ts,
+                                  duration=duration, value_type=value_type))
+            skip_column[main_oids_pos] = True
 
-                reqid_to_target.pop(pdudata_reqid, None)
+    if len(skip_column) >= main_oids_len:
+        return results, None
+    positions = [pos for pos in range(main_oids_len) if pos not in skip_column]
+    oids_to_poll = tuple("%s.%s" % (job.main_oids[pos], last_seen_index[pos]) for pos in positions)
+    if skip_column:
+        # the next response contains only not finished columns
+        return results, job.new(oids_to_poll, tuple(job.main_oids[pos] for pos in positions))
+    return results, job.new(oids_to_poll)
 
-                main_oids_len = len(recv_job.main_oids)
-                main_oids_positions = cycle(range(main_oids_len))
-                var_bind_list_len = len(var_bind_list)
 
-                skip_column = {}
-                # if some oid in requested oids is not supported, column with it is index will
-                # be filled with another oid. need to skip
-                last_seen_index = {}
+def process_instances_response(job: Job, var_bind_list: list, ts: float, duration: float, types=None):
+    """
+    Split response of incremental Get by instances of job
 
-                for var_bind_pos in range(var_bind_list_len):
-                    oid, value = var_bind_list[var_bind_pos]
-                    # oids in received var_bind_list in round-robin order respectively query
-                    main_oids_pos = next(main_oids_positions)
-                    if value is None or value is snmp_parser.end_of_mib_view:
-                        if DEBUG:
-                            logger.debug('found none value %s %s %s' % (recv_job, oid, value))
-                        skip_column[main_oids_pos] = True
-                    if main_oids_pos in skip_column:
-                        continue
-                    main_oid = recv_job.main_oids[main_oids_pos]
-                    if msg_type == "GetBulk":
-                        if oid.startswith(main_oid + "."):
-                            index_part = oid[len(main_oid) + 1:]
-                            last_seen_index[main_oids_pos] = index_part
-                            res = Result(name=recv_job.name, main_oid=main_oid, index_part=index_part, value=value, ts=ts,
-                                         duration=duration)
-
-                            yield res
-                        else:
-                            if DEBUG:
-                                logger.debug(
-                                    "host_ip=%s column_pos=%s skip oid %s=%s, reqid=%s. Not found in %s" % (recv_job,
-                                                                                                            main_oids_pos,
-                                                                                                            oid,
-                                                                                                            value,
-                                                                                                            pdudata_reqid,
-                                                                                                            recv_job.main_oids))
-                                logger.debug("vp=%s oid=%s main_oid=%s main_oids_pos=%s main_oids=%s", var_bind_pos,
-                                             oid, main_oid, main_oids_pos, recv_job.main_oids)
-                            skip_column[main_oids_pos] = True
-                            if len(skip_column) == var_bind_list_len:
-                                break
-                    else:
-                        res = Result(name=recv_job.name, main_oid=main_oid, index_part="", value=value, ts=ts, duration=duration)
-                        yield res
-                        skip_column[main_oids_pos] = True
-                if len(skip_column) < main_oids_len:
-                    if len(skip_column):
-                        oids_to_poll = list()
-                        new_main_oids = list()
-                        for pos in range(main_oids_len):
-                            if pos in skip_column:
-                                continue
-                            oids_to_poll.append("%s.%s" % (recv_job.main_oids[pos], last_seen_index[pos]))
-                            new_main_oids.append(recv_job.main_oids[pos])
-                        oids_to_poll = tuple(oids_to_poll)
-                    else:
-                        oids_to_poll = tuple(
-                            "%s.%s" % (recv_job.main_oids[p], last_seen_index[p]) for p in range(main_oids_len))
+    :param job: job which request is answered
+    :param var_bind_list: decoded varbinds. values are converted by decoder
+    :param ts: receive time
+    :param duration: request duration
+    :param types: type codes of varbinds
+    :return: list of Result, change indicator => value and list of missing instances
+    :rtype: tuple
+    """
+    indicators_count = len(job.indicators)
+    indicator_values = {oid: value for oid, (_, value) in zip(job.indicators, var_bind_list)}
+    results = []
+    missing = []
+    for var_bind_pos in range(indicators_count, len(var_bind_list)):
+        value = var_bind_list[var_bind_pos][1]
+        value_type = types[var_bind_pos] if types is not None else snmp_parser.TYPE_UNKNOWN
+        if value is None or value_type in MISSING_TYPES:
+            missing.append(job.instances[var_bind_pos - indicators_count])
+            continue
+        main_oid, index_part = job.instances[var_bind_pos - indicators_count]
+        results.append(Result(name=job.name, main_oid=main_oid, index_part=index_part, value=value, ts=ts,
+                              duration=duration, value_type=value_type))
+    return results, indicator_values, missing
+
+
+def rows_of(instances: Tuple[Tuple[str, str], ...]) -> List[List[Tuple[str, str]]]:
+    """
+    Group instances in OID order by index part
+    """
+    rows = []
+    last_index_part = None
+    for instance in instances:
+        if instance[1] != last_index_part or not rows:
+            last_index_part = instance[1]
+            rows.append([])
+        rows[-1].append(instance)
+    return rows
+
+
+def process_bulk_response(job: Job, rows: list, ended: tuple, next_oids: tuple, ts: float, duration: float,
+                          types=None):
+    """
+    Same as process_response() for GetBulk response decoded by snmp_parser.bulk_response_decode()
+
+    :param job: job which request is answered
+    :param rows: (column position, index part, value) of received varbinds
+    :param ended: flags of finished columns
+    :param next_oids: oids to continue walk
+    :param ts: receive time
+    :param duration: request duration
+    :param types: type codes of rows
+    :return: list of Result and continuation job or None if walk is finished
+    :rtype: tuple
+    """
+    main_oids = job.main_oids
+    if job.stop:
+        rows, types, ended = clip_rows(rows, types, ended, job.stop)
+    if types is None:
+        results = [Result(name=job.name, main_oid=main_oids[pos], index_part=index_part, value=value, ts=ts,
+                          duration=duration) for pos, index_part, value in rows]
+    else:
+        results = [Result(name=job.name, main_oid=main_oids[pos], index_part=index_part, value=value, ts=ts,
+                          duration=duration, value_type=value_type)
+                   for (pos, index_part, value), value_type in zip(rows, types)]
+    if job.non_repeaters:
+        # scalars are at the beginning. next instance of not existing scalar is skipped
+        scalars_count = 0
+        for res, (pos, _, _) in zip(results, rows):
+            if pos >= job.non_repeaters:
+                break
+            scalars_count += 1
+        scalars = [res for res in results[:scalars_count] if res.index_part == "0"]
+        for res in scalars:
+            res.main_oid = "%s.0" % res.main_oid
+            res.index_part = ""
+        results = scalars + results[scalars_count:]
+    if all(ended):
+        return results, None
+    if any(ended):
+        # the next response contains only not finished columns
+        positions = [pos for pos in range(len(main_oids)) if not ended[pos]]
+        oids_to_poll = tuple(next_oids[pos] for pos in positions)
+        return results, job.new(oids_to_poll, tuple(main_oids[pos] for pos in positions))
+    return results, job.new(next_oids)
+
+
+def index_key(index_part: str) -> Tuple[int, ...]:
+    """
+    Sort key of index part in OID order
+    """
+    if not index_part:
+        return ()
+    return tuple(int(x) for x in index_part.split("."))
+
+
+def clip_rows(rows: list, types, ended: tuple, stop: Tuple[int, ...]):
+    """
+    Drop rows after upper bound of segment. Columns which have passed the bound are finished
+
+    :param stop: index key of the last row of segment
+    :return: rows, types and ended flags
+    :rtype: tuple
+    """
+    ended = list(ended)
+    passed = [False] * len(ended)
+    clipped_rows = []
+    clipped_types = None if types is None else []
+    for i, row in enumerate(rows):
+        pos = row[0]
+        if passed[pos]:
+            continue
+        if index_key(row[1]) > stop:
+            # rows of column are in OID order
+            passed[pos] = ended[pos] = True
+            continue
+        clipped_rows.append(row)
+        if types is not None:
+            clipped_types.append(types[i])
+    return clipped_rows, clipped_types, ended
+
+
+def split_points_for(index_parts: List[str], segments: int) -> Tuple[str, ...]:
+    """
+    Split points of table into segments with equal count of rows
+
+    :param index_parts: indexes of table in OID order
+    :param segments: count of segments
+    :return: index parts of the last rows of all segments except the last one
+    :rtype: tuple
+    """
+    count = len(index_parts)
+    if segments < 2 or count < segments * MIN_SEGMENT_ROWS:
+        return ()
+    points = []
+    for segment in range(1, segments):
+        point = index_parts[count * segment // segments - 1]
+        if not points or point != points[-1]:
+            points.append(point)
+    return tuple(points)
+
+
+class SegmentedWalk:
+    def __init__(self, count: int, record: bool):
+        self.current = 0
+        self.done = [False] * count
+        # results of segments which are ahead of current one
+        self.buffers = [[] for _ in range(count)]
+        # the latest continuation of every segment
+        self.next_jobs = [None] * count
+        # indexes of the first column. None if walk is not complete
+        self.index_parts = [] if record else None
+
+
+class SegmentMerger:
+    """
+    Orders results of segmented walks. Segments are walked concurrently,
+    results of segment are passed through when all previous segments are finished and buffered before that
+
+    :param segments: count of segments for split points learned from walks
+    """
+
+    def __init__(self, segments: int):
+        self.segments = segments
+        # (name, group) => SegmentedWalk
+        self.walks = {}
+        # (name, group) => split points learned from complete walks
+        self.learned = {}
+
+    def start(self, job: Job, count: int):
+        self.walks[(job.name, job.group)] = SegmentedWalk(count, self.segments > 1)
+
+    def emit(self, walk: SegmentedWalk, job: Job, results: List[Result], next_job: Optional[Job]):
+        if walk.index_parts is not None:
+            first_oid = job.group[0]
+            walk.index_parts.extend(res.index_part for res in results if res.main_oid == first_oid)
+        return job, results, next_job
+
+    def feed(self, job: Job, results: List[Result], next_job: Optional[Job]):
+        """
+        Add results of response
+
+        :return: (job, results, continuation) in order of walk
+        :rtype: Iterator[tuple]
+        """
+        walk_key = (job.name, job.group)
+        walk = self.walks.get(walk_key)
+        if walk is None:
+            yield job, results, next_job
+            return
+        segment = job.segment
+        walk.done[segment] = next_job is None
+        walk.next_jobs[segment] = next_job
+        if segment != walk.current:
+            walk.buffers[segment].extend(results)
+            return
+        yield self.emit(walk, job, results, next_job)
+        while walk.done[walk.current]:
+            walk.current += 1
+            if walk.current == len(walk.done):
+                del self.walks[walk_key]
+                if walk.index_parts is not None:
+                    self.learned[walk_key] = split_points_for(walk.index_parts, self.segments)
+                return
+            buffered = walk.buffers[walk.current]
+            walk.buffers[walk.current] = []
+            yield self.emit(walk, job, buffered, walk.next_jobs[walk.current])
+
+    def timeout(self, job: Job):
+        """
+        Finish timeouted segment. Split points are not learned from incomplete walk
+
+        :return: (job, results, continuation) of the next segments
+        :rtype: Iterator[tuple]
+        """
+        walk = self.walks.get((job.name, job.group))
+        if walk is not None:
+            walk.index_parts = None
+        yield from self.feed(job, [], None)
+
+    def flush(self):
+        """
+        Results of walks which are stopped by error_status
+
+        :return: (job, results, None)
+        :rtype: Iterator[tuple]
+        """
+        for (name, group), walk in list(self.walks.items()):
+            job = Job(name=name, ip="", oids_to_poll=group, main_oids=group, group=group)
+            for buffered in walk.buffers[walk.current + 1:]:
+                if buffered:
+                    yield job, buffered, None
+        self.walks.clear()
+
+
+class TableAssembler:
+    """
+    Joins columns of oids group by index. Row is emitted as soon as walks of all columns
+    have passed its index, rows of one host and oids group are emitted in OID order
+
+    :param max_pending_rows: max count of not finished rows per host and oids group.
+        the first rows are emitted without missing columns on overflow
+    """
+
+    def __init__(self, max_pending_rows: int = MAX_PENDING_ROWS):
+        self.max_pending_rows = max_pending_rows
+        # (name, group) => (index_part => TableRow, heap of (index key, index_part))
+        self.tables = {}
+
+    def pop_rows(self, table_key, until=None):
+        rows, heap = self.tables[table_key]
+        while heap and (until is None or heap[0][0] <= until):
+            _, index_part = heapq.heappop(heap)
+            yield rows.pop(index_part)
 
-                    start_reqid += reqid_step
+    def feed(self, job: Job, results: List[Result], next_job: Optional[Job]):
+        """
+        Add results of response and yield finished rows
 
-                    reqid_to_target[start_reqid] = recv_job.new(oids_to_poll)
-                    job_queue.put(start_reqid)
+        :param job: answered job
+        :param results: results of response
+        :param next_job: continuation of job or None if walk is finished
+        :rtype: Iterator[TableRow]
+        """
+        table_key = (job.name, job.group)
+        table = self.tables.get(table_key)
+        if table is None:
+            table = self.tables[table_key] = ({}, [])
+        rows, heap = table
+        for res in results:
+            row = rows.get(res.index_part)
+            if row is None:
+                row = rows[res.index_part] = TableRow(name=res.name, index_part=res.index_part, values={}, ts=res.ts)
+                heapq.heappush(heap, (index_key(res.index_part), res.index_part))
+            row.values[res.main_oid] = res.value
+            row.ts = res.ts
+        if next_job is None:
+            yield from self.pop_rows(table_key)
+            del self.tables[table_key]
+            return
+        # continued columns have passed their last indexes, finished columns have passed all
+        passed = min(index_key(oid[len(main_oid) + 1:])
+                     for oid, main_oid in zip(next_job.oids_to_poll, next_job.main_oids))
+        yield from self.pop_rows(table_key, passed)
+        while len(heap) > self.max_pending_rows:
+            _, index_part = heapq.heappop(heap)
+            yield rows.pop(index_part)
+
+    def timeout(self, job: Job, ts: float):
+        """
+        Yield pending rows of timeouted job and row with Timeout for its columns
+
+        :rtype: Iterator[TableRow]
+        """
+        table_key = (job.name, job.group)
+        if table_key in self.tables:
+            yield from self.pop_rows(table_key)
+            del self.tables[table_key]
+        timeout = Timeout()
+        yield TableRow(name=job.name, index_part="", values={main_oid: timeout for main_oid in job.main_oids}, ts=ts)
+
+    def flush(self):
+        """
+        Yield all pending rows
+
+        :rtype: Iterator[TableRow]
+        """
+        for table_key in list(self.tables):
+            yield from self.pop_rows(table_key)
+            del self.tables[table_key]
+
+
+class SendScheduler:
+    """
+    Queue of requests to send. Hosts are served in round-robin by one request,
+    retries are sent before new requests. Host with max_in_flight not answered requests waits for answer or timeout,
+    all hosts share token bucket of rate requests per second
+
+    :param max_in_flight: max count of not answered requests per host. not limited if 0
+    :param rate: max count of sent requests per second. not limited if 0
+    :param burst: size of token bucket. rate if 0
+    """
+
+    def __init__(self, max_in_flight: int = 0, rate: float = 0, burst: int = 0):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.tokens = self.burst
+        self.refilled = monotonic()
+        # name => deque of reqids. retries are at the beginning
+        self.queues = {}
+        # name => count of retries at the beginning of queue
+        self.retries = collections.Counter()
+        # (name, turn) of hosts which can send. hosts with retries go first
+        self.order = collections.deque()
+        self.retry_order = collections.deque()
+        # name => turn of host in order or retry_order. other entries of host are stale
+        self.scheduled = {}
+        self.turn = 0
+        # name => count of not answered requests
+        self.in_flight = collections.Counter()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, name: str):
+        if self.max_in_flight and self.in_flight[name] >= self.max_in_flight:
+            return
+        retry = name in self.retries
+        turn = self.scheduled.get(name)
+        if turn is not None and (not retry or turn < 0):
+            return
+        # host with retries moves from order into retry_order. turns of retry_order are negative
+        self.turn += 1
+        turn = -self.turn if retry else self.turn
+        self.scheduled[name] = turn
+        if retry:
+            self.retry_order.append((name, turn))
+        else:
+            self.order.append((name, turn))
+
+    def put(self, reqid: int, name: str, retry: bool = False):
+        host_queue = self.queues.get(name)
+        if host_queue is None:
+            host_queue = self.queues[name] = collections.deque()
+        if retry:
+            host_queue.appendleft(reqid)
+            self.retries[name] += 1
+        else:
+            host_queue.append(reqid)
+        self.count += 1
+        self.schedule(name)
+
+    def release(self, name: str):
+        self.in_flight[name] -= 1
+        if not self.in_flight[name]:
+            del self.in_flight[name]
+
+    def done(self, name: str):
+        """
+        Request of host is answered or timeouted
+        """
+        self.release(name)
+        if name in self.queues:
+            self.schedule(name)
+
+    def unsend(self, reqid: int, name: str):
+        """
+        Return popped but not sent request. It is sent before new requests
+        """
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + 1)
+        self.release(name)
+        self.put(reqid, name, retry=True)
+
+    def refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def drop_stale(self):
+        for order in (self.retry_order, self.order):
+            while order and self.scheduled.get(order[0][0]) != order[0][1]:
+                order.popleft()
+
+    def pop(self, limit: int, now: float) -> List[Tuple[int, str]]:
+        """
+        Requests which can be sent now
+
+        :return: (reqid, name)
+        """
+        self.refill(now)
+        res = []
+        while len(res) < limit:
+            self.drop_stale()
+            if not (self.retry_order or self.order):
+                break
+            if self.rate:
+                if self.tokens < 1:
+                    break
+                self.tokens -= 1
+            name, _ = self.retry_order.popleft() if self.retry_order else self.order.popleft()
+            del self.scheduled[name]
+            host_queue = self.queues[name]
+            res.append((host_queue.popleft(), name))
+            self.count -= 1
+            self.in_flight[name] += 1
+            if name in self.retries:
+                self.retries[name] -= 1
+                if not self.retries[name]:
+                    del self.retries[name]
+            if host_queue:
+                self.schedule(name)
+            else:
+                del self.queues[name]
+        return res
+
+    def wait_time(self, now: float) -> Optional[float]:
+        """
+        Seconds before the next request can be sent. None if all hosts wait for answers
+        """
+        self.drop_stale()
+        if not (self.retry_order or self.order):
+            return None
+        if not self.rate:
+            return 0
+        self.refill(now)
+        return max(1 - self.tokens, 0) / self.rate
+
+
+@dataclass
+class HostState:
+    name: str
+    ip: str
+    # position of socket in sharded mode
+    sock: int = 0
+    # max_repetitions of GetBulk requests. learned in adaptive mode
+    max_repetitions: int = 0
+    # oids group => index parts where walk is split into segments. learned in segmented mode
+    split_points: dict = field(default_factory=dict)
+    # oids group => (main oid, index part) of instances in OID order. learned from walks in incremental mode
+    instances: dict = field(default_factory=dict)
+    # (oids group, change indicator) => value
+    indicators: dict = field(default_factory=dict)
+    # not supported OID => time of detection. learned if capabilities of session are enabled
+    unsupported: dict = field(default_factory=dict)
+    # the last seen sysUpTime
+    uptime: Optional[int] = None
+    # max size of Get request of incremental mode. session's value if 0, learned from tooBig errors
+    max_pdu_size: int = 0
+
+
+class PollerSession:
+    """
+    Long-lived poller. Sockets, resolved addresses, per-host state and encoded requests
+    are kept between polling cycles
+
+    :param hosts: hosts
+    :param community: community
+    :param sockets_count: count of sockets. hosts are spread across them by hash of name
+    :param reuse_port: bind all sockets to the same port with SO_REUSEPORT
+    :param converters: main oid => converter of its values, applied by decoder.
+        name from snmp_parser.CONVERTERS or scale of numeric value
+    :param adaptive: tune max_repetitions per host by response time and size, starting from max_repetitions.
+        learned values are kept between polling cycles
+    :param max_repetitions_limit: upper bound of adaptive max_repetitions
+    :param segments: split GetBulk walks into this count of index ranges which are walked concurrently.
+        split points are learned from indexes of the previous cycle, results are merged in order
+    :param incremental: poll instances found by the previous walk of oids group with Get requests.
+        oids group is walked again if sysUpTime goes backwards, change indicator of group changes
+        or known instance is missing
+    :param change_indicators: oids group => OID or list of OIDs whose value changes with set of instances,
+        e.g. IF_TABLE_LAST_CHANGE for ifTable
+    :param capabilities: remember OIDs which are not supported by host: scalars answered with noSuchObject,
+        noSuchInstance or endOfMibView and columns whose walk leaves subtree at once. they are not requested
+        until reprobe_interval passes or sysUpTime of host goes backwards
+    :param reprobe_interval: seconds before not supported OID is requested again
+    :param max_pdu_size: max size of Get request of incremental mode in bytes. Get which is answered with tooBig
+        is split and smaller size is learned for host
+    :param max_in_flight: max count of not answered requests per host. not limited if 0
+    :param send_rate: max count of sent requests per second for all hosts. not limited if 0
+    :param send_burst: count of requests which are sent at once after idle time. send_rate if 0
+    :type hosts: list | tuple
+    :type community: str
+    :type converters: dict
+    """
+
+    def __init__(self, hosts: List[str], community: str, timeout: int = 3, backoff: int = 2, retry: int = 2,
+                 msg_type="GetBulk", start_reqid: Optional[int] = None, reqid_step: int = 1,
+                 max_repetitions: int = 60, sockets_count: int = 1, reuse_port: bool = False,
+                 converters: Optional[dict] = None, adaptive: bool = False,
+                 max_repetitions_limit: int = ADAPTIVE_MAX_REPETITIONS, segments: int = 1,
+                 incremental: bool = False, change_indicators: Optional[dict] = None, capabilities: bool = False,
+                 reprobe_interval: float = REPROBE_INTERVAL, max_pdu_size: int = MAX_PDU_SIZE,
+                 max_in_flight: int = 0, send_rate: float = 0, send_burst: int = 0):
+        self.community = community
+        self.max_pdu_size = max_pdu_size
+        self.get_header_size = len(snmp_parser.msg_encode(MAX_REQID, community, [], msg_type="Get")) + LENGTHS_GROWTH
+        self.max_in_flight = max_in_flight
+        self.send_rate = send_rate
+        self.send_burst = send_burst
+        self.capabilities = capabilities
+        self.reprobe_interval = reprobe_interval
+        self.segments = segments
+        self.incremental = incremental and msg_type == "GetBulk"
+        # oids group => change indicators
+        self.change_indicators = {}
+        for group, indicators in (change_indicators or {}).items():
+            if isinstance(indicators, str):
+                indicators = (indicators,)
+            self.change_indicators[tuple(x.strip(".") for x in group)] = (SYS_UPTIME,) + tuple(
+                x.strip(".") for x in indicators)
+        self.converters = converters
+        self.adaptive = adaptive
+        self.max_repetitions_limit = max(max_repetitions_limit, max_repetitions)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.retry = retry
+        self.msg_type = msg_type
+        self.max_repetitions = max_repetitions
+        self.reqid_step = reqid_step
+        if start_reqid is None:
+            start_reqid = random.randint(1, 30000)
+        self.reqid = start_reqid
+        self.sockets_count = sockets_count
+        # fqdn => HostState
+        self.targets = {}
+        # oids => RequestTemplate
+        self.templates = {}
+        # main oids => ResponseColumns
+        self.columns = {}
+        self.polling = False
+
+        # preparation of sockets
+        self.epoll = poll()
+        self.socks = create_sockets(sockets_count, reuse_port)
+        self.socks_by_fd = {}
+        for new_sock in self.socks:
+            self.epoll.register(new_sock, POLLIN)
+            self.socks_by_fd[new_sock.fileno()] = new_sock
+        if USE_MMSG and snmp_parser.HAVE_MMSG:
+            self.batch_io = snmp_parser.DatagramBatch(MMSG_BATCH_SIZE)
+            self.recv_buffers = RecvBuffers(MMSG_BATCH_SIZE)
+        else:
+            self.batch_io = None
+            self.recv_buffers = RecvBuffers()
+
+        self.add_hosts(hosts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_hosts(self, hosts: List[str]):
+        """
+        Resolve and add hosts which are not polled yet
+        """
+        new_hosts = [host for host in hosts if host not in self.targets]
+        if not new_hosts:
+            return
+        # fqdn => ips
+        for fqdn, ips in resolve(new_hosts).items():
+            if ips:
+                self.targets[fqdn] = HostState(name=fqdn, ip=ips[0], sock=shard_for(fqdn, self.sockets_count),
+                                               max_repetitions=self.max_repetitions)
+            else:
+                logger.error("unable to resolve %s. skipping this host", fqdn)
+
+    def remove_hosts(self, hosts: List[str]):
+        for host in hosts:
+            self.targets.pop(host, None)
+
+    def close(self):
+        self.epoll.close()
+        for new_sock in self.socks:
+            new_sock.close()
+
+    def next_reqid(self) -> int:
+        reqid = self.reqid
+        self.reqid += self.reqid_step
+        if self.reqid > MAX_REQID:
+            self.reqid = 1
+        return reqid
+
+    def template_for(self, oids: Tuple[str, ...], max_repetitions: int,
+                     non_repeaters: int = 0) -> snmp_parser.RequestTemplate:
+        template = self.templates.get((oids, max_repetitions, non_repeaters))
+        if template is None:
+            template = snmp_parser.RequestTemplate(self.community, oids, msg_type=self.msg_type,
+                                                   max_repetitions=max_repetitions, non_repeaters=non_repeaters)
+            self.templates[(oids, max_repetitions, non_repeaters)] = template
+        return template
+
+    def columns_for(self, main_oids: Tuple[str, ...], non_repeaters: int = 0) -> snmp_parser.ResponseColumns:
+        columns = self.columns.get((main_oids, non_repeaters))
+        if columns is None:
+            columns = snmp_parser.ResponseColumns(main_oids, self.converters, non_repeaters)
+            self.columns[(main_oids, non_repeaters)] = columns
+        return columns
+
+    def converters_for(self, job: Job) -> Optional[snmp_parser.ResponseColumns]:
+        """
+        Converters of values of Get response in order of varbinds. None if values are not converted
+        """
+        if not self.converters:
+            return None
+        if job.instances is None:
+            return self.columns_for(job.main_oids)
+        return self.columns_for(job.indicators + tuple(main_oid for main_oid, _ in job.instances))
+
+    def encode(self, reqid: int, job: Job) -> bytes:
+        if job.message is None:
+            max_repetitions = job.max_repetitions or self.max_repetitions
+            if job.instances is not None:
+                job.message = snmp_parser.msg_encode(reqid, self.community, job.oids_to_poll, msg_type="Get")
+            elif job.oids_to_poll is job.main_oids:
+                # first request of oids group is the same for all hosts and cycles
+                job.message = self.template_for(job.oids_to_poll, max_repetitions, job.non_repeaters).encode(reqid)
+            else:
+                job.message = snmp_parser.msg_encode(reqid, self.community, job.oids_to_poll,
+                                                     max_repetitions=max_repetitions, msg_type=self.msg_type,
+                                                     non_repeaters=job.non_repeaters)
+        return job.message
+
+    def repetitions_for(self, name: str) -> int:
+        target = self.targets.get(name)
+        if target is None or not self.adaptive:
+            return self.max_repetitions
+        return target.max_repetitions
+
+    def adapt(self, job: Job, duration: Optional[float] = None, nbytes: int = 0, walk_continues: bool = False):
+        """
+        Tune max_repetitions of job's host by answer. duration is None for timeout
+        """
+        target = self.targets.get(job.name)
+        if target is None:
+            return
+        current = job.max_repetitions or target.max_repetitions
+        if duration is None or duration > self.timeout * ADAPTIVE_SLOW_RTT or nbytes > ADAPTIVE_LARGE_RESPONSE:
+            target.max_repetitions = max(1, min(target.max_repetitions, int(current * ADAPTIVE_SHRINK_FACTOR)))
+        elif walk_continues and duration < self.timeout * ADAPTIVE_FAST_RTT and nbytes < ADAPTIVE_SMALL_RESPONSE:
+            target.max_repetitions = min(self.max_repetitions_limit,
+                                         max(target.max_repetitions, int(current * ADAPTIVE_GROW_FACTOR) + 1))
+
+    def poll(self, oids_groups: List[List[str]], split_points: Optional[dict] = None):
+        """
+        A generator that yields SNMP data
+
+        :param oids_groups: oids groups or RequestGroup for all hosts or host => list of them, e.g. from planner
+        :param split_points: oids group => index parts where walks of group are split into segments.
+            overrides learned split points
+        :type oids_groups: list | tuple
+        :return: host, main_oid, index_part, value
+        :rtype: Result
+        """
+        if self.polling:
+            raise RuntimeError("session is already polling")
+        self.polling = True
+        try:
+            yield from self._poll(oids_groups, split_points=split_points)
+        finally:
+            self.polling = False
+
+    def poll_table(self, oids_groups: List[List[str]], max_pending_rows: int = MAX_PENDING_ROWS,
+                   split_points: Optional[dict] = None):
+        """
+        A generator that yields rows of tables. Values of oids group are joined by index,
+        row is yielded as soon as all columns of group have passed its index
+
+        :param oids_groups: oids_groups
+        :param max_pending_rows: max count of not finished rows per host and oids group
+        :param split_points: oids group => index parts where walks of group are split into segments
+        :type oids_groups: list | tuple
+        :return: host, index_part, main_oid => value
+        :rtype: TableRow
+        """
+        if self.polling:
+            raise RuntimeError("session is already polling")
+        self.polling = True
+        try:
+            yield from self._poll(oids_groups, TableAssembler(max_pending_rows), split_points)
+        finally:
+            self.polling = False
+
+    def segment_jobs(self, job: Job, points: Tuple[str, ...]) -> List[Job]:
+        """
+        Split walk of job into segments. Segment walks from the last row of the previous one
+        to its split point inclusive
+        """
+        jobs = []
+        for segment in range(len(points) + 1):
+            if segment:
+                oids_to_poll = tuple("%s.%s" % (main_oid, points[segment - 1]) for main_oid in job.main_oids)
+            else:
+                oids_to_poll = job.oids_to_poll
+            stop = index_key(points[segment]) if segment < len(points) else ()
+            jobs.append(Job(name=job.name, ip=job.ip, oids_to_poll=oids_to_poll, main_oids=job.main_oids,
+                            sock=job.sock, group=job.group, max_repetitions=job.max_repetitions, segment=segment,
+                            stop=stop))
+        return jobs
+
+    @staticmethod
+    def instances_job(job: Job, instances: Tuple[Tuple[str, str], ...], indicators: Tuple[str, ...] = ()) -> Job:
+        oids_to_poll = indicators + tuple("%s.%s" % instance for instance in instances)
+        return Job(name=job.name, ip=job.ip, oids_to_poll=oids_to_poll, main_oids=job.main_oids, sock=job.sock,
+                   group=job.group, instances=tuple(instances), indicators=indicators)
+
+    def instances_jobs(self, job: Job, instances: Tuple[Tuple[str, str], ...]) -> List[Job]:
+        """
+        Get jobs of known instances of oids group. Every job gets whole rows, as many as GetBulk request does
+        and as many as fit into max_pdu_size of host. The first job requests change indicators too,
+        the next ones are its followers
+        """
+        rows_per_job = job.max_repetitions or self.max_repetitions
+        target = self.targets.get(job.name)
+        max_pdu_size = target.max_pdu_size if target is not None and target.max_pdu_size else self.max_pdu_size
+        max_size = max_pdu_size - self.get_header_size
+        indicators = self.change_indicators.get(job.group, (SYS_UPTIME,))
+        size = sum(len(snmp_parser.encode_varbind(oid)) for oid in indicators)
+        chunks = [[]]
+        rows = 0
+        for row in rows_of(instances):
+            row_size = sum(len(snmp_parser.encode_varbind("%s.%s" % instance)) for instance in row)
+            if rows and (rows >= rows_per_job or size + row_size > max_size):
+                chunks.append([])
+                rows = 0
+                size = 0
+            chunks[-1].extend(row)
+            rows += 1
+            size += row_size
+        jobs = [self.instances_job(job, chunks[0], indicators)]
+        jobs.extend(self.instances_job(job, chunk) for chunk in chunks[1:])
+        jobs[0].followers = jobs[1:]
+        return jobs[:1]
+
+    def split_instances_job(self, job: Job) -> Optional[Job]:
+        """
+        Split Get job which is answered with tooBig into two jobs by whole rows.
+        The second half is follower of the first one. Half size of request is learned for host
+
+        :return: the first half or None if job has one row
+        """
+        rows = list(rows_of(job.instances))
+        if len(rows) < 2:
+            return None
+        target = self.targets.get(job.name)
+        if target is not None and job.message is not None:
+            target.max_pdu_size = len(job.message) // 2
+        half = len(rows) // 2
+        first = self.instances_job(job, sum(rows[:half], []), job.indicators)
+        first.followers = [self.instances_job(job, sum(rows[half:], []))] + job.followers
+        return first
+
+    def supported(self, target: HostState, oids: Tuple[str, ...], now: float) -> Tuple[str, ...]:
+        """
+        OIDs which are supported by host or should be probed again
+        """
+        if not self.capabilities or not target.unsupported:
+            return oids
+        unsupported = target.unsupported
+        return tuple(oid for oid in oids if now - unsupported.get(oid, -self.reprobe_interval) >= self.reprobe_interval)
+
+    def uptime_seen(self, name: str, uptime: int):
+        """
+        Store sysUpTime of host. Agent is restarted if it goes backwards, so its OIDs are probed again
+        """
+        target = self.targets.get(name)
+        if target is None:
+            return
+        if target.uptime is not None and uptime < target.uptime and target.unsupported:
+            logger.debug("%s is restarted. probe not supported OIDs", name)
+            target.unsupported.clear()
+        target.uptime = uptime
+
+    def learn_capabilities(self, job: Job, results: List[Result], rows: Optional[list], next_job: Optional[Job],
+                           missing: List[str], now: float):
+        """
+        Mark OIDs which are not supported by job's host
+
+        :param rows: rows of GetBulk response. None for Get
+        :param missing: OIDs which are answered with noSuchObject, noSuchInstance or endOfMibView by Get
+        """
+        target = self.targets.get(job.name)
+        if target is None:
+            return
+        for res in results:
+            if res.main_oid == SYS_UPTIME and isinstance(res.value, int):
+                self.uptime_seen(job.name, res.value)
+        unsupported = list(missing)
+        if rows is not None and job.segment == 0 and job.oids_to_poll == job.main_oids and (rows or next_job is None):
+            # the first response of walk contains the first varbind of every column
+            found = set()
+            for pos, index_part, _ in rows:
+                if pos >= job.non_repeaters or index_part == "0":
+                    found.add(pos)
+            for pos, main_oid in enumerate(job.main_oids):
+                if pos not in found:
+                    unsupported.append("%s.0" % main_oid if pos < job.non_repeaters else main_oid)
+        for oid in unsupported:
+            if DEBUG:
+                logger.debug("%s does not support %s", job.name, oid)
+            target.unsupported[oid] = now
+
+    def indicators_changed(self, job: Job, indicator_values: dict) -> bool:
+        """
+        Compare change indicators with the previous values and store them
+        """
+        target = self.targets.get(job.name)
+        if target is None:
+            return False
+        changed = False
+        for oid, value in indicator_values.items():
+            if not isinstance(value, int):
+                # not supported by agent
+                continue
+            if oid == SYS_UPTIME:
+                self.uptime_seen(job.name, value)
+            prev_value = target.indicators.get((job.group, oid))
+            if prev_value is not None:
+                if oid == SYS_UPTIME:
+                    changed = changed or value < prev_value
                 else:
+                    changed = changed or value != prev_value
+            target.indicators[(job.group, oid)] = value
+        return changed
+
+    def targets_groups(self, oids_groups):
+        """
+        (target, oids group) pairs to poll
+
+        :param oids_groups: oids groups for all hosts or host => oids groups
+        """
+        if isinstance(oids_groups, dict):
+            pairs = [(self.targets[name], oids_group) for name, groups in oids_groups.items() if name in self.targets
+                     for oids_group in groups]
+        else:
+            pairs = [(target, oids_group) for oids_group in oids_groups for target in self.targets.values()]
+        for target, oids_group in pairs:
+            if isinstance(oids_group, RequestGroup):
+                yield target, oids_group
+            elif isinstance(oids_group, (tuple, list)):
+                yield target, RequestGroup(columns=tuple(x.strip(".") for x in oids_group))
+            else:
+                raise Exception("unexpected type of %s. expected list or tuple" % oids_group)
+
+    def _poll(self, oids_groups: List[List[str]], assembler: Optional[TableAssembler] = None,
+              split_points: Optional[dict] = None):
+        timeout = self.timeout
+        backoff = self.backoff
+        retry = self.retry
+        msg_type = self.msg_type
+        socks = self.socks
+        socks_by_fd = self.socks_by_fd
+        epoll = self.epoll
+        batch_io = self.batch_io
+        recv_buffers = self.recv_buffers
+
+        scheduler = SendScheduler(self.max_in_flight, self.send_rate, self.send_burst)
+        retried_req = collections.defaultdict(int)
+        # reqid => deadline of pending query
+        pending_query = {}
+        # heap of (deadline, reqid). entries of answered queries are removed lazily
+        deadlines = []
+        reqid_to_target = {}
+        # reqid => ResponseColumns of GetBulk request
+        reqid_columns = {}
+        # reqid => ResponseColumns with converters of Get request
+        reqid_converters = {}
+        is_bulk = msg_type == "GetBulk"
+        merger = None
+        if is_bulk and (self.segments > 1 or split_points):
+            merger = SegmentMerger(self.segments)
+            if split_points:
+                split_points = {tuple(x.strip(".") for x in group): tuple(points)
+                                for group, points in split_points.items()}
+
+        # (name, oids group) => found instances of walks in incremental mode
+        walked = {}
+        # (name, oids group) of walks which are not complete
+        broken_walks = set()
+
+        def enqueue(new_job: Job):
+            new_reqid = self.next_reqid()
+            reqid_to_target[new_reqid] = new_job
+            if is_bulk and new_job.instances is None:
+                reqid_columns[new_reqid] = self.columns_for(new_job.main_oids, new_job.non_repeaters)
+            else:
+                columns = self.converters_for(new_job)
+                if columns is not None:
+                    reqid_converters[new_reqid] = columns
+            scheduler.put(new_reqid, new_job.name)
+
+        def start_walk(target: HostState, walk_job: Job):
+            if merger is None:
+                walk_jobs = [walk_job]
+            else:
+                points = split_points.get(walk_job.group) if split_points else None
+                if points is None:
+                    points = target.split_points.get(walk_job.group, ())
+                walk_jobs = self.segment_jobs(walk_job, points)
+                merger.start(walk_job, len(walk_jobs))
+            if self.incremental:
+                walked[(walk_job.name, walk_job.group)] = {}
+            for new_job in walk_jobs:
+                enqueue(new_job)
+
+        def walk_again(target: HostState, instances_job: Job):
+            target.instances.pop(instances_job.group, None)
+            start_walk(target, Job(name=instances_job.name, ip=instances_job.ip, oids_to_poll=instances_job.group,
+                                   main_oids=instances_job.group, sock=instances_job.sock, group=instances_job.group,
+                                   max_repetitions=self.repetitions_for(instances_job.name)))
+
+        def fall_back(failed_job: Job) -> bool:
+            """
+            Forget instances of failed Get job, so group is walked again. Group is walked at once
+            if it is the first job and no results of group are yielded yet, otherwise in the next cycle
+
+            :return: True if results of group come from walk
+            """
+            walk_key = (failed_job.name, failed_job.group)
+            if walk_key in walked:
+                # indicators for walk
+                return True
+            target = self.targets.get(failed_job.name)
+            if target is not None and failed_job.indicators:
+                walk_again(target, failed_job)
+                return True
+            if target is not None:
+                target.instances.pop(failed_job.group, None)
+            for follower in failed_job.followers:
+                enqueue(follower)
+            return False
+
+        # preparation of targets
+        now = time()
+        for target, request_group in self.targets_groups(oids_groups):
+            scalars = tuple(x.strip(".") for x in request_group.scalars)
+            columns = tuple(x.strip(".") for x in request_group.columns)
+            oids_group = scalars + columns
+            if self.capabilities:
+                scalars = self.supported(target, scalars, now)
+                polled_oids = scalars + self.supported(target, columns, now)
+                if not polled_oids:
+                    continue
+            else:
+                polled_oids = oids_group
+            job = Job(name=target.name, ip=target.ip, oids_to_poll=polled_oids, main_oids=polled_oids,
+                      sock=target.sock, group=oids_group, max_repetitions=self.repetitions_for(target.name))
+            if scalars and is_bulk:
+                if not all(oid.endswith(".0") for oid in scalars):
+                    raise ValueError("scalars of %s must end with .0" % (request_group,))
+                if len(scalars) == len(polled_oids):
+                    job.instances = tuple((oid, "") for oid in scalars)
+                    enqueue(job)
+                    continue
+                if merger is None and not self.incremental:
+                    # GetNext of scalar without .0 returns its value
+                    job.main_oids = job.oids_to_poll = tuple(oid[:-2] for oid in scalars) + polled_oids[len(scalars):]
+                    job.non_repeaters = len(scalars)
+                    enqueue(job)
+                    continue
+                # columns are walked in segments or polled by Gets of known instances, scalars are requested by Get
+                enqueue(Job(name=target.name, ip=target.ip, oids_to_poll=scalars, main_oids=scalars, sock=target.sock,
+                            group=scalars, instances=tuple((oid, "") for oid in scalars)))
+                oids_group = columns
+                polled_columns = polled_oids[len(scalars):]
+                job = Job(name=target.name, ip=target.ip, oids_to_poll=polled_columns, main_oids=polled_columns,
+                          sock=target.sock, group=columns, max_repetitions=self.repetitions_for(target.name))
+            instances = target.instances.get(oids_group) if self.incremental else None
+            if instances is None:
+                start_walk(target, job)
+                if self.incremental:
+                    # the first values of change indicators
+                    enqueue(self.instances_jobs(job, ())[0])
+            else:
+                enqueue(self.instances_jobs(job, instances)[0])
+
+        # main loop
+        while True:
+            # socket position => (reqids, messages, addresses)
+            send_groups = collections.defaultdict(lambda: ([], [], []))
+            for pdudata_reqid, name in scheduler.pop(SEND_BATCH_SIZE, monotonic()):
+                try:
+                    job = reqid_to_target[pdudata_reqid]
+                except KeyError:
+                    logger.debug("%s is not found", pdudata_reqid)
+                    scheduler.done(name)
+                    continue
+                message = self.encode(pdudata_reqid, job)
+                if batch_io is None:
+                    socks[job.sock].sendto(message, (job.ip, SNMP_PORT))
+                    job.sent = monotonic()
+                    deadline = job.sent + query_timeout_for(retried_req.get(pdudata_reqid, 1), timeout, backoff)
+                    pending_query[pdudata_reqid] = deadline
+                    heapq.heappush(deadlines, (deadline, pdudata_reqid))
                     if DEBUG:
-                        logger.debug('found not interesting oid=%s value=%s job=%s reqid=%s',
-                                     oid, value, recv_job, pdudata_reqid)
-
-        if pending_query:  # check timeouts
-            cur_time = int(time())
-            timeouted_querys = []
-            for query, query_time in pending_query.items():
-                attempt = retried_req.get(query, 1)
-                if attempt == 1:
-                    query_timeout = attempt * timeout
+                        logger.debug("sendto %s reqid=%s", job, pdudata_reqid)
                 else:
-                    query_timeout = attempt * backoff * timeout
-                if cur_time - query_time > query_timeout:
-                    timeouted_querys.append(query)
+                    send_reqids, messages, addresses = send_groups[job.sock]
+                    send_reqids.append(pdudata_reqid)
+                    messages.append(message)
+                    addresses.append((job.ip, SNMP_PORT))
+
+            send_blocked = False
+            for sock_pos, (send_reqids, messages, addresses) in send_groups.items():
+                sent_count = send_batch(batch_io, socks[sock_pos], messages, addresses)
+                sent_time = monotonic()
+                for pdudata_reqid in send_reqids[:sent_count]:
+                    job = reqid_to_target[pdudata_reqid]
+                    job.sent = sent_time
+                    deadline = sent_time + query_timeout_for(retried_req.get(pdudata_reqid, 1), timeout, backoff)
+                    pending_query[pdudata_reqid] = deadline
+                    heapq.heappush(deadlines, (deadline, pdudata_reqid))
                     if DEBUG:
-                        logger.debug("timeout %s > %s. attempt=%s, %s", cur_time - query_time, query_timeout, attempt, query)
+                        logger.debug("sendto %s reqid=%s", job, pdudata_reqid)
+                # socket buffer is full. send the rest in the next turn
+                for pdudata_reqid in send_reqids[sent_count:]:
+                    scheduler.unsend(pdudata_reqid, reqid_to_target[pdudata_reqid].name)
+                if sent_count < len(messages):
+                    send_blocked = True
+
+            # wait for answers until the nearest deadline
             cmt = monotonic()
-            for timeouted_query in timeouted_querys:
+            poll_timeout = max(deadlines[0][0] - cmt, 0) if deadlines else 0
+            send_wait = scheduler.wait_time(cmt)
+            if send_blocked:
+                poll_timeout = SEND_BLOCKED_DELAY
+            elif send_wait is not None:
+                # the next request waits for token of send rate
+                poll_timeout = min(poll_timeout, send_wait) if deadlines else send_wait
+            events = epoll.poll(poll_timeout * POLL_TIMEOUT_SCALE)
+            ready_socks = []
+            for fileno, event in events:
+                if event & POLLERR:
+                    raise Exception("epoll error")
+                ready_socks.append(socks_by_fd[fileno])
+            # drain sockets in round-robin by one batch
+            while ready_socks:
+                not_drained_socks = []
+                for ready_sock in ready_socks:
+                    received = recv_batch(batch_io, ready_sock, recv_buffers)
+                    if not received:
+                        continue
+                    not_drained_socks.append(ready_sock)
+                    for recv_buffer, (nbytes, remotehost) in zip(recv_buffers.buffers, received):
+                        ts = time()
+                        try:
+                            rows = None
+                            if is_bulk:
+                                pdudata_reqid, error_status, error_index, rows, ended, next_oids, types = \
+                                    snmp_parser.bulk_response_decode(recv_buffer, reqid_columns, 0, nbytes,
+                                                                     with_types=True)
+                            if rows is None:
+                                # response to Get or not pending request
+                                pdudata_reqid, error_status, error_index, var_bind_list, types = \
+                                    snmp_parser.msg_decode(recv_buffer, 0, nbytes, with_types=True,
+                                                           columns=reqid_converters)
+                        except Exception as e:
+                            logger.critical("%r. unable to decode PDU from %s. data=%r", e, remotehost,
+                                            bytes(recv_buffer[:nbytes]))
+                            continue
+                        recv_time = monotonic()
+                        if pdudata_reqid not in reqid_to_target:  # received after timeout?
+                            continue
+                        recv_job = reqid_to_target[pdudata_reqid]
+                        duration = recv_time - recv_job.sent
+                        if pending_query.pop(pdudata_reqid, None) is None:
+                            if DEBUG:
+                                logger.debug("received answer after timeout from %s reqid=%s", recv_job,
+                                             pdudata_reqid)
+                            continue
+                        scheduler.done(recv_job.name)
+                        reqid_converters.pop(pdudata_reqid, None)
+
+                        is_walk = rows is not None
+                        if error_status == ERROR_TOO_BIG and is_walk:
+                            max_repetitions = recv_job.max_repetitions or self.max_repetitions
+                            if max_repetitions > 1:
+                                # resend with smaller bulk
+                                recv_job.max_repetitions = max(1, int(max_repetitions * ADAPTIVE_SHRINK_FACTOR))
+                                recv_job.message = None
+                                if self.adaptive:
+                                    self.adapt(recv_job)
+                                if DEBUG:
+                                    logger.debug("%s tooBig. resend with max_repetitions=%s", recv_job,
+                                                 recv_job.max_repetitions)
+                                scheduler.put(pdudata_reqid, recv_job.name, retry=True)
+                                continue
+                        if error_status == ERROR_TOO_BIG and recv_job.instances is not None:
+                            split_job = self.split_instances_job(recv_job)
+                            if split_job is not None:
+                                if DEBUG:
+                                    logger.debug("%s tooBig. split into halves", recv_job)
+                                reqid_to_target.pop(pdudata_reqid, None)
+                                enqueue(split_job)
+                                continue
+                        if error_status:
+                            logger.error("%s get error_status %s at %s", recv_job, error_status, error_index)
+                            if recv_job.instances is None:
+                                broken_walks.add((recv_job.name, recv_job.group))
+                            else:
+                                reqid_to_target.pop(pdudata_reqid, None)
+                                fall_back(recv_job)
+                            continue
+                        if DEBUG:
+                            logger.debug('%s recv reqid=%s' % (recv_job, pdudata_reqid))
+
+                        reqid_to_target.pop(pdudata_reqid, None)
+
+                        if is_walk:
+                            reqid_columns.pop(pdudata_reqid, None)
+                            results, next_job = process_bulk_response(recv_job, rows, ended, next_oids, ts,
+                                                                      duration, types)
+                            walk_instances = walked.get((recv_job.name, recv_job.group))
+                            if walk_instances is not None:
+                                for res in results:
+                                    walk_instances[(res.main_oid, res.index_part)] = None
+                        elif recv_job.instances is not None:
+                            results, indicator_values, missing = process_instances_response(
+                                recv_job, var_bind_list, ts, duration, types)
+                            next_job = None
+                            walk_key = (recv_job.name, recv_job.group)
+                            target = self.targets.get(recv_job.name)
+                            changed = self.indicators_changed(recv_job, indicator_values)
+                            # indicators are requested with walk in the same cycle to detect next changes
+                            if walk_key not in walked and (changed or (missing and recv_job.indicators)):
+                                if DEBUG:
+                                    logger.debug("%s set of instances is changed. walk", recv_job)
+                                results = []
+                                if target is not None:
+                                    walk_again(target, recv_job)
+                            else:
+                                if missing and target is not None:
+                                    # results of previous Gets are yielded already. walk in the next cycle
+                                    target.instances.pop(recv_job.group, None)
+                                for follower in recv_job.followers:
+                                    enqueue(follower)
+                        else:
+                            results, next_job = process_response(recv_job, var_bind_list, msg_type, ts, duration,
+                                                                 types)
+                            missing = [(res.main_oid, res.index_part) for res in results
+                                       if res.value is None or res.value_type in MISSING_TYPES]
+                        if self.capabilities:
+                            if is_walk:
+                                self.learn_capabilities(recv_job, results, rows, next_job, [], ts)
+                            else:
+                                # missing instances of tables are changes of incremental mode
+                                self.learn_capabilities(recv_job, results, None, None,
+                                                        [oid for oid, index_part in missing if not index_part], ts)
+                        if self.adaptive and is_walk:
+                            self.adapt(recv_job, duration, nbytes, next_job is not None)
+                        if merger is not None and is_walk:
+                            for merged_job, merged_results, merged_next_job in merger.feed(recv_job, results,
+                                                                                           next_job):
+                                if assembler is None:
+                                    yield from merged_results
+                                else:
+                                    yield from assembler.feed(merged_job, merged_results, merged_next_job)
+                        elif assembler is None:
+                            yield from results
+                        elif is_walk or (recv_job.name, recv_job.group) not in walked:
+                            # indicators requested with walk must not finish table of walk
+                            yield from assembler.feed(recv_job, results, next_job)
+                        if next_job:
+                            if self.adaptive:
+                                next_job.max_repetitions = self.repetitions_for(next_job.name)
+                            enqueue(next_job)
+                        elif DEBUG:
+                            logger.debug('walk is finished job=%s reqid=%s', recv_job, pdudata_reqid)
+                ready_socks = not_drained_socks
+
+            # check timeouts
+            cmt = monotonic()
+            while deadlines and deadlines[0][0] <= cmt:
+                deadline, timeouted_query = heapq.heappop(deadlines)
+                if pending_query.get(timeouted_query) != deadline:  # answered or resent
+                    continue
+                del pending_query[timeouted_query]
+                scheduler.done(reqid_to_target[timeouted_query].name)
+                if DEBUG:
+                    logger.debug("timeout %s. attempt=%s", timeouted_query, retried_req.get(timeouted_query, 1))
                 if retried_req[timeouted_query] < retry:
                     if DEBUG:
                         logger.debug("resend %s", timeouted_query)
-                    job_queue.put(timeouted_query)
+                    retried_job = reqid_to_target[timeouted_query]
+                    if self.adaptive and is_bulk and retried_job.instances is None:
+                        # retry with smaller bulk
+                        self.adapt(retried_job)
+                        retried_job.max_repetitions = self.repetitions_for(retried_job.name)
+                        retried_job.message = None
+                    scheduler.put(timeouted_query, retried_job.name, retry=True)
                     retried_req[timeouted_query] += 1
                 else:
                     timeouted_job = reqid_to_target.pop(timeouted_query)
+                    reqid_columns.pop(timeouted_query, None)
+                    reqid_converters.pop(timeouted_query, None)
                     logger.debug("%s query timeout", timeouted_job)
                     duration = cmt - timeouted_job.sent
-                    res = Result(name=timeouted_job.name, main_oid=timeouted_job.main_oids, index_part="", value=Timeout(),
-                                 ts=time(), duration=duration)
-                    yield res
-                del pending_query[timeouted_query]
-        elif job_queue.empty():
-            break
+                    walk_key = (timeouted_job.name, timeouted_job.group)
+                    if timeouted_job.instances is None:
+                        broken_walks.add(walk_key)
+                    elif fall_back(timeouted_job):
+                        # timeout of walk is reported
+                        continue
+                    if assembler is None:
+                        yield Result(name=timeouted_job.name, main_oid=timeouted_job.main_oids, index_part="",
+                                     value=Timeout(), ts=time(), duration=duration)
+                    else:
+                        yield from assembler.timeout(timeouted_job, time())
+                    if merger is not None and timeouted_job.instances is None:
+                        for merged_job, merged_results, merged_next_job in merger.timeout(timeouted_job):
+                            if assembler is None:
+                                yield from merged_results
+                            else:
+                                yield from assembler.feed(merged_job, merged_results, merged_next_job)
+            if len(deadlines) > 2 * len(pending_query) + DEADLINES_COMPACT_THRESHOLD:
+                deadlines = [item for item in deadlines if pending_query.get(item[1]) == item[0]]
+                heapq.heapify(deadlines)
+            if not pending_query and not scheduler:
+                break
+        if merger is not None:
+            for merged_job, merged_results, _ in merger.flush():
+                if assembler is None:
+                    yield from merged_results
+                else:
+                    yield from assembler.feed(merged_job, merged_results, None)
+            for (name, group), points in merger.learned.items():
+                target = self.targets.get(name)
+                if target is not None:
+                    target.split_points[group] = points
+        for walk_key, walk_instances in walked.items():
+            target = self.targets.get(walk_key[0])
+            if target is None or walk_key in broken_walks:
+                continue
+            group = walk_key[1]
+            positions = {main_oid: pos for pos, main_oid in enumerate(group)}
+            target.instances[group] = tuple(sorted(
+                walk_instances, key=lambda instance: (index_key(instance[1]), positions.get(instance[0], 0))))
+        if assembler is not None:
+            # walks which are stopped by error_status
+            yield from assembler.flush()
+
+
+def poller(hosts: List[str], oids_groups: List[List[str]], community: str, timeout: int = 3, backoff: int = 2, retry: int = 2,
+           msg_type="GetBulk", start_reqid: Optional[int] = None, reqid_step: int = 1, max_repetitions: int = 60,
+           sockets_count: int = 1, reuse_port: bool = False, converters: Optional[dict] = None,
+           adaptive: bool = False, split_points: Optional[dict] = None, max_in_flight: int = 0,
+           send_rate: float = 0):
+    """
+    A generator that yields SNMP data. One-shot PollerSession
+
+    :param hosts: hosts
+    :param oids_groups: oids_groups
+    :param community: community
+    :param sockets_count: count of sockets. hosts are spread across them by hash of name
+    :param reuse_port: bind all sockets to the same port with SO_REUSEPORT
+    :param converters: main oid => converter of its values. see PollerSession
+    :param adaptive: tune max_repetitions per host. see PollerSession
+    :param split_points: oids group => index parts where walks of group are split into concurrent segments
+    :param max_in_flight: max count of not answered requests per host. not limited if 0
+    :param send_rate: max count of sent requests per second. not limited if 0
+    :type hosts: list | tuple
+    :type oids_groups: list | tuple
+    :type community: str
+    :return: host, main_oid, index_part, value
+    :rtype: tuple
+    """
+    session = PollerSession(hosts, community, timeout=timeout, backoff=backoff, retry=retry, msg_type=msg_type,
+                            start_reqid=start_reqid, reqid_step=reqid_step, max_repetitions=max_repetitions,
+                            sockets_count=sockets_count, reuse_port=reuse_port, converters=converters,
+                            adaptive=adaptive, max_in_flight=max_in_flight, send_rate=send_rate)
+    try:
+        yield from session.poll(oids_groups, split_points)
+    finally:
+        session.close()
+
+
+def table_poller(hosts: List[str], oids_groups: List[List[str]], community: str,
+                 max_pending_rows: int = MAX_PENDING_ROWS, **poller_kwargs):
+    """
+    A generator that yields rows of tables. Takes the same arguments as poller()
+
+    :param max_pending_rows: max count of not finished rows per host and oids group
+    :return: host, index_part, main_oid => value
+    :rtype: TableRow
+    """
+    session = PollerSession(hosts, community, **poller_kwargs)
+    try:
+        yield from session.poll_table(oids_groups, max_pending_rows)
+    finally:
+        session.close()
@@ -1,10 +1,19 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
+import array
 import unittest
 import pstats
 import logging as log
 import cProfile
-from fastsnmp import snmp_parser
+import asyncio
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import time
+from unittest import mock
+from fastsnmp import snmp_parser, snmp_poller, async_poller, parallel_poller, columnar, rates, labels, planner
 
 OID1 = "1.2.1"
 OID2 = "1.2.2"
@@ -257,6 +266,114 @@ class TestSnmpParser(unittest.TestCase):
         msg_decoded = snmp_parser.msg_decode(msg)
         self.assertEqual(encoded, msg_decoded)
 
+    def test_decode_buffer(self):
+        msg = snmp_parser.msg_encode(1234, "public", ["1.2.3"], msg_type="Response")
+        buf = bytearray(b'\xff' * 7 + msg + b'\xff' * 100)
+        expected = (1234, 0, 0, [['1.2.3', None]])
+        self.assertEqual(snmp_parser.msg_decode(buf, 7, len(msg)), expected)
+        self.assertEqual(snmp_parser.msg_decode(memoryview(buf)[7:7 + len(msg)]), expected)
+        with self.assertRaises(ValueError):
+            snmp_parser.msg_decode(buf, 7, len(buf))
+        with self.assertRaises(snmp_parser.DecodeException):
+            snmp_parser.msg_decode(buf, 7, len(msg) - 1)
+
+    def test_msg_decode_many(self):
+        varbinds = [("1.3.6.1.2.1.1.5.0", "OctetString", "host"), ("1.3.6.1.2.1.1.6.0", "Integer", -129),
+                    ("1.3.6.1.2.1.1.7.0", "Counter64", 2 ** 64 - 1), "1.3.6.1.2.1.1.8.0"]
+        msgs = [snmp_parser.msg_encode(req_id, "public", varbinds, msg_type="Response") for req_id in range(50)]
+        msgs[7] = msgs[7][:-1]
+        msgs[9] = bytearray(msgs[9])
+        for workers in (1, 2, 4):
+            decoded = snmp_parser.msg_decode_many(msgs, workers=workers)
+            self.assertEqual(len(decoded), len(msgs))
+            self.assertIsInstance(decoded[7], snmp_parser.DecodeException)
+            for i, msg in enumerate(msgs):
+                if i != 7:
+                    self.assertEqual(decoded[i], snmp_parser.msg_decode(msg))
+        decoded = snmp_parser.msg_decode_many(msgs[:2], workers=2, as_oid=True)
+        self.assertEqual(decoded[1], snmp_parser.msg_decode(msgs[1], as_oid=True))
+        self.assertEqual(snmp_parser.msg_decode_many([]), [])
+
+    def test_response_view(self):
+        varbinds = [("1.3.6.1.2.1.2.2.1.2.%s" % i, "OctetString", "eth%s" % i) for i in range(3)] + \
+                   [("1.3.6.1.2.1.2.2.1.10.%s" % i, "Counter64", i * 1000) for i in range(3)] + \
+                   ["1.3.6.1.2.1.2.2.1.10.9"]
+        msg = snmp_parser.msg_encode(5, "public", varbinds, msg_type="Response")
+        # Null => noSuchInstance
+        msg = msg.replace(b"\x05\x00", b"\x81\x00")
+        view = snmp_parser.ResponseView(msg)
+        self.assertEqual((view.req_id, view.error_status, view.error_index, len(view)), (5, 0, 0, 7))
+        self.assertEqual(view.decode(), snmp_parser.msg_decode(msg))
+        self.assertEqual(view.decode(as_oid=True), snmp_parser.msg_decode(msg, as_oid=True))
+        self.assertEqual(list(view[1]), ["1.3.6.1.2.1.2.2.1.2.1", b"eth1"])
+        self.assertEqual(view[1].to_oid(), snmp_parser.Oid("1.3.6.1.2.1.2.2.1.2.1"))
+        self.assertEqual(view[-1].oid, "1.3.6.1.2.1.2.2.1.10.9")
+        self.assertTrue(view[-1].missing)
+        self.assertEqual(view[-1].tag, 0x81)
+        with self.assertRaises(IndexError):
+            view[7]
+
+        prefix = "1.3.6.1.2.1.2.2.1.10"
+        self.assertEqual([(v.suffix(prefix), v.value, v.raw_bytes) for v in view.iter_prefix(prefix)],
+                         [("0", 0, b"\x00"), ("1", 1000, b"\x03\xe8"), ("2", 2000, b"\x07\xd0"), ("9", None, b"")])
+        self.assertEqual([v.oid for v in view.iter_prefix(snmp_parser.Oid(prefix), skip_missing=True)],
+                         ["1.3.6.1.2.1.2.2.1.10.0", "1.3.6.1.2.1.2.2.1.10.1", "1.3.6.1.2.1.2.2.1.10.2"])
+        self.assertEqual(list(view.iter_prefix("1.3.6.1.2.1.2.2.1.1")), [])
+        with self.assertRaises(ValueError):
+            list(view.iter_prefix("1"))
+        with self.assertRaises(ValueError):
+            view[0].suffix(prefix)
+        with self.assertRaises(snmp_parser.DecodeException):
+            snmp_parser.ResponseView(msg[:-1])
+
+    def test_request_template(self):
+        template = snmp_parser.RequestTemplate("public", ["1.3.6.1.2.1.1.3"], max_repetitions=60)
+        self.assertEqual(template.encode(300), b'0&\x02\x01\x01\x04\x06public\xa5\x19\x02\x02\x01,\x02\x01\x00'
+                                               b'\x02\x01<0\r0\x0b\x06\x07+\x06\x01\x02\x01\x01\x03\x05\x00')
+        oids = ["1.3.6.1.2.1.2.2.1.%s.%s" % (i, j) for i in range(10) for j in range(10)]
+        for msg_type in ("GetBulk", "Get"):
+            for community in ("public", "x" * 200):
+                template = snmp_parser.RequestTemplate(community, oids, msg_type=msg_type, max_repetitions=10)
+                for req_id in (0, 1, 127, 128, 255, 256, 0x7fffffff, -5):
+                    self.assertEqual(template.encode(req_id),
+                                     snmp_parser.msg_encode(req_id, community, oids, msg_type=msg_type))
+
+    def test_msg_encode_into(self):
+        varbinds = [("1.3.6.1.2.1.1.5.0", "OctetString", "x" * 300), ("1.3.6.1.2.1.1.6.0", "Integer", -129),
+                    ("1.3.6.1.2.1.1.7.0", "Counter64", 2 ** 64 - 1), "1.3.6.1.2.1.1.8.0"]
+        msg = snmp_parser.msg_encode(1234, "public", varbinds, msg_type="Set")
+        buf = bytearray(b"\xff" * 1000)
+        self.assertEqual(snmp_parser.msg_encode_into(buf, 10, 1234, "public", varbinds, msg_type="Set"), len(msg))
+        self.assertEqual(buf[10:10 + len(msg)], msg)
+        self.assertEqual(buf[:10] + buf[10 + len(msg):], b"\xff" * (1000 - len(msg)))
+        with self.assertRaises(ValueError):
+            snmp_parser.msg_encode_into(buf, 1000 - len(msg) + 1, 1234, "public", varbinds, msg_type="Set")
+
+        template = snmp_parser.RequestTemplate("public", varbinds, msg_type="Set")
+        self.assertEqual(template.encode_into(buf, 1, 1234), len(msg))
+        self.assertEqual(buf[1:1 + len(msg)], msg)
+        with self.assertRaises(ValueError):
+            template.encode_into(bytearray(len(msg) - 1), 0, 1234)
+        with self.assertRaisesRegex(ValueError, "invalid literal for int"):
+            snmp_parser.msg_encode(1, "public", ["1.3.x"])
+        with self.assertRaisesRegex(ValueError, "invalid literal for int"):
+            snmp_parser.encode_varbind("1..3")
+        self.assertEqual(snmp_parser.encode_varbind(" 1.3.6 "), snmp_parser.encode_varbind("1.3.6"))
+
+    def test_decode_truncated(self):
+        varbinds = [snmp_parser.encode_varbind(OID1 + ".1", "Integer", 1),
+                    snmp_parser.encode_varbind(OID1 + ".2", "Integer", 2)]
+        varbinds_tlv = b"\x30" + snmp_parser.length_encode(sum(map(len, varbinds))) + b"".join(varbinds)
+        msg = snmp_parser.msg_encode(1234, "public", varbinds_tlv, msg_type="Response")
+        self.assertEqual(snmp_parser.msg_decode(msg)[3], [[OID1 + ".1", 1], [OID1 + ".2", 2]])
+        # datagram is cut at element boundary
+        with self.assertRaisesRegex(snmp_parser.SNMPException, "truncated"):
+            snmp_parser.msg_decode(msg[:msg.index(b"public") + 6])
+        # decoded varbinds are in exception
+        with self.assertRaises(snmp_parser.DecodeException) as cm:
+            snmp_parser.msg_decode(msg[:-len(varbinds[1])])
+        self.assertEqual(cm.exception.part, [1234, 0, 0, [[OID1 + ".1", 1]]])
+
     def test_decode3(self):
         msg = b'0\x81\x83\x02\x01\x01\x04\x06public\xa2v\x02\x03?\x8fT\x02\x01\x00\x02\x01\x000i0' \
               b'\x11\x06\x0b+\x06\x01\x04\x01\x8fe\n\x01\x05\x01\x02\x02\x00\x8f0\x11\x06\x0b+\x06' \
@@ -337,6 +454,98 @@ class TestSnmpParser(unittest.TestCase):
         self.assertEqual(next_oids_to_poll, expected_oids_to_poll)
         self.assertEqual(result, expected_res)
 
+    def test_bulk_response_decode(self):
+        varbinds = [snmp_parser.encode_varbind(OID1 + ".1", "OctetString", "lo"),
+                    snmp_parser.encode_varbind(OID2 + ".1", "Counter64", 2 ** 64 - 1),
+                    snmp_parser.encode_varbind(OID3 + ".1.200000", "Integer", -3),
+                    snmp_parser.encode_varbind(OID1 + ".2", "OctetString", "eth0"),
+                    snmp_parser.encode_varbind(OID2 + ".2")[:-2] + b"\x82\x00",  # endOfMibView
+                    snmp_parser.encode_varbind(OID3 + "0.1", "Integer", 1),  # next column
+                    snmp_parser.encode_varbind(OID1 + ".3", "Integer", 3),
+                    snmp_parser.encode_varbind(OID2 + ".3", "Integer", 3),
+                    snmp_parser.encode_varbind(OID3 + ".2", "Integer", 3),
+                    ]
+        varbinds_tlv = b"\x30" + snmp_parser.length_encode(sum(map(len, varbinds))) + b"".join(varbinds)
+        msg = snmp_parser.msg_encode(1234, "public", varbinds_tlv, msg_type="Response")
+        columns = {1234: snmp_parser.ResponseColumns((OID1, OID2, OID3))}
+        self.assertEqual(snmp_parser.bulk_response_decode(msg, columns),
+                         (1234, 0, 0, [(0, "1", b"lo"), (1, "1", 2 ** 64 - 1), (2, "1.200000", -3),
+                                       (0, "2", b"eth0"), (0, "3", 3)],
+                          (False, True, True), (OID1 + ".3", None, None)))
+        self.assertEqual(snmp_parser.bulk_response_decode(msg, {}), (1234, 0, 0, None, None, None))
+        buf = bytearray(b"\xff" * 3 + msg)
+        self.assertEqual(snmp_parser.bulk_response_decode(buf, columns, 3, len(msg)),
+                         snmp_parser.bulk_response_decode(msg, columns))
+        with self.assertRaises(snmp_parser.SNMPException):
+            snmp_parser.bulk_response_decode(msg[:-1], columns)
+        res = snmp_parser.bulk_response_decode(msg, columns, with_types=True)
+        self.assertEqual(res[:6], snmp_parser.bulk_response_decode(msg, columns))
+        self.assertEqual(res[6], array.array("B", [snmp_parser.TYPE_OCTETSTRING, snmp_parser.TYPE_COUNTER64,
+                                                   snmp_parser.TYPE_INTEGER, snmp_parser.TYPE_OCTETSTRING,
+                                                   snmp_parser.TYPE_INTEGER]))
+        self.assertEqual(snmp_parser.bulk_response_decode(msg, {}, with_types=True),
+                         (1234, 0, 0, None, None, None, None))
+
+    def test_convert_value(self):
+        self.assertEqual(snmp_parser.convert_value(b"eth0\x00", "DisplayString"), "eth0")
+        self.assertEqual(snmp_parser.convert_value(b"\xc0\xa8\x01\x01", "IpAddress"), "192.168.1.1")
+        self.assertEqual(snmp_parser.convert_value(b"\xfe\x80" + b"\x00" * 13 + b"\x01", "IpAddress"), "fe80::1")
+        self.assertEqual(snmp_parser.convert_value(b"\x00\x1b\x21\xaa\xbb\xcc", "MacAddress"), "00:1b:21:aa:bb:cc")
+        self.assertEqual(snmp_parser.convert_value(b"\xde\xad", "Hex"), "dead")
+        self.assertEqual(snmp_parser.convert_value(12345, 0.01), 123.45)
+        self.assertEqual(snmp_parser.convert_value(b"x", 0.01), b"x")
+        self.assertEqual(snmp_parser.convert_value(None, "Hex"), None)
+        with self.assertRaises(ValueError):
+            snmp_parser.convert_value(b"x", "Unknown")
+
+        varbinds = [snmp_parser.encode_varbind(OID1 + ".1", "OctetString", "lo"),
+                    snmp_parser.encode_varbind(OID2 + ".1", "Counter64", 200),
+                    snmp_parser.encode_varbind(OID3 + ".1", "Integer", -3)]
+        varbinds_tlv = b"\x30" + snmp_parser.length_encode(sum(map(len, varbinds))) + b"".join(varbinds)
+        msg = snmp_parser.msg_encode(1234, "public", varbinds_tlv, msg_type="Response")
+        columns = {1234: snmp_parser.ResponseColumns((OID1, OID2, OID3), {OID1: "Hex", OID2: 0.5})}
+        self.assertEqual(snmp_parser.bulk_response_decode(msg, columns)[3],
+                         [(0, "1", "6c6f"), (1, "1", 100.0), (2, "1", -3)])
+        with self.assertRaises(ValueError):
+            snmp_parser.ResponseColumns((OID1,), {OID1: "Unknown"})
+
+    def test_decode_converters(self):
+        varbinds = [(OID1 + ".1", "OctetString", "lo"), (OID2 + ".1", "Integer", 3), (OID1 + ".2", "Integer", 5),
+                    (OID2 + ".2", "OctetString", "eth0")]
+        msg = snmp_parser.msg_encode(1234, "public", varbinds, msg_type="Response")
+        columns = {1234: snmp_parser.ResponseColumns((OID1, OID2), {OID1: "Hex", OID2: 0.5})}
+        expected = (1234, 0, 0, [[OID1 + ".1", "6c6f"], [OID2 + ".1", 1.5], [OID1 + ".2", 5],
+                                 [OID2 + ".2", b"eth0"]])
+        self.assertEqual(snmp_parser.msg_decode(msg, columns=columns), expected)
+        self.assertEqual(snmp_parser.msg_decode(msg, columns={1: columns[1234]}), snmp_parser.msg_decode(msg))
+        # converters are applied to values of generic decoder too
+        msg = snmp_parser.msg_encode(1234, "public", varbinds + ["1.3.6.1.2.1.1.8.0"], msg_type="Response")
+        self.assertEqual(snmp_parser.msg_decode(msg.replace(b"\x05\x00", b"\x02\x00"), columns=columns),
+                         expected[:3] + (expected[3] + [["1.3.6.1.2.1.1.8.0", 0]],))
+
+    def test_decode_with_types(self):
+        varbinds = [("1.3.6.1.2.1.1.5.0", "OctetString", "host"), ("1.3.6.1.2.1.1.6.0", "Integer", -129),
+                    ("1.3.6.1.2.1.1.7.0", "Counter64", 2 ** 64 - 1), "1.3.6.1.2.1.1.8.0"]
+        msg = snmp_parser.msg_encode(1, "public", varbinds, msg_type="Response")
+        types = array.array("B", [snmp_parser.TYPE_OCTETSTRING, snmp_parser.TYPE_INTEGER, snmp_parser.TYPE_COUNTER64,
+                                  snmp_parser.TYPE_NULL])
+        decoded = snmp_parser.msg_decode(msg, with_types=True)
+        self.assertEqual(decoded, snmp_parser.msg_decode(msg) + (types,))
+        self.assertEqual(snmp_parser.msg_decode_many([msg], with_types=True), [decoded])
+        self.assertEqual(snmp_parser.ResponseView(msg).decode(with_types=True), decoded)
+        self.assertEqual(snmp_parser.TYPE_CODE_TO_NAME[decoded[4][2]], "Counter64")
+        # integer without content is decoded by generic decoder
+        msg = snmp_parser.msg_encode(1, "public", ["1.3.6.1.2.1.1.8.0"], msg_type="Response")
+        self.assertEqual(snmp_parser.msg_decode(msg.replace(b"\x05\x00", b"\x02\x00"), with_types=True),
+                         (1, 0, 0, [["1.3.6.1.2.1.1.8.0", 0]], array.array("B", [snmp_parser.TYPE_INTEGER])))
+        # Counter32 in message of generic decoder
+        msg = snmp_parser.msg_encode(1, "public", ["1.3.6.1.2.1.1.8.0", ("1.3.6.1.2.1.2.2.1.10.1", "Integer", 5)],
+                                     msg_type="Response")
+        msg = msg.replace(b"\x05\x00", b"\x02\x00").replace(b"\x02\x01\x05", b"\x41\x01\x05")
+        self.assertEqual(snmp_parser.msg_decode(msg, with_types=True)[3:],
+                         ([["1.3.6.1.2.1.1.8.0", 0], ["1.3.6.1.2.1.2.2.1.10.1", 5]],
+                          array.array("B", [snmp_parser.TYPE_INTEGER, snmp_parser.TYPE_COUNTER32])))
+
     def test_check_is_growing(self):
         test_data = [
             ['1', '2', True],
@@ -437,5 +646,989 @@ class TestSnmpParser(unittest.TestCase):
         self.assertTrue(partials > 0)
 
 
+class FakeAgent(threading.Thread):
+    """
+    SNMP agent on localhost which answers Get and GetBulk requests from table
+    """
+    end_of_mib_view = b'\x82\x00'
+    no_such_instance = b'\x81\x00'
+
+    def __init__(self, table, community="public", drop=0, max_bulk=None, max_get=None):
+        super().__init__(daemon=True)
+        self.set_table(table)
+        self.community = community
+        self.drop = drop
+        # answer tooBig to GetBulk with larger max_repetitions and to Get with more varbinds
+        self.max_bulk = max_bulk
+        self.max_get = max_get
+        self.requests = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.port = self.sock.getsockname()[1]
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        self.port_patch = mock.patch.object(snmp_poller, "SNMP_PORT", self.port)
+        self.port_patch.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.port_patch.stop()
+        self.stopped.set()
+        self.join()
+        self.sock.close()
+
+    def set_table(self, table):
+        self.table = sorted((tuple(int(x) for x in oid.split(".")), oid, value) for oid, value in table.items())
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.sock.recvfrom(0x10000)
+            except socket.timeout:
+                continue
+            self.requests.append(data)
+            if len(self.requests) <= self.drop:
+                continue
+            self.sock.sendto(self.answer(data), addr)
+
+    def encode_varbind(self, oid, value):
+        if isinstance(value, bytes):
+            return snmp_parser.encode_varbind(oid)[:-2] + value
+        if isinstance(value, str):
+            return snmp_parser.encode_varbind(oid, "OctetString", value)
+        if value < 0:
+            return snmp_parser.encode_varbind(oid, "Integer", value)
+        return snmp_parser.encode_varbind(oid, "Counter64", value)
+
+    def next_varbind(self, oid):
+        oid_t = tuple(int(x) for x in oid.split("."))
+        for row_oid_t, row_oid, value in self.table:
+            if row_oid_t > oid_t:
+                return row_oid, value
+        return oid, self.end_of_mib_view
+
+    def get_varbind(self, oid):
+        for _, row_oid, value in self.table:
+            if row_oid == oid:
+                return oid, value
+        return oid, self.no_such_instance
+
+    def pdu_pos(self, data):
+        lenlen = 1 + (data[1] & 0x7f if data[1] & 0x80 else 0)
+        return 1 + lenlen + 3 + 2 + len(self.community)
+
+    def answer(self, data):
+        pdu_pos = self.pdu_pos(data)
+        pdu_type = data[pdu_pos]
+        # decoder knows only response and getbulk pdu
+        data = data[:pdu_pos] + b'\xa2' + data[pdu_pos + 1:]
+        req_id, non_repeaters, max_repetitions, varbinds = snmp_parser.msg_decode(data)
+        oids = [oid for oid, _ in varbinds]
+        res = bytearray()
+        if (pdu_type == 0xa5 and self.max_bulk is not None and max_repetitions > self.max_bulk) or \
+                (pdu_type == 0xa0 and self.max_get is not None and len(oids) > self.max_get):
+            # tooBig. error status and error index are at places of non_repeaters and max_repetitions
+            message = snmp_parser.msg_encode(req_id, self.community, b'\x30\x00', non_repeaters=1, max_repetitions=1)
+            pdu_pos = self.pdu_pos(message)
+            return message[:pdu_pos] + b'\xa2' + message[pdu_pos + 1:]
+        if pdu_type == 0xa5:  # GetBulk
+            for oid in oids[:non_repeaters]:
+                res += self.encode_varbind(*self.next_varbind(oid))
+            oids = oids[non_repeaters:]
+            for _ in range(max_repetitions if oids else 0):
+                next_oids = []
+                for oid in oids:
+                    next_oid, value = self.next_varbind(oid)
+                    res += self.encode_varbind(next_oid, value)
+                    next_oids.append(next_oid)
+                oids = next_oids
+        else:
+            for oid in oids:
+                res += self.encode_varbind(*self.get_varbind(oid))
+        varbinds_tlv = b'\x30' + snmp_parser.length_encode(len(res)) + bytes(res)
+        return snmp_parser.msg_encode(req_id, self.community, varbinds_tlv, msg_type="Response")
+
+
+IF_DESCR = "1.3.6.1.2.1.2.2.1.2"
+IF_IN_OCTETS = "1.3.6.1.2.1.2.2.1.10"
+IF_TABLE = {
+    IF_DESCR + ".1": "lo",
+    IF_DESCR + ".2": "eth0",
+    IF_DESCR + ".3": "eth1",
+    IF_IN_OCTETS + ".1": 100,
+    IF_IN_OCTETS + ".2": 200,
+    IF_IN_OCTETS + ".3": 300,
+    "1.3.6.1.2.1.2.2.1.11.1": 7,
+}
+IF_TABLE_RESULT = sorted([
+    (IF_DESCR, "1", b"lo"), (IF_DESCR, "2", b"eth0"), (IF_DESCR, "3", b"eth1"),
+    (IF_IN_OCTETS, "1", 100), (IF_IN_OCTETS, "2", 200), (IF_IN_OCTETS, "3", 300),
+])
+
+
+def collect(results):
+    return sorted((r.main_oid, r.index_part, r.value) for r in results)
+
+
+class TestOid(unittest.TestCase):
+    def test_oid(self):
+        oid = snmp_parser.Oid(IF_DESCR)
+        row = snmp_parser.Oid("." + IF_DESCR + ".10.")
+        self.assertEqual(str(oid), IF_DESCR)
+        self.assertEqual(len(row), 11)
+        self.assertEqual(row[-1], 10)
+        self.assertEqual(row[:10], oid)
+        self.assertEqual(list(oid), [int(x) for x in IF_DESCR.split(".")])
+        self.assertEqual(snmp_parser.Oid(list(oid)), oid)
+        self.assertEqual(hash(snmp_parser.Oid(IF_DESCR)), hash(oid))
+        self.assertEqual(len({oid, snmp_parser.Oid(IF_DESCR), row}), 2)
+        self.assertNotEqual(oid, IF_DESCR)
+        with self.assertRaises(OverflowError):
+            snmp_parser.Oid("1.3.4294967296")
+        self.assertEqual(pickle.loads(pickle.dumps(row)), row)
+
+    def test_compare(self):
+        oids = ["1.3.6.1.2.1.2.2.1.2.10", "1.3.6.1.2.1.2.2.1.2.9", "1.3.6.1.2.1.2.2.1.2", "1.3.6.1.2.1.2.2.1.10",
+                "1.3.6.1.2.1.2.2.1.2.9.1"]
+        self.assertEqual([str(x) for x in sorted(map(snmp_parser.Oid, oids))],
+                         sorted(oids, key=lambda x: [int(y) for y in x.split(".")]))
+        self.assertLess(snmp_parser.Oid("1.3.6.1.2.1.2.2.1.2.9"), snmp_parser.Oid("1.3.6.1.2.1.2.2.1.2.10"))
+        self.assertGreaterEqual(snmp_parser.Oid("1.3.6.1"), snmp_parser.Oid("1.3.6"))
+        self.assertFalse(snmp_parser.check_is_growing(snmp_parser.Oid("10.1"), snmp_parser.Oid("9.2")))
+        self.assertTrue(snmp_parser.check_is_growing(snmp_parser.Oid("9.1"), snmp_parser.Oid("10.2")))
+
+    def test_prefix(self):
+        oid = snmp_parser.Oid(IF_DESCR)
+        row = snmp_parser.Oid(IF_DESCR + ".10.1")
+        self.assertTrue(oid.is_prefix_of(row))
+        self.assertTrue(oid.is_prefix_of(oid))
+        self.assertFalse(row.is_prefix_of(oid))
+        self.assertFalse(snmp_parser.Oid(IF_IN_OCTETS).is_prefix_of(snmp_parser.Oid(IF_DESCR + "0.1")))
+        self.assertEqual(row.suffix(oid), snmp_parser.Oid("10.1"))
+        with self.assertRaises(ValueError):
+            oid.suffix(row)
+
+    def test_encode_decode(self):
+        oid = snmp_parser.Oid(IF_DESCR + ".4294967295")
+        self.assertEqual(oid.encoded, snmp_parser.objectid_encode(str(oid)))
+        self.assertEqual(snmp_parser.objectid_encode(oid), oid.encoded)
+        msg = snmp_parser.msg_encode(1, "public", [oid, (IF_IN_OCTETS + ".1", "Counter64", 10)], msg_type="Response")
+        self.assertEqual(msg, snmp_parser.msg_encode(1, "public", [str(oid), (IF_IN_OCTETS + ".1", "Counter64", 10)],
+                                                     msg_type="Response"))
+        self.assertEqual(snmp_parser.msg_decode(msg, as_oid=True),
+                         (1, 0, 0, [[oid, None], [snmp_parser.Oid(IF_IN_OCTETS + ".1"), 10]]))
+        for value in ("2.100.3", "3.1", "1.40"):
+            with self.assertRaises(snmp_parser.SNMPException) as str_error:
+                snmp_parser.objectid_encode(value)
+            with self.assertRaises(snmp_parser.SNMPException) as oid_error:
+                snmp_parser.Oid(value).encoded
+            self.assertEqual(str(oid_error.exception), str(str_error.exception))
+            with self.assertRaises(snmp_parser.SNMPException):
+                snmp_parser.msg_encode(1, "public", [snmp_parser.Oid(value)])
+
+
+class TestPoller(unittest.TestCase):
+    def test_walk(self):
+        with FakeAgent(IF_TABLE):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public"))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+        self.assertEqual({r.name for r in res}, {"127.0.0.1"})
+        self.assertEqual({(r.main_oid, r.value_type) for r in res},
+                         {(IF_DESCR, snmp_parser.TYPE_OCTETSTRING), (IF_IN_OCTETS, snmp_parser.TYPE_COUNTER64)})
+
+    def test_walk_small_bulk(self):
+        with FakeAgent(IF_TABLE) as agent:
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=2))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+        self.assertEqual(len(agent.requests), 2)
+
+    def test_walk_unequal_columns(self):
+        table = dict(IF_TABLE)
+        del table[IF_IN_OCTETS + ".3"]
+        del table[IF_IN_OCTETS + ".2"]
+        with FakeAgent(table):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_IN_OCTETS, IF_DESCR]], "public", max_repetitions=1))
+        self.assertEqual(collect(res), sorted([(IF_DESCR, "1", b"lo"), (IF_DESCR, "2", b"eth0"),
+                                               (IF_DESCR, "3", b"eth1"), (IF_IN_OCTETS, "1", 100)]))
+
+    def test_get(self):
+        with FakeAgent(IF_TABLE):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR + ".2", IF_IN_OCTETS + ".2"]], "public",
+                                          msg_type="Get"))
+        self.assertEqual(collect(res), sorted([(IF_DESCR + ".2", "", b"eth0"), (IF_IN_OCTETS + ".2", "", 200)]))
+        self.assertEqual(sorted(r.value_type for r in res), [snmp_parser.TYPE_OCTETSTRING, snmp_parser.TYPE_COUNTER64])
+
+    def test_converters(self):
+        converters = {IF_DESCR: "DisplayString", IF_IN_OCTETS: 0.5, IF_DESCR + ".2": "Hex"}
+        with FakeAgent(IF_TABLE):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public",
+                                          converters=converters))
+            res_get = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR + ".2"]], "public", msg_type="Get",
+                                              converters=converters))
+        self.assertEqual(collect(res), sorted([(IF_DESCR, "1", "lo"), (IF_DESCR, "2", "eth0"), (IF_DESCR, "3", "eth1"),
+                                               (IF_IN_OCTETS, "1", 50.0), (IF_IN_OCTETS, "2", 100.0),
+                                               (IF_IN_OCTETS, "3", 150.0)]))
+        self.assertEqual(collect(res_get), [(IF_DESCR + ".2", "", "65746830")])
+
+    def test_timeout(self):
+        with FakeAgent(IF_TABLE, drop=2) as agent:
+            start = time.monotonic()
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR]], "public", timeout=0.05, backoff=1, retry=1))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(agent.requests), 2)
+        self.assertEqual(agent.requests[0], agent.requests[1])
+        self.assertEqual(len(res), 1)
+        self.assertIsInstance(res[0].value, snmp_poller.Timeout)
+
+    def test_retry(self):
+        with FakeAgent(IF_TABLE, drop=1):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", timeout=0.05, retry=1))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+
+    def test_sharded_sockets(self):
+        for reuse_port in (False, True):
+            with FakeAgent(IF_TABLE) as agent:
+                res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR], [IF_IN_OCTETS]], "public", max_repetitions=2,
+                                              sockets_count=4, reuse_port=reuse_port))
+            self.assertEqual(collect(res), IF_TABLE_RESULT)
+        self.assertEqual(len({snmp_poller.shard_for("host%s" % i, 4) for i in range(100)}), 4)
+        with self.assertRaises(ValueError):
+            snmp_poller.create_sockets(snmp_poller.MAX_SOCKETS_COUNT + 1)
+
+    def test_too_big(self):
+        with FakeAgent(IF_TABLE, max_bulk=2) as agent:
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=8))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+        # 8 and 4 are too big, 2 walks the table in two requests
+        self.assertEqual(len(agent.requests), 4)
+        reqids = {snmp_parser.msg_decode(b"\x30" + data[1:].replace(b"\xa5", b"\xa2", 1))[0]
+                  for data in agent.requests[:3]}
+        self.assertEqual(len(reqids), 1)
+
+    def test_walk_without_mmsg(self):
+        with FakeAgent(IF_TABLE), mock.patch.object(snmp_poller, "USE_MMSG", False):
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=2))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+
+
+
+def collect_rows(rows):
+    return [(row.name, row.index_part, row.values) for row in rows]
+
+
+class TestTablePoller(unittest.TestCase):
+    def test_rows(self):
+        table = dict(IF_TABLE)
+        del table[IF_IN_OCTETS + ".2"]
+        with FakeAgent(table):
+            rows = list(snmp_poller.table_poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public",
+                                                 max_repetitions=1))
+        self.assertEqual(collect_rows(rows), [
+            ("127.0.0.1", "1", {IF_DESCR: b"lo", IF_IN_OCTETS: 100}),
+            ("127.0.0.1", "2", {IF_DESCR: b"eth0"}),
+            ("127.0.0.1", "3", {IF_DESCR: b"eth1", IF_IN_OCTETS: 300}),
+        ])
+
+    def test_max_pending_rows(self):
+        table = dict(IF_TABLE)
+        del table[IF_IN_OCTETS + ".1"]
+        del table[IF_IN_OCTETS + ".2"]
+        with FakeAgent(table):
+            rows = list(snmp_poller.table_poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public",
+                                                 max_repetitions=1, max_pending_rows=0))
+        self.assertEqual([(index_part, sorted(values)) for _, index_part, values in collect_rows(rows)],
+                         [("1", [IF_DESCR]), ("3", [IF_IN_OCTETS]), ("2", [IF_DESCR]), ("3", [IF_DESCR])])
+
+    def test_incremental_sparse(self):
+        oids_group = (IF_DESCR, IF_IN_OCTETS)
+        table = {snmp_poller.SYS_UPTIME: 1000}
+        table.update({IF_DESCR + ".%s" % i: "eth%s" % i for i in range(1, 11)})
+        table.update({IF_IN_OCTETS + ".%s" % i: i * 100 for i in range(5, 11)})
+        expected = [("127.0.0.1", str(i), {IF_DESCR: b"eth%d" % i, IF_IN_OCTETS: i * 100} if i >= 5 else
+                     {IF_DESCR: b"eth%d" % i}) for i in range(1, 11)]
+        with FakeAgent(table), \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", max_repetitions=2, incremental=True) as session:
+            # walk with indicators
+            self.assertEqual(collect_rows(session.poll_table([oids_group])), expected)
+            # Gets of known instances
+            self.assertEqual(collect_rows(session.poll_table([oids_group])), expected)
+
+    def test_get(self):
+        with FakeAgent(IF_TABLE):
+            rows = list(snmp_poller.table_poller(["127.0.0.1"], [[IF_DESCR + ".2", IF_IN_OCTETS + ".2"]], "public",
+                                                 msg_type="Get"))
+        self.assertEqual(collect_rows(rows), [("127.0.0.1", "", {IF_DESCR + ".2": b"eth0", IF_IN_OCTETS + ".2": 200})])
+
+    def test_timeout(self):
+        with FakeAgent(IF_TABLE, drop=1):
+            rows = list(snmp_poller.table_poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", timeout=0.05,
+                                                 retry=0))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(list(rows[0].values), [IF_DESCR, IF_IN_OCTETS])
+        self.assertIsInstance(rows[0].values[IF_DESCR], snmp_poller.Timeout)
+
+
+BIG_IF_TABLE = dict(IF_TABLE)
+BIG_IF_TABLE.update({IF_DESCR + ".%s" % i: "eth%s" % i for i in range(4, 13)})
+BIG_IF_TABLE.update({IF_IN_OCTETS + ".%s" % i: i * 100 for i in range(4, 13)})
+
+
+class TestSegmentedWalk(unittest.TestCase):
+    def walk(self, **kwargs):
+        return list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=2,
+                                       **kwargs))
+
+    def test_split_points(self):
+        with FakeAgent(BIG_IF_TABLE) as agent:
+            sequential = self.walk()
+            sequential_requests = len(agent.requests)
+            res = self.walk(split_points={(IF_DESCR, IF_IN_OCTETS): ["4", "8"]})
+        self.assertEqual(len(res), 24)
+        # results are merged in order of walk
+        self.assertEqual([(r.main_oid, r.index_part, r.value) for r in res],
+                         [(r.main_oid, r.index_part, r.value) for r in sequential])
+        # the first request of every segment
+        self.assertEqual(len(agent.requests) - sequential_requests, sequential_requests + 2)
+
+    def test_learned_split_points(self):
+        oids_group = (IF_DESCR, IF_IN_OCTETS)
+        with FakeAgent(BIG_IF_TABLE), \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", max_repetitions=2, segments=3) as session:
+            sequential = list(session.poll([oids_group]))
+            self.assertEqual(session.targets["127.0.0.1"].split_points, {oids_group: ("4", "8")})
+            res = list(session.poll([oids_group]))
+            rows = list(session.poll_table([oids_group]))
+        self.assertEqual([(r.main_oid, r.index_part, r.value) for r in res],
+                         [(r.main_oid, r.index_part, r.value) for r in sequential])
+        self.assertEqual([row.index_part for row in rows], [str(i) for i in range(1, 13)])
+        self.assertEqual(rows[11].values, {IF_DESCR: b"eth12", IF_IN_OCTETS: 1200})
+
+    def test_clip_rows(self):
+        rows = [(0, "1", 1), (1, "1", 2), (0, "2", 3), (1, "3", 4), (0, "3", 5), (1, "2", 6)]
+        clipped, types, ended = snmp_poller.clip_rows(rows, array.array("B", range(6)), (False, False), (2,))
+        self.assertEqual(clipped, [(0, "1", 1), (1, "1", 2), (0, "2", 3)])
+        self.assertEqual(types, [0, 1, 2])
+        self.assertEqual(ended, [True, True])
+
+    def test_split_points_for(self):
+        index_parts = [str(i) for i in range(1, 11)]
+        self.assertEqual(snmp_poller.split_points_for(index_parts, 2), ("5",))
+        self.assertEqual(snmp_poller.split_points_for(index_parts, 3), ("3", "6"))
+        self.assertEqual(snmp_poller.split_points_for(index_parts[:3], 2), ())
+        self.assertEqual(snmp_poller.split_points_for(index_parts, 1), ())
+
+
+class TestSendScheduler(unittest.TestCase):
+    def test_round_robin(self):
+        scheduler = snmp_poller.SendScheduler()
+        for reqid, name in [(1, "a"), (2, "a"), (3, "a"), (4, "b")]:
+            scheduler.put(reqid, name)
+        self.assertEqual(len(scheduler), 4)
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [(1, "a"), (4, "b"), (2, "a"), (3, "a")])
+        # retries go first
+        scheduler.put(5, "a")
+        scheduler.put(6, "b", retry=True)
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [(6, "b"), (5, "a")])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_retry_priority(self):
+        scheduler = snmp_poller.SendScheduler()
+        for reqid, name in [(1, "a"), (2, "b"), (3, "c"), (4, "c")]:
+            scheduler.put(reqid, name)
+        # retry of scheduled host overtakes other hosts
+        scheduler.put(5, "c", retry=True)
+        self.assertEqual(scheduler.pop(2, time.monotonic()), [(5, "c"), (1, "a")])
+        # not sent request too
+        scheduler.unsend(1, "a")
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [(1, "a"), (2, "b"), (3, "c"), (4, "c")])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(list(scheduler.order), [])
+
+    def test_max_in_flight(self):
+        scheduler = snmp_poller.SendScheduler(max_in_flight=1)
+        scheduler.put(1, "a")
+        scheduler.put(2, "a")
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [(1, "a")])
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [])
+        self.assertIsNone(scheduler.wait_time(time.monotonic()))
+        scheduler.done("a")
+        self.assertEqual(scheduler.pop(10, time.monotonic()), [(2, "a")])
+
+    def test_rate(self):
+        scheduler = snmp_poller.SendScheduler(rate=10, burst=2)
+        now = scheduler.refilled
+        for reqid in range(1, 5):
+            scheduler.put(reqid, "a")
+        self.assertEqual(scheduler.pop(10, now), [(1, "a"), (2, "a")])
+        self.assertAlmostEqual(scheduler.wait_time(now), 0.1)
+        self.assertEqual(scheduler.pop(10, now + 0.15), [(3, "a")])
+        # not sent request returns its token
+        scheduler.unsend(3, "a")
+        self.assertEqual(scheduler.pop(10, now + 0.15), [(3, "a")])
+
+    def test_poll(self):
+        split_points = {(IF_DESCR, IF_IN_OCTETS): ["4", "8"]}
+        with FakeAgent(BIG_IF_TABLE):
+            unlimited = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public",
+                                                max_repetitions=2, split_points=split_points))
+            res = list(snmp_poller.poller(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=2,
+                                          split_points=split_points, max_in_flight=1, send_rate=1000))
+        self.assertEqual(len(res), 24)
+        self.assertEqual([(r.main_oid, r.index_part, r.value) for r in res],
+                         [(r.main_oid, r.index_part, r.value) for r in unlimited])
+
+
+class TestPollerSession(unittest.TestCase):
+    def test_reuse(self):
+        with FakeAgent(IF_TABLE) as agent, snmp_poller.PollerSession(["127.0.0.1"], "public") as session:
+            socks = list(session.socks)
+            for _ in range(2):
+                res = list(session.poll([[IF_DESCR, IF_IN_OCTETS]]))
+                self.assertEqual(collect(res), IF_TABLE_RESULT)
+            self.assertEqual(session.socks, socks)
+            self.assertEqual(len(agent.requests), 2)
+            self.assertEqual(len(session.templates), 1)
+
+    def test_add_remove_hosts(self):
+        with FakeAgent(IF_TABLE), snmp_poller.PollerSession([], "public") as session:
+            self.assertEqual(list(session.poll([[IF_DESCR]])), [])
+            with mock.patch.object(snmp_poller, "resolve", wraps=snmp_poller.resolve) as resolve:
+                session.add_hosts(["127.0.0.1"])
+                session.add_hosts(["127.0.0.1"])
+            self.assertEqual(resolve.call_count, 1)
+            res = list(session.poll([[IF_DESCR]]))
+            self.assertEqual({r.name for r in res}, {"127.0.0.1"})
+            session.remove_hosts(["127.0.0.1"])
+            self.assertEqual(list(session.poll([[IF_DESCR]])), [])
+
+    def test_adaptive(self):
+        with FakeAgent(IF_TABLE) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", max_repetitions=1, adaptive=True) as session:
+            res = list(session.poll([[IF_DESCR, IF_IN_OCTETS]]))
+            self.assertEqual(collect(res), IF_TABLE_RESULT)
+            # fast and small responses grow max_repetitions during walk and it is kept for next cycle
+            first_cycle = len(agent.requests)
+            self.assertLess(first_cycle, 4)
+            learned = session.targets["127.0.0.1"].max_repetitions
+            self.assertGreater(learned, 1)
+            res = list(session.poll([[IF_DESCR, IF_IN_OCTETS]]))
+            self.assertEqual(collect(res), IF_TABLE_RESULT)
+            self.assertLessEqual(len(agent.requests) - first_cycle, 2)
+            learned = session.targets["127.0.0.1"].max_repetitions
+
+            job = snmp_poller.Job(name="127.0.0.1", ip="127.0.0.1", main_oids=(IF_DESCR,), oids_to_poll=(IF_DESCR,))
+            session.adapt(job)
+            self.assertEqual(session.targets["127.0.0.1"].max_repetitions, max(1, learned // 2))
+
+    def test_incremental(self):
+        oids_group = (IF_DESCR, IF_IN_OCTETS)
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        table[snmp_poller.IF_TABLE_LAST_CHANGE] = 5
+        with FakeAgent(table) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", max_repetitions=2, incremental=True,
+                                          change_indicators={oids_group: snmp_poller.IF_TABLE_LAST_CHANGE}) as session:
+            def poll():
+                sent = len(agent.requests)
+                res = list(session.poll([oids_group]))
+                return collect(res), [data[data.index(b"public") + 6] for data in agent.requests[sent:]]
+
+            # walk and the first values of indicators
+            res, pdu_types = poll()
+            self.assertEqual(res, IF_TABLE_RESULT)
+            self.assertEqual(sorted(pdu_types), [0xa0, 0xa5, 0xa5])
+            self.assertEqual(session.targets["127.0.0.1"].instances[oids_group], (
+                (IF_DESCR, "1"), (IF_IN_OCTETS, "1"), (IF_DESCR, "2"), (IF_IN_OCTETS, "2"),
+                (IF_DESCR, "3"), (IF_IN_OCTETS, "3")))
+            # known instances by two rows per Get
+            res, pdu_types = poll()
+            self.assertEqual(res, IF_TABLE_RESULT)
+            self.assertEqual(pdu_types, [0xa0, 0xa0])
+
+            # indicator is changed
+            del table[IF_DESCR + ".3"]
+            del table[IF_IN_OCTETS + ".3"]
+            table[snmp_poller.IF_TABLE_LAST_CHANGE] = 6
+            agent.set_table(table)
+            res, pdu_types = poll()
+            self.assertEqual(res, IF_TABLE_RESULT[:2] + IF_TABLE_RESULT[3:5])
+            self.assertEqual(pdu_types, [0xa0, 0xa5, 0xa5])
+            res, pdu_types = poll()
+            self.assertEqual(res, IF_TABLE_RESULT[:2] + IF_TABLE_RESULT[3:5])
+            self.assertEqual(pdu_types, [0xa0])
+
+            # missing instance
+            del table[IF_IN_OCTETS + ".1"]
+            agent.set_table(table)
+            res, pdu_types = poll()
+            self.assertEqual(res, [IF_TABLE_RESULT[1], IF_TABLE_RESULT[3], IF_TABLE_RESULT[4]])
+            self.assertEqual(pdu_types, [0xa0, 0xa5, 0xa5])
+
+            # agent is restarted
+            job = snmp_poller.Job(name="127.0.0.1", ip="127.0.0.1", oids_to_poll=oids_group, main_oids=oids_group,
+                                  group=oids_group)
+            self.assertFalse(session.indicators_changed(job, {snmp_poller.SYS_UPTIME: 2000}))
+            self.assertTrue(session.indicators_changed(job, {snmp_poller.SYS_UPTIME: 10}))
+
+    def test_incremental_too_big(self):
+        oids_group = (IF_DESCR, IF_IN_OCTETS)
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        # Get of indicator and 3 rows is too big
+        with FakeAgent(table, max_get=5) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", incremental=True) as session:
+            self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            sent = len(agent.requests)
+            # split into indicator with the first row and the next rows
+            self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            self.assertEqual(len(agent.requests) - sent, 3)
+            target = session.targets["127.0.0.1"]
+            self.assertEqual(target.max_pdu_size, len(agent.requests[sent]) // 2)
+            self.assertEqual(len(target.instances[oids_group]), 6)
+            # learned size. Get by row without tooBig
+            first_size = len(agent.requests[sent])
+            sent = len(agent.requests)
+            self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            self.assertEqual(len(agent.requests) - sent, 3)
+            self.assertLess(len(agent.requests[sent]), first_size)
+
+    def test_incremental_converters(self):
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        converters = {IF_DESCR: "Hex", IF_IN_OCTETS: 0.5}
+        expected = sorted([(IF_DESCR, "1", "6c6f"), (IF_DESCR, "2", "65746830"), (IF_DESCR, "3", "65746831"),
+                           (IF_IN_OCTETS, "1", 50.0), (IF_IN_OCTETS, "2", 100.0), (IF_IN_OCTETS, "3", 150.0)])
+        with FakeAgent(table) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", incremental=True, converters=converters) as session:
+            self.assertEqual(collect(session.poll([[IF_DESCR, IF_IN_OCTETS]])), expected)
+            sent = len(agent.requests)
+            # values of Get are converted by decoder
+            self.assertEqual(collect(session.poll([[IF_DESCR, IF_IN_OCTETS]])), expected)
+            self.assertEqual(len(agent.requests) - sent, 1)
+
+    def test_incremental_fall_back(self):
+        oids_group = (IF_DESCR, IF_IN_OCTETS)
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        # Get of indicator and one row is too big
+        with FakeAgent(table, max_get=1) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", incremental=True) as session:
+            for _ in range(3):
+                sent = len(agent.requests)
+                self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            # Get of one row is too big. walk
+            pdu_types = [data[data.index(b"public") + 6] for data in agent.requests[sent:]]
+            self.assertEqual(pdu_types, [0xa0, 0xa5])
+        # timeout of Get
+        with FakeAgent(table) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", incremental=True, timeout=0.05,
+                                          retry=0) as session:
+            self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            agent.drop = len(agent.requests) + 1
+            self.assertEqual(collect(session.poll([oids_group])), IF_TABLE_RESULT)
+            self.assertEqual(session.targets["127.0.0.1"].instances[oids_group], tuple(
+                (oid, index_part) for index_part in "123" for oid in oids_group))
+
+    def test_capabilities(self):
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        sys_contact = "1.3.6.1.2.1.1.4.0"
+        if_unknown = "1.3.6.1.2.1.2.2.1.99"
+        groups = [snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME, sys_contact),
+                                           columns=(IF_DESCR, IF_IN_OCTETS, if_unknown))]
+
+        def request_oids(data):
+            pdu_pos = data.index(b"public") + 6
+            data = data[:pdu_pos] + b"\xa2" + data[pdu_pos + 1:]
+            return [oid for oid, _ in snmp_parser.msg_decode(data)[3]]
+
+        with FakeAgent(table) as agent, \
+                snmp_poller.PollerSession(["127.0.0.1"], "public", capabilities=True) as session:
+            target = session.targets["127.0.0.1"]
+            res = list(session.poll(groups))
+            self.assertEqual(collect(res), sorted(IF_TABLE_RESULT + [(snmp_poller.SYS_UPTIME, "", 1000)]))
+            self.assertEqual(sorted(target.unsupported), [sys_contact, if_unknown])
+            self.assertEqual(request_oids(agent.requests[-1]),
+                             ["1.3.6.1.2.1.1.3", "1.3.6.1.2.1.1.4", IF_DESCR, IF_IN_OCTETS, if_unknown])
+            # not supported OIDs are not requested
+            res = list(session.poll(groups))
+            self.assertEqual(collect(res), sorted(IF_TABLE_RESULT + [(snmp_poller.SYS_UPTIME, "", 1000)]))
+            self.assertEqual(request_oids(agent.requests[-1]), ["1.3.6.1.2.1.1.3", IF_DESCR, IF_IN_OCTETS])
+            self.assertEqual(session.supported(target, (if_unknown, IF_DESCR), time.time() + 7 * 3600),
+                             (if_unknown, IF_DESCR))
+
+            # agent is restarted
+            table[snmp_poller.SYS_UPTIME] = 10
+            agent.set_table(table)
+            list(session.poll(groups))
+            self.assertEqual(target.unsupported, {})
+            res = list(session.poll(groups))
+            self.assertEqual(request_oids(agent.requests[-1]),
+                             ["1.3.6.1.2.1.1.3", "1.3.6.1.2.1.1.4", IF_DESCR, IF_IN_OCTETS, if_unknown])
+            self.assertEqual(sorted(target.unsupported), [sys_contact, if_unknown])
+
+    def test_reqid_wrap(self):
+        with snmp_poller.PollerSession([], "public", start_reqid=snmp_poller.MAX_REQID) as session:
+            self.assertEqual(session.next_reqid(), snmp_poller.MAX_REQID)
+            self.assertEqual(session.next_reqid(), 1)
+
+
+@unittest.skipUnless(snmp_parser.HAVE_MMSG, "no sendmmsg/recvmmsg")
+class TestDatagramBatch(unittest.TestCase):
+    def test_send_recv(self):
+        sock = snmp_poller.create_socket()
+        peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        peer.bind(("127.0.0.1", 0))
+        peer_port = peer.getsockname()[1]
+        port = sock.getsockname()[1]
+        batch = snmp_parser.DatagramBatch(2)
+        messages = [b"first", b"second", b"third"]
+        addresses = [("127.0.0.1", peer_port), ("::ffff:127.0.0.1", peer_port), ("127.0.0.1", peer_port)]
+        self.assertEqual(batch.send(sock.fileno(), messages, addresses), 2)
+        self.assertEqual(batch.send(sock.fileno(), messages, addresses, 2), 1)
+        self.assertEqual([peer.recvfrom(100)[0] for _ in messages], messages)
+
+        buffers = snmp_poller.RecvBuffers(2, 100)
+        self.assertEqual(batch.recv_into(sock.fileno(), buffers.buffers), [])
+        for message in messages:
+            peer.sendto(message, ("127.0.0.1", port))
+        received = []
+        while len(received) < len(messages):
+            for buf, (nbytes, remotehost) in zip(buffers.buffers, batch.recv_into(sock.fileno(), buffers.buffers)):
+                self.assertEqual(remotehost, ("::ffff:127.0.0.1", peer_port))
+                received.append(bytes(buf[:nbytes]))
+        self.assertEqual(received, messages)
+        sock.close()
+        peer.close()
+
+
+class TestParallelPoller(unittest.TestCase):
+    def test_poll(self):
+        pp = parallel_poller.ParallelPoller(workers=2, batch_size=2, mp_context="fork")
+        with FakeAgent(IF_TABLE):
+            res = list(pp.poll(["127.0.0.1"], [[IF_DESCR], [IF_IN_OCTETS]], "public", max_repetitions=2))
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+
+    def test_worker_exit(self):
+        pp = parallel_poller.ParallelPoller(workers=1, mp_context="fork")
+        with mock.patch.object(parallel_poller, "poll_worker", lambda *args: os._exit(0)):
+            with self.assertRaisesRegex(parallel_poller.WorkerError, "127.0.0.1"):
+                list(pp.poll(["127.0.0.1"], [[IF_DESCR]], "public"))
+
+    def test_worker_error(self):
+        class NotPickled(Exception):
+            def __init__(self):
+                super().__init__("not pickled")
+                self.callback = lambda: None
+
+        def fail(*args, **kwargs):
+            raise NotPickled()
+
+        pp = parallel_poller.ParallelPoller(workers=1, mp_context="fork")
+        with mock.patch.object(snmp_poller, "poller", fail), mock.patch.object(parallel_poller.logger, "exception"):
+            with self.assertRaisesRegex(parallel_poller.WorkerError, "not pickled"):
+                list(pp.poll(["127.0.0.1"], [[IF_DESCR]], "public"))
+
+    def test_partition_hosts(self):
+        hosts = ["host%s" % i for i in range(10)]
+        partitions = parallel_poller.partition_hosts(hosts, 3)
+        self.assertEqual(sorted(sum(partitions, [])), sorted(hosts))
+        self.assertEqual(partitions, parallel_poller.partition_hosts(hosts, 3))
+
+
+class TestColumnar(unittest.TestCase):
+    results = [
+        snmp_poller.Result("h1", IF_DESCR, "1", b"lo", 1.0, 0.1),
+        snmp_poller.Result("h1", IF_IN_OCTETS, "1", 2 ** 64 - 1, 1.0, 0.1),
+        snmp_poller.Result("h2", IF_IN_OCTETS, "2", -5, 2.0, 0.2),
+        snmp_poller.Result("h2", (IF_DESCR, IF_IN_OCTETS), "", snmp_poller.Timeout(), 3.0, 0.3),
+        snmp_poller.Result("h2", IF_IN_OCTETS, "3", 2.5, 4.0, 0.4, snmp_parser.TYPE_COUNTER64),
+    ]
+
+    def test_builder(self):
+        builder = columnar.ResultsBuilder()
+        builder.extend(self.results)
+        self.assertEqual(len(builder), 6)
+        self.assertEqual(builder.hosts, {"h1": 0, "h2": 1})
+        self.assertEqual(list(builder.host_codes), [0, 0, 1, 1, 1, 1])
+        self.assertEqual(list(builder.main_oid_codes), [0, 1, 1, 0, 1, 1])
+        self.assertEqual(builder.bytes_values, [b"lo", None, None, None, None, None])
+        self.assertEqual(builder.uint_values, [None, 2 ** 64 - 1, None, None, None, None])
+        self.assertEqual(builder.int_values, [None, None, -5, None, None, None])
+        self.assertEqual(builder.float_values, [None, None, None, None, None, 2.5])
+        self.assertEqual(builder.str_values, [None] * 6)
+        self.assertEqual(builder.errors, [None, None, None, "Timeout", "Timeout", None])
+        builder.clear()
+        self.assertEqual(len(builder), 0)
+        self.assertEqual(builder.hosts, {"h1": 0, "h2": 1})
+
+    @unittest.skipIf(columnar.pyarrow is None, "no pyarrow")
+    def test_record_batches(self):
+        batches = list(columnar.record_batches(self.results, batch_size=2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 3, 1])
+        self.assertEqual(batches[1].column("host").to_pylist(), ["h2", "h2", "h2"])
+        self.assertEqual(batches[0].column("uint_value").to_pylist(), [None, 2 ** 64 - 1])
+        self.assertEqual(batches[2].column("float_value").to_pylist(), [2.5])
+        sink = columnar.pyarrow.BufferOutputStream()
+        with columnar.BatchWriter(sink) as writer:
+            for batch in batches:
+                writer.write(batch)
+        table = columnar.pyarrow.ipc.open_stream(sink.getvalue()).read_all()
+        self.assertEqual(table.column("main_oid").to_pylist(), [IF_DESCR, IF_IN_OCTETS, IF_IN_OCTETS, IF_DESCR,
+                                                                 IF_IN_OCTETS, IF_IN_OCTETS])
+
+
+class TestPlanner(unittest.TestCase):
+    def test_plan_requests(self):
+        sys_descr = "1.3.6.1.2.1.1.1.0"
+        oids = [IF_DESCR, snmp_poller.SYS_UPTIME, "1.3.6.1.2.1.31.1.1.1.6", [IF_IN_OCTETS, IF_DESCR], sys_descr]
+        self.assertEqual(planner.plan_requests(oids), [
+            snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME, sys_descr), columns=(IF_DESCR, IF_IN_OCTETS)),
+            snmp_poller.RequestGroup(columns=("1.3.6.1.2.1.31.1.1.1.6",)),
+        ])
+        self.assertEqual(planner.plan_requests(oids, combine=False)[2:],
+                         [snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME, sys_descr))])
+        # one scalar per request
+        max_pdu_size = planner.header_size("public") + planner.varbind_size(sys_descr)
+        self.assertEqual(planner.plan_requests([snmp_poller.SYS_UPTIME, sys_descr], max_pdu_size=max_pdu_size),
+                         [snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME,)),
+                          snmp_poller.RequestGroup(scalars=(sys_descr,))])
+        # encoded requests fit max_pdu_size
+        if_table = ["1.3.6.1.2.1.2.2.1.%s" % i for i in range(1, 23)]
+        system = ["1.3.6.1.2.1.1.%s.0" % i for i in range(1, 9)]
+        groups = planner.plan_requests(if_table + system, max_pdu_size=470)
+        self.assertEqual(sorted(sum([list(group.scalars + group.columns) for group in groups], [])),
+                         sorted(if_table + system))
+        for group in groups:
+            if group.columns:
+                message = snmp_parser.msg_encode(
+                    snmp_poller.MAX_REQID, "public", [oid[:-2] for oid in group.scalars] + list(group.columns),
+                    msg_type="GetBulk", max_repetitions=planner.MAX_HEADER_INTEGER,
+                    non_repeaters=len(group.scalars))
+            else:
+                message = snmp_parser.msg_encode(snmp_poller.MAX_REQID, "public", list(group.scalars),
+                                                 msg_type="Get")
+            self.assertLessEqual(len(message), 470)
+        plans = planner.plan_hosts({"a": [IF_DESCR], "b": [IF_DESCR, IF_DESCR], "c": [OID1]})
+        self.assertIs(plans["a"], plans["b"])
+        self.assertEqual(plans["c"], [snmp_poller.RequestGroup(columns=(OID1,))])
+
+    def test_poll(self):
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        table["1.3.6.1.2.1.1.5.0"] = "router"
+        plans = planner.plan_hosts({"127.0.0.1": [IF_DESCR, IF_IN_OCTETS, snmp_poller.SYS_UPTIME,
+                                                  "1.3.6.1.2.1.1.4.0"]})
+        with FakeAgent(table) as agent, snmp_poller.PollerSession(["127.0.0.1"], "public") as session:
+            res = list(session.poll(plans))
+            # scalars are non-repeaters of GetBulk of table
+            self.assertEqual(len(agent.requests), 1)
+            res_get = list(session.poll([snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME,
+                                                                           "1.3.6.1.2.1.1.5.0"))]))
+        # not existing sysContact.0 is skipped
+        self.assertEqual(collect(res), sorted(IF_TABLE_RESULT + [(snmp_poller.SYS_UPTIME, "", 1000)]))
+        self.assertEqual(collect(res_get), [(snmp_poller.SYS_UPTIME, "", 1000), ("1.3.6.1.2.1.1.5.0", "", b"router")])
+
+    def test_modes(self):
+        table = dict(BIG_IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        group = snmp_poller.RequestGroup(scalars=(snmp_poller.SYS_UPTIME,), columns=(IF_DESCR, IF_IN_OCTETS))
+        with FakeAgent(table) as agent:
+            # columns of mixed group are polled by Gets of known instances
+            with snmp_poller.PollerSession(["127.0.0.1"], "public", incremental=True) as session:
+                res = collect(session.poll([group]))
+                self.assertEqual(len(res), 25)
+                self.assertEqual(res[0], (snmp_poller.SYS_UPTIME, "", 1000))
+                sent = len(agent.requests)
+                self.assertEqual(collect(session.poll([group])), res)
+                self.assertEqual([data[data.index(b"public") + 6] for data in agent.requests[sent:]], [0xa0, 0xa0])
+                self.assertEqual(len(session.targets["127.0.0.1"].instances[group.columns]), 24)
+            # columns of mixed group are walked in segments
+            res_segments = list(snmp_poller.poller(["127.0.0.1"], [group], "public", max_repetitions=2,
+                                                   split_points={group.columns: ["4", "8"]}))
+            self.assertEqual(collect(res_segments), res)
+
+    def test_non_repeaters_decode(self):
+        body = b"".join(snmp_parser.encode_varbind(oid, "Counter64", value) for oid, value in [
+            (snmp_poller.SYS_UPTIME, 5), (OID1 + ".1", 1), (OID2 + ".1", 2), (OID1 + ".2", 3), (OID3 + ".1", 4)])
+        message = snmp_parser.msg_encode(7, "public", b"\x30" + snmp_parser.length_encode(len(body)) + body,
+                                         msg_type="Response")
+        columns = snmp_parser.ResponseColumns(("1.3.6.1.2.1.1.3", OID1, OID2), non_repeaters=1)
+        self.assertEqual(snmp_parser.bulk_response_decode(message, {7: columns}),
+                         (7, 0, 0, [(0, "0", 5), (1, "1", 1), (2, "1", 2), (1, "2", 3)], (True, False, True),
+                          (None, OID1 + ".2", None)))
+        with self.assertRaises(ValueError):
+            snmp_parser.ResponseColumns((OID1,), non_repeaters=2)
+
+
+class TestLabelCache(unittest.TestCase):
+    def test_refresh(self):
+        table = dict(IF_TABLE)
+        table[snmp_poller.SYS_UPTIME] = 1000
+        with FakeAgent(table) as agent, tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "labels.json")
+            cache = labels.LabelCache({"ifDescr": IF_DESCR}, ttl=60, path=path)
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=100), ["127.0.0.1"])
+            self.assertEqual(cache.label("127.0.0.1", "ifDescr", "2"), "eth0")
+            # only indicators are polled
+            sent = len(agent.requests)
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=130), [])
+            self.assertEqual(len(agent.requests) - sent, 1)
+
+            res = list(cache.attach(snmp_poller.poller(["127.0.0.1"], [[IF_IN_OCTETS]], "public")))
+            self.assertEqual(sorted((r.index_part, r.value, r.labels) for r in res),
+                             [("1", 100, {"ifDescr": "lo"}), ("2", 200, {"ifDescr": "eth0"}),
+                              ("3", 300, {"ifDescr": "eth1"})])
+
+            # labels are loaded from file after restart
+            cache = labels.LabelCache({"ifDescr": IF_DESCR}, ttl=60, path=path)
+            self.assertEqual(cache.label("127.0.0.1", "ifDescr", "3"), "eth1")
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=150), [])
+            # ttl
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=160), ["127.0.0.1"])
+
+            # agent is restarted
+            table[snmp_poller.SYS_UPTIME] = 10
+            table[IF_DESCR + ".3"] = "eth3"
+            agent.set_table(table)
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=170), ["127.0.0.1"])
+            self.assertEqual(cache.label("127.0.0.1", "ifDescr", "3"), "eth3")
+
+    def test_attach(self):
+        cache = labels.LabelCache({"ifDescr": IF_DESCR}, columns={IF_IN_OCTETS: ("ifDescr",)})
+        cache.update([snmp_poller.Result("host", IF_DESCR, "1", b"lo", 0, 0)], ["host"], now=100)
+        cache.update([snmp_poller.Result("down", (IF_DESCR,), "", snmp_poller.Timeout(), 0, 0)], ["down"], now=100)
+        self.assertEqual(cache.stale_hosts(["host", "down"], now=110), ["down"])
+        res = list(cache.attach([snmp_poller.Result("host", IF_IN_OCTETS, "1", 1, 0, 0),
+                                 snmp_poller.Result("host", OID1, "1", 1, 0, 0)]))
+        self.assertEqual([r.labels for r in res], [{"ifDescr": "lo"}, {}])
+        self.assertEqual(cache.stale_hosts(["host"], now=110), [])
+        # unknown index
+        list(cache.attach([snmp_poller.Result("host", IF_IN_OCTETS, "2", 1, 0, 0)]))
+        self.assertEqual(cache.stale_hosts(["host"], now=110), ["host"])
+        # index is labeled by walk
+        cache.update([snmp_poller.Result("host", IF_DESCR, "2", b"eth0", 0, 0)], ["host"], now=110)
+        self.assertEqual(cache.unlabeled["host"], set())
+
+    def test_unlabeled_index(self):
+        table = dict(IF_TABLE)
+        table[IF_IN_OCTETS + ".4"] = 400
+        with FakeAgent(table) as agent:
+            cache = labels.LabelCache({"ifDescr": IF_DESCR}, ttl=60, indicators=())
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=100), ["127.0.0.1"])
+            for now in (110, 120, 130):
+                res = list(cache.attach(snmp_poller.poller(["127.0.0.1"], [[IF_IN_OCTETS]], "public")))
+                self.assertEqual(res[-1].labels, {})
+                # the first result with index 4 is checked by walk, then index is known as unlabeled
+                walked = cache.refresh(["127.0.0.1"], "public", now=now)
+                self.assertEqual(walked, ["127.0.0.1"] if now == 110 else [])
+            sent = len(agent.requests)
+            list(cache.attach(snmp_poller.poller(["127.0.0.1"], [[IF_IN_OCTETS]], "public")))
+            self.assertEqual(cache.refresh(["127.0.0.1"], "public", now=140), [])
+            self.assertEqual(len(agent.requests) - sent, 1)
+
+
+@unittest.skipIf(rates.numpy is None, "no numpy")
+class TestRateEngine(unittest.TestCase):
+    def test_update(self):
+        engine = rates.RateEngine(capacity=2)
+        slots = engine.slots_for([("h", "c32", "1"), ("h", "c64", "1"), ("h", "c64", "2")])
+        self.assertEqual(list(slots), [0, 1, 2])
+        bits = [32, 64, 64]
+        res, flags = engine.update(slots, [100, 100, 100], 10.0, bits=bits, uptimes=100)
+        self.assertEqual(list(flags), [rates.FLAG_FIRST] * 3)
+        res, flags = engine.update(slots, [50, 200, 50], 20.0, bits=bits, uptimes=1100)
+        self.assertEqual(list(flags), [rates.FLAG_WRAP, 0, rates.FLAG_RESET])
+        self.assertEqual(list(res[:2]), [(2 ** 32 - 50) / 10, 10.0])
+        self.assertTrue(rates.numpy.isnan(res[2]))
+        res, flags = engine.update(slots, [60, 210, 60], 20.0, bits=bits, uptimes=1100)
+        self.assertEqual(list(flags), [rates.FLAG_TIME] * 3)
+        res, flags = engine.update(slots, [70, 220, 70], 30.0, bits=bits, uptimes=[50, 50, 2100])
+        self.assertEqual(list(flags), [rates.FLAG_RESTART, rates.FLAG_RESTART, 0])
+        self.assertEqual(res[2], 1.0)
+
+    def test_update_results(self):
+        engine = rates.RateEngine()
+        results = [snmp_poller.Result("h", IF_IN_OCTETS, "1", 10, 1.0, 0.1),
+                   snmp_poller.Result("h", (IF_IN_OCTETS,), "", snmp_poller.Timeout(), 1.0, 0.1)]
+        keys, res, flags = engine.update_results(results)
+        self.assertEqual(keys, [("h", IF_IN_OCTETS, "1")])
+        results = [snmp_poller.Result("h", IF_IN_OCTETS, "1", 5, 11.0, 0.1)]
+        keys, res, flags = engine.update_results(results, bits={IF_IN_OCTETS: 32})
+        self.assertEqual(list(flags), [rates.FLAG_WRAP])
+        self.assertEqual(res[0], (2 ** 32 - 5) / 10)
+        engine.forget(keys)
+        keys, res, flags = engine.update_results(results)
+        self.assertEqual(list(flags), [rates.FLAG_FIRST])
+        # width by type of value
+        results = [snmp_poller.Result("h", IF_IN_OCTETS, "1", 1, 21.0, 0.1, snmp_parser.TYPE_COUNTER32)]
+        keys, res, flags = engine.update_results(results)
+        self.assertEqual(list(flags), [rates.FLAG_WRAP])
+
+    def test_layout(self):
+        engine = rates.RateEngine()
+        keys = [("h1", IF_IN_OCTETS, "1"), ("h2", IF_IN_OCTETS, "1"), ("h1", IF_DESCR, "1")]
+        layout = engine.layout_for(keys)
+        self.assertEqual(list(layout[0]), [0, 1, 2])
+        self.assertEqual(list(layout[2]), [0, 1, 0])
+        self.assertEqual(list(layout[4]), [0, 0, 1])
+        self.assertIs(engine.layout_for(list(keys)), layout)
+        self.assertIsNot(engine.layout_for(keys[:2]), layout)
+
+    def test_unknown_uptime(self):
+        engine = rates.RateEngine()
+        results = [snmp_poller.Result("h1", IF_IN_OCTETS, "1", 10, 1.0, 0.1),
+                   snmp_poller.Result("h2", IF_IN_OCTETS, "1", 10, 1.0, 0.1)]
+        engine.update_results(results, uptimes={"h1": 100, "h2": 100})
+        results = [snmp_poller.Result("h1", IF_IN_OCTETS, "1", 20, 11.0, 0.1),
+                   snmp_poller.Result("h2", IF_IN_OCTETS, "1", 20, 11.0, 0.1)]
+        keys, res, flags = engine.update_results(results, uptimes={"h2": 50})
+        self.assertEqual(list(flags), [0, rates.FLAG_RESTART])
+        self.assertEqual(res[0], 1.0)
+        # previous uptime of host is kept while it is unknown
+        results = [snmp_poller.Result("h1", IF_IN_OCTETS, "1", 30, 21.0, 0.1),
+                   snmp_poller.Result("h2", IF_IN_OCTETS, "1", 30, 21.0, 0.1)]
+        keys, res, flags = engine.update_results(results, uptimes={"h1": 50, "h2": 60})
+        self.assertEqual(list(flags), [rates.FLAG_RESTART, 0])
+
+
+class TestAsyncPoller(unittest.TestCase):
+    def apoll(self, *args, **kwargs):
+        async def run():
+            return [res async for res in async_poller.apoller(*args, **kwargs)]
+        return asyncio.run(run())
+
+    def test_walk(self):
+        with FakeAgent(IF_TABLE):
+            res = self.apoll(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", max_repetitions=2)
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+
+    def test_reqid_wrap(self):
+        async def run():
+            engine = async_poller.AsyncPollerEngine("public", 1, 1, 0, "GetBulk", snmp_poller.MAX_REQID, 1, 10)
+            return [engine.next_reqid() for _ in range(2)]
+        self.assertEqual(asyncio.run(run()), [snmp_poller.MAX_REQID, 1])
+
+    def test_converters(self):
+        with FakeAgent(IF_TABLE):
+            res = self.apoll(["127.0.0.1"], [[IF_DESCR]], "public", converters={IF_DESCR: "DisplayString"})
+        self.assertEqual(collect(res), [(IF_DESCR, "1", "lo"), (IF_DESCR, "2", "eth0"), (IF_DESCR, "3", "eth1")])
+
+    def test_timeout(self):
+        with FakeAgent(IF_TABLE, drop=2) as agent:
+            res = self.apoll(["127.0.0.1"], [[IF_DESCR]], "public", timeout=0.05, backoff=1, retry=1)
+        self.assertEqual(len(agent.requests), 2)
+        self.assertEqual(len(res), 1)
+        self.assertIsInstance(res[0].value, snmp_poller.Timeout)
+
+    def test_retry(self):
+        with FakeAgent(IF_TABLE, drop=1):
+            res = self.apoll(["127.0.0.1"], [[IF_DESCR, IF_IN_OCTETS]], "public", timeout=0.05, retry=1)
+        self.assertEqual(collect(res), IF_TABLE_RESULT)
+
+
 if __name__ == "__main__":
     unittest.main()